@@ -1,16 +1,24 @@
+import numpy as np
 import pandas as pd
 import cantools
 import os
+import sys
 from datetime import datetime
 from tkinter import Tk, simpledialog
 from tkinter.filedialog import askopenfilename
 
+# Shared pipeline modules live in optimized_code_can_konwert
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optimized_code_can_konwert'))
+from can_ingest import DECODE_COLUMNS, read_logger_window
+from can_progress import DecodeProgress, run_in_background
+
 # Hide the main Tkinter window
 root = Tk()
 root.withdraw()
 
 # Show a dialog to select the CSV file
-csv_file_path = askopenfilename(title="Select the CSV File", filetypes=[("CSV files", "*.csv")])
+csv_file_path = askopenfilename(title="Select the CSV File", filetypes=[("CSV files", "*.csv *.csv.gz *.csv.zst *.csv.xz"),
+                                                                        ("CAN traces", "*.blf *.asc *.trc")])
 if not csv_file_path:
     raise FileNotFoundError("No CSV file selected")
 
@@ -22,17 +30,13 @@ if not dbc_file_path:
 # Load the DBC file
 db = cantools.database.load_file(dbc_file_path)
 
-# Read the CSV file and skip the first two rows which seem to contain metadata
-df_csv = pd.read_csv(csv_file_path, delimiter=';', skiprows=2)
-
-# Manually rename the columns based on their positions
-df_csv.columns = ['Index', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
+# Prompt the user to enter the start and end timestamps
+start_timestamp = simpledialog.askstring("Enter Start Timestamp", "Enter the start timestamp (YYYY-MM-DD HH:MM:SS)")
+end_timestamp = simpledialog.askstring("Enter End Timestamp", "Enter the end timestamp (YYYY-MM-DD HH:MM:SS)")
 
-# Check if necessary columns are present
-if 'Frame ID' not in df_csv.columns or 'Data' not in df_csv.columns:
-    print("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
-    print("Current columns in the CSV file:", df_csv.columns)
-    raise KeyError("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+# Convert the timestamps to datetime objects
+start_datetime = datetime.strptime(start_timestamp, "%Y-%m-%d %H:%M:%S")
+end_datetime = datetime.strptime(end_timestamp, "%Y-%m-%d %H:%M:%S")
 
 # Function to decode CAN message using cantools
 def decode_can_message(row):
@@ -86,8 +90,39 @@ def decode_can_message(row):
             'temprature': 'null'
         }
 
-# Apply the decoding function to each row in the CSV file
-decoded_data = df_csv.apply(lambda row: decode_can_message(row), axis=1)
+# Function to read and decode the window chunk by chunk in the background worker; progress is the share of the
+# window covered so far, and a cancel keeps the chunks decoded until then
+def decode_window(progress):
+    time_parts = []
+    decoded_parts = []
+    window_ns = max(pd.Timestamp(end_datetime).value - pd.Timestamp(start_datetime).value, 1)
+    # Read only the frames between the start and end timestamps (timestamp, frame ID and payload columns); seekable
+    # compressed logs decompress only the blocks overlapping the window
+    for timestamps_ns, df_chunk in read_logger_window(csv_file_path, start_datetime, end_datetime,
+                                                      columns=DECODE_COLUMNS):
+        # Check if necessary columns are present
+        if 'Frame ID' not in df_chunk.columns or 'Data' not in df_chunk.columns:
+            print("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+            print("Current columns in the CSV file:", df_chunk.columns)
+            raise KeyError("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+
+        # Apply the decoding function to each row of the chunk
+        decoded_parts.append(df_chunk.apply(lambda row: decode_can_message(row), axis=1))
+        time_parts.append(timestamps_ns)
+        progress.update(len(df_chunk), (timestamps_ns[-1] - pd.Timestamp(start_datetime).value) / window_ns)
+        if progress.cancelled:
+            print(f"Cancelled after {progress.rows} rows, writing the partial output")
+            break
+    return time_parts, decoded_parts
+
+# Decode in a background worker while a progress window shows rows, throughput and ETA and offers Cancel
+progress = DecodeProgress()
+time_parts, decoded_parts = run_in_background(decode_window, progress,
+                                              f"Decoding {os.path.basename(csv_file_path)} window", root)
+if not time_parts:
+    raise ValueError(f"No frames between {start_datetime} and {end_datetime} in {csv_file_path}")
+frame_times_ns = np.concatenate(time_parts)
+decoded_data = pd.concat(decoded_parts, ignore_index=True)
 
 # Convert the decoded data to a DataFrame and ensure proper alignment by using .fillna()
 decoded_df = pd.json_normalize(decoded_data)
@@ -99,17 +134,9 @@ decoded_df = decoded_df.fillna('null')
 columns_to_include = ['Battery_current', 'Battery_Voltage', 'Current_Control_status', 'temprature']
 final_df = decoded_df[columns_to_include]
 
-# Prompt the user to enter the start and end timestamps
-start_timestamp = simpledialog.askstring("Enter Start Timestamp", "Enter the start timestamp (YYYY-MM-DD HH:MM:SS)")
-end_timestamp = simpledialog.askstring("Enter End Timestamp", "Enter the end timestamp (YYYY-MM-DD HH:MM:SS)")
-
-# Convert the timestamps to datetime objects
-start_datetime = datetime.strptime(start_timestamp, "%Y-%m-%d %H:%M:%S")
-end_datetime = datetime.strptime(end_timestamp, "%Y-%m-%d %H:%M:%S")
-
-# Filter data between start and end timestamps
-final_df['Timestamp'] = pd.to_datetime(df_csv['Timestamp'])
-final_df = final_df[(final_df['Timestamp'] >= start_datetime) & (final_df['Timestamp'] <= end_datetime)]
+# Attach the frame timestamps (int64 epoch nanoseconds) to the decoded window
+final_df = final_df.copy()
+final_df['Timestamp'] = pd.to_datetime(frame_times_ns)
 
 # Extract the base name of the CSV file
 csv_base_name = os.path.basename(csv_file_path).split('.')[0]
@@ -130,4 +157,5 @@ final_df.to_csv(output_csv_file_path, index=False)
 print(final_df.head())
 
 # Confirm the output file path
-print(f"Data saved to: {output_csv_file_path}")
+print(f"Data saved to: {output_csv_file_path}"
+      f"{f' (partial: cancelled after {len(final_df)} rows)' if progress.cancelled else ''}")
@@ -1,28 +1,34 @@
 import pandas as pd
 import cantools
 import os
+import sys
 from datetime import datetime
 
+# Shared pipeline modules live in optimized_code_can_konwert
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optimized_code_can_konwert'))
+from can_timestamps import logger_timestamps_ns
+from can_delta import delta_encode
+from can_ingest import read_logger_csv
+from can_decode import frame_ids_from_text
+from can_zonemap import build_zonemap, write_zonemap
+
+# 'full' writes every frame with all decoded columns, 'delta' writes a signal sample only when its value changes
+output_mode = 'full'
+
+# In 'delta' mode, changes smaller than these deadbands are not written for the listed analog signals
+deadbands = {'Battery_Voltage': 0.1}
+
 # Load the DBC file
 dbc_file_path = "E:\\KONWERT\\CAN_DBC_FILES\\DBC File for candata\\SEG_Standard_DBC_02.06.23.dbc"
 db = cantools.database.load_file(dbc_file_path)
 
-# Read the CSV file and skip the first two rows which seem to contain metadata
+# Read the CSV file with the fixed logger schema (metadata rows skipped, 'Id' read as 'Frame ID')
 csv_file_path = "E:\\KONWERT\\CAN\\candatacsv\\trail3.csv"
-df_csv = pd.read_csv(csv_file_path, delimiter=';', skiprows=2)
+df_csv = read_logger_csv(csv_file_path)
 
-# Print the actual column names to ensure correct column names
+# Print the column names to ensure correct column names
 print("Columns in CSV file:", df_csv.columns)
 
-# Rename columns to match expected names
-df_csv = df_csv.rename(columns={
-    'Id': 'Frame ID',        # Rename 'Id' to 'Frame ID'
-    'Data': 'Data'           # The 'Data' column seems to be correctly named
-})
-
-# Print the actual column names after renaming
-print("Columns after renaming:", df_csv.columns)
-
 # Function to decode CAN message using cantools
 def decode_can_message(row):
     try:
@@ -50,17 +56,26 @@ decoded_data = df_csv.apply(lambda row: decode_can_message(row), axis=1)
 # Convert the decoded data to a DataFrame
 decoded_df = pd.json_normalize(decoded_data)
 
-# Combine the original CSV data with the decoded data
-df_combined = pd.concat([df_csv, decoded_df], axis=1)
-
 # Generate a unique file name using the current timestamp
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-unique_file_name = f"gen_can_data_{timestamp}.csv"
+
+if output_mode == 'delta':
+    # Keep only the samples where a signal changes; read them back with can_delta.held_values
+    df_combined = delta_encode(logger_timestamps_ns(df_csv), decoded_df, deadbands)
+    unique_file_name = f"gen_can_delta_{timestamp}.csv"
+else:
+    # Combine the original CSV data with the decoded data
+    df_combined = pd.concat([df_csv, decoded_df], axis=1)
+    unique_file_name = f"gen_can_data_{timestamp}.csv"
 output_csv_file_path = os.path.join("E:\\KONWERT\\CAN\\Can_extracted_csv", unique_file_name)
 
 # Save the combined data to a new CSV file
 df_combined.to_csv(output_csv_file_path, index=False)
 
+# Write the zone-map sidecar (time range, frame IDs, signal min/max) so later queries can skip this log unopened
+write_zonemap(build_zonemap(logger_timestamps_ns(df_csv), frame_ids_from_text(df_csv['Frame ID']), decoded_df,
+                            csv_file_path, output_csv_file_path), os.path.splitext(output_csv_file_path)[0])
+
 # Display the combined dataframe
 print(df_combined.head())
 
@@ -1,78 +1,110 @@
 import pandas as pd
 import cantools
 import os
+import sys
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename
+from tkinter.messagebox import askyesno
+
+# Shared pipeline modules live in optimized_code_can_konwert
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optimized_code_can_konwert'))
+from can_excel import write_excel_streaming
+from can_decode import dbc_prefixes, build_prefixed_routing_table, decode_prefixed, frame_ids_from_text
+from can_ingest import read_logger_csv
+from can_timestamps import logger_timestamps_ns
+from can_zonemap import build_zonemap, write_zonemap
+from can_progress import DecodeProgress, estimate_log_rows, run_in_background
+from can_dbc_catalog import DEFAULT_DBC_DIRECTORY, select_dbcs_for_log
 
 # Hide the main Tkinter window
 root = Tk()
 root.withdraw()
 
 # Show a dialog to select the CSV file
-csv_file_path = askopenfilename(title="Select the CSV File", filetypes=[("CSV files", "*.csv")])
+csv_file_path = askopenfilename(title="Select the CSV File", filetypes=[("CSV files", "*.csv *.csv.gz *.csv.zst *.csv.xz"),
+                                                                        ("CAN traces", "*.blf *.asc *.trc")])
 if not csv_file_path:
     raise FileNotFoundError("No CSV file selected")
 
-# Show a dialog to select the first DBC file
-dbc_file_path_1 = askopenfilename(title="Select the First DBC File", filetypes=[("DBC files", "*.dbc")])
-if not dbc_file_path_1:
-    raise FileNotFoundError("No DBC file selected")
-
-# Show a dialog to select the second DBC file
-dbc_file_path_2 = askopenfilename(title="Select the Second DBC File", filetypes=[("DBC files", "*.dbc")])
-if not dbc_file_path_2:
-    raise FileNotFoundError("No DBC file selected")
+# DBC library searched first: when it is reachable, the smallest set of its DBCs defining the frame IDs seen in a
+# sample of the log is suggested (catalog cached in the directory) and used once confirmed; otherwise, or when the
+# suggestion is declined, dialogs ask for the two DBC files
+dbc_directory = DEFAULT_DBC_DIRECTORY
+
+dbc_file_paths = []
+if dbc_directory and os.path.isdir(dbc_directory):
+    dbc_file_paths, unknown_ids = select_dbcs_for_log(csv_file_path, dbc_directory)
+    print(f"DBCs suggested from {dbc_directory}: {dbc_file_paths}")
+    if unknown_ids:
+        print(f"Frame IDs in no DBC of the library: {[f'{frame_id:08X}' for frame_id in unknown_ids]}")
+    if dbc_file_paths:
+        # Ask before using the suggestion, the dialogs below pick other files
+        question = "Decode the log with these DBC files from the library?\n\n" + "\n".join(dbc_file_paths)
+        if unknown_ids:
+            question += f"\n\n{len(unknown_ids)} frame ID(s) of the log are in no DBC of the library"
+        if not askyesno("DBC files from the library", question):
+            dbc_file_paths = []
+
+if not dbc_file_paths:
+    # Show a dialog to select the first DBC file
+    dbc_file_path_1 = askopenfilename(title="Select the First DBC File", filetypes=[("DBC files", "*.dbc")])
+    if not dbc_file_path_1:
+        raise FileNotFoundError("No DBC file selected")
+
+    # Show a dialog to select the second DBC file
+    dbc_file_path_2 = askopenfilename(title="Select the Second DBC File", filetypes=[("DBC files", "*.dbc")])
+    if not dbc_file_path_2:
+        raise FileNotFoundError("No DBC file selected")
+    dbc_file_paths = [dbc_file_path_1, dbc_file_path_2]
 
 # Load the DBC files
-db1 = cantools.database.load_file(dbc_file_path_1)
-db2 = cantools.database.load_file(dbc_file_path_2)
-
-# Read the CSV file and skip the first two rows which seem to contain metadata
-df_csv = pd.read_csv(csv_file_path, delimiter=';', skiprows=2)
-
-# Manually rename the columns based on their positions
-df_csv.columns = ['Index', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
-
-# Check if necessary columns are present
-if 'Frame ID' not in df_csv.columns or 'Data' not in df_csv.columns:
-    print("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
-    print("Current columns in the CSV file:", df_csv.columns)
-    raise KeyError("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
-
-# Function to decode CAN message using cantools
-def decode_can_message(row, db):
-    try:
-        message_id = int(row['Frame ID'], 16)
-        if message_id in [msg.frame_id for msg in db.messages]:
-            message = db.get_message_by_frame_id(message_id)
-            data = bytes.fromhex(row['Data'].replace(' ', ''))
-            decoded = message.decode(data)
-            return decoded
-        else:
-            return {}
-    except ValueError as ve:
-        print(f"ValueError: {ve}, row: {row}")
-        return {}
-    except KeyError as ke:
-        print(f"KeyError: {ke}, row: {row}")
-        return {}
-    except Exception as e:
-        print(f"Error decoding row {row.get('Frame ID', 'Unknown')} : {e}, row: {row}")
-        return {}
-
-# Apply the decoding function to each row in the CSV file using both DBC files
-decoded_data_1 = df_csv.apply(lambda row: decode_can_message(row, db1), axis=1)
-decoded_data_2 = df_csv.apply(lambda row: decode_can_message(row, db2), axis=1)
-
-# Convert the decoded data to DataFrames and ensure proper alignment by using .fillna()
-decoded_df_1 = pd.json_normalize(decoded_data_1).fillna('null')
-decoded_df_2 = pd.json_normalize(decoded_data_2).fillna('null')
+dbs = [cantools.database.load_file(dbc_file_path) for dbc_file_path in dbc_file_paths]
+
+# Frame IDs defined by both DBCs are decoded into the dbc1_ and the dbc2_ columns ('first', 'last' or 'error'
+# keep only one DBC's message or refuse the combination)
+dbc_conflict_rule = 'all'
+
+# Merge the DBCs into one routing table; every signal column is prefixed with dbc1_ / dbc2_ so names never collide
+prefixes = dbc_prefixes(len(dbs))
+routing_table = build_prefixed_routing_table(dbs, prefixes, dbc_conflict_rule)
+
+# Rows read and decoded per chunk, so progress can be reported and a cancel takes effect between chunks
+decode_chunk_rows = 100000
+
+# Function to read and decode the log chunk by chunk in the background worker; returns the raw and decoded chunks
+# done so far, which are all written out even when the run is cancelled
+def decode_log(progress):
+    csv_parts = []
+    decoded_parts = []
+    # Read the CSV file with the fixed logger schema (metadata rows skipped, columns named by position)
+    for df_chunk in read_logger_csv(csv_file_path, chunksize=decode_chunk_rows):
+        # Check if necessary columns are present
+        if 'Frame ID' not in df_chunk.columns or 'Data' not in df_chunk.columns:
+            print("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+            print("Current columns in the CSV file:", df_chunk.columns)
+            raise KeyError("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+
+        # Decode every frame in a single pass against both DBC files; missing values stay NaN so numbers remain
+        # numeric cells in Excel
+        decoded_parts.append(decode_prefixed(df_chunk, routing_table, prefixes, decode_choices=True))
+        csv_parts.append(df_chunk)
+        progress.update(len(df_chunk))
+        if progress.cancelled:
+            print(f"Cancelled after {progress.rows} rows, writing the partial output")
+            break
+    return csv_parts, decoded_parts
+
+# Decode in a background worker while a progress window shows rows, throughput and ETA and offers Cancel
+progress = DecodeProgress(estimate_log_rows(csv_file_path))
+csv_parts, decoded_parts = run_in_background(decode_log, progress, f"Decoding {os.path.basename(csv_file_path)}",
+                                             root)
+if not csv_parts:
+    raise ValueError(f"No frames in {csv_file_path}")
+df_csv = pd.concat(csv_parts)
+decoded_df = pd.concat(decoded_parts)
 
 # Combine the original CSV data with the decoded data from both DBC files, aligning columns correctly
-df_combined = pd.concat([df_csv.reset_index(drop=True), decoded_df_1.reset_index(drop=True), decoded_df_2.reset_index(drop=True)], axis=1)
-
-# Ensure all columns from both original and decoded data are present
-df_combined = df_combined.fillna('null')
+df_combined = pd.concat([df_csv.reset_index(drop=True), decoded_df.reset_index(drop=True)], axis=1)
 
 # Extract the base name of the CSV file
 csv_base_name = os.path.basename(csv_file_path).split('.')[0]
@@ -86,11 +118,16 @@ output_directory = r"E:\KONWERT\CAN\Can_extracted_csv"
 # Combine the directory path and the file name
 output_excel_file_path = os.path.join(output_directory, output_file_name)
 
-# Save the combined data to a new Excel file
-df_combined.to_excel(output_excel_file_path, index=False)
+# Stream the combined data to a new Excel file (constant memory, extra sheets past the row limit)
+write_excel_streaming(df_combined, output_excel_file_path)
+
+# Write the zone-map sidecar (time range, frame IDs, signal min/max) so later queries can skip this log unopened
+write_zonemap(build_zonemap(logger_timestamps_ns(df_csv), frame_ids_from_text(df_csv['Frame ID']), decoded_df,
+                            csv_file_path, output_excel_file_path), os.path.splitext(output_excel_file_path)[0])
 
 # Display the combined dataframe
 print(df_combined.head())
 
 # Confirm the output file path
-print(f"Data saved to: {output_excel_file_path}")
+print(f"Data saved to: {output_excel_file_path}"
+      f"{f' (partial: cancelled after {len(df_csv)} rows)' if progress.cancelled else ''}")
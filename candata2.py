@@ -1,16 +1,42 @@
 import pandas as pd
 import cantools
 import os
+import sys
 from datetime import datetime
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename
 
+# Shared pipeline modules live in optimized_code_can_konwert
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optimized_code_can_konwert'))
+from can_timestamps import logger_timestamps_ns
+from can_delta import DeltaEncoder, combine_delta_parts
+from can_excel import StreamingExcelWriter
+from can_ingest import read_logger_csv
+from can_decode import frame_ids_from_text
+from can_zonemap import ZoneMapBuilder, write_zonemap
+from can_memory import ChunkScheduler, write_run_report
+from can_busstats import BusStatsAccumulator, dbc_frame_info, frame_lengths, write_busstats
+from can_alerts import AlertEngine, format_event, write_events
+from can_progress import DecodeProgress, estimate_log_rows, run_in_background
+from can_preview import preview_log, print_preview
+from can_pipeline import DEFAULT_DECODE_WORKERS, StagedPipeline, pipeline_chunks_in_flight, print_pipeline_report
+
+# 'full' writes every frame to Excel, 'delta' writes a CSV with a signal sample only when its value changes
+output_mode = 'full'
+
+# True stops after the sampled preview (DBC match, message rates, sample values) without decoding the whole log
+preview_only = False
+
+# In 'delta' mode, changes smaller than these deadbands are not written for the listed analog signals
+deadbands = {'Battery_Voltage': 0.1}
+
 # Hide the main Tkinter window
 root = Tk()
 root.withdraw()
 
 # Show a dialog to select the CSV file
-csv_file_path = askopenfilename(title="Select the CSV File", filetypes=[("CSV files", "*.csv")])
+csv_file_path = askopenfilename(title="Select the CSV File", filetypes=[("CSV files", "*.csv *.csv.gz *.csv.zst *.csv.xz"),
+                                                                        ("CAN traces", "*.blf *.asc *.trc")])
 if not csv_file_path:
     raise FileNotFoundError("No CSV file selected")
 
@@ -32,16 +58,19 @@ for msg in db.messages:
     for signal in msg.signals:
         print(f"  Signal: {signal.name}")
 
-# Read the CSV file
-df_csv = pd.read_csv(csv_file_path, skiprows=2, delimiter=';')
+# Decode a sample of the log first (head plus strided blocks), so a DBC that does not match shows up in a second
+print_preview(preview_log(csv_file_path, [db]))
+if preview_only:
+    sys.exit(0)
 
-# Print the actual column names
-print("Columns in CSV file:", df_csv.columns)
+# Signal columns of the output in DBC order, so every chunk is written with the same columns
+signal_names = list(dict.fromkeys(signal.name for msg in db.messages for signal in msg.signals))
 
-# Rename columns to match expected names
-df_csv.columns = ['Nr', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
+# Memory the chunks being read, decoded and written may use; the rows per chunk are sized to it at runtime
+memory_budget_mb = 1024
 
-print("Columns after renaming:", df_csv.columns)
+# Threads decoding chunks while the next chunk is read and the previous one is written
+decode_workers = DEFAULT_DECODE_WORKERS
 
 # Function to decode CAN message using cantools
 def decode_can_message(row):
@@ -64,35 +93,112 @@ def decode_can_message(row):
         print(f"Error decoding row {row.get('Frame ID', 'Unknown')} : {e}, row: {row}")
         return {}
 
-# Apply the decoding function to each row in the CSV file
-decoded_data = df_csv.apply(lambda row: decode_can_message(row), axis=1)
-
-# Convert the decoded data to a DataFrame
-decoded_df = pd.json_normalize(decoded_data)
-
-# Combine the original CSV data with the decoded data
-df_combined = pd.concat([df_csv, decoded_df], axis=1)
-
 # Define the output directory and file name
 output_dir = "E:\\KONWERT\\CAN\\Can_extracted_csv"
 os.makedirs(output_dir, exist_ok=True)
-
-# Check if the number of rows exceeds the maximum Excel limit
-max_rows_per_sheet = 1048576
 output_excel_file_path = os.path.join(output_dir, f"decoded_can_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
 
-# Write to Excel with multiple sheets if necessary
-with pd.ExcelWriter(output_excel_file_path, engine='xlsxwriter') as writer:
-    if len(df_combined) > max_rows_per_sheet:
-        num_parts = (len(df_combined) // max_rows_per_sheet) + 1
-        for i in range(num_parts):
-            start_row = i * max_rows_per_sheet
-            end_row = start_row + max_rows_per_sheet
-            part_df = df_combined.iloc[start_row:end_row]
-            part_df.to_excel(writer, sheet_name=f'Part_{i+1}', index=False)
-            print(f"Saved part {i+1} to sheet Part_{i+1}")
-    else:
-        df_combined.to_excel(writer, index=False)
-        print(f"Decoded CAN data saved to {output_excel_file_path}")
-
-print(f"Decoded CAN data saved to {output_excel_file_path}")
+# 'full' mode streams every decoded chunk into the workbook (constant memory, new Part_N sheet at the row limit);
+# 'delta' mode feeds the chunks to the change-only encoder, which keeps the output far below the Excel row limit
+excel_writer = StreamingExcelWriter(output_excel_file_path, sheet_prefix='Part_') if output_mode == 'full' else None
+delta_encoder = DeltaEncoder(deadbands)
+delta_parts = []
+# Zone-map sidecar (time range, frame IDs, signal min/max) built from the same chunks for sidecar-based log selection
+zonemap_builder = ZoneMapBuilder()
+# Bus health (per-ID rate, period, gaps, dropped frames against the DBC cycle times, bus load) from the same chunks
+bus_stats = BusStatsAccumulator(dbc_frame_info([db]))
+# Fault/Warning and torque limit events, reported as each one closes instead of after the whole log
+alert_engine = AlertEngine()
+# Chunk sizes start from the DBC signal count and follow the measured footprint of every decoded chunk
+chunk_scheduler = ChunkScheduler(memory_budget_mb * 2**20, signal_count=len(signal_names),
+                                 chunks_in_flight=pipeline_chunks_in_flight(decode_workers))
+
+# Function to decode one chunk (the decode workers of the pipeline)
+def decode_chunk(df_csv):
+    if df_csv.index[0] == 0:
+        # Print the actual column names
+        print("Columns in CSV file:", df_csv.columns)
+
+    # Rename columns to match expected names
+    df_csv.columns = ['Nr', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
+
+    if df_csv.index[0] == 0:
+        print("Columns after renaming:", df_csv.columns)
+
+    # Apply the decoding function to each row of the chunk
+    decoded_data = df_csv.apply(lambda row: decode_can_message(row), axis=1)
+
+    # Convert the decoded data to a DataFrame aligned with the rows of the chunk
+    decoded_df = pd.json_normalize(list(decoded_data)).reindex(columns=signal_names).set_axis(df_csv.index)
+    return df_csv, decoded_data, decoded_df
+
+# Function to decode the log in the background worker: a pipeline reads the next chunk while the current one decodes
+# and the previous one is written. A cancel stops the reading, so the output, sidecars and reports below cover
+# exactly the rows decoded so far
+def decode_log(progress):
+    state = {'previous_ns': None, 'total_rows': 0}
+
+    # Function to feed one decoded chunk, in log order, to the sidecars and the output (the writer thread)
+    def write_chunk(result):
+        df_csv, decoded_data, decoded_df = result
+        frame_times_ns = logger_timestamps_ns(df_csv, previous_ns=state['previous_ns'])
+        state['previous_ns'] = frame_times_ns[-1]
+        frame_ids = frame_ids_from_text(df_csv['Frame ID'])
+        zonemap_builder.update(frame_times_ns, frame_ids, decoded_df)
+        bus_stats.update(frame_times_ns, frame_ids, frame_lengths(df_csv))
+        for event in alert_engine.update(frame_times_ns, decoded_df):
+            print(format_event(event))
+        if output_mode == 'delta':
+            delta_parts.append(delta_encoder.encode(frame_times_ns, decoded_df))
+        else:
+            # Combine the original CSV data with the decoded data and stream it to the workbook
+            excel_writer.write_frame(pd.concat([df_csv, decoded_df], axis=1))
+        chunk_scheduler.observe(df_csv, decoded_data, decoded_df)
+        state['total_rows'] += len(df_csv)
+        progress.update(len(df_csv))
+        print(f"Decoded {state['total_rows']} rows (next chunk {chunk_scheduler.next_rows()} rows)")
+
+    # Read the CSV file in chunks with the fixed logger schema
+    pipeline = StagedPipeline(decode_chunk, write_chunk, decode_workers)
+    pipeline_report = pipeline.run(read_logger_csv(csv_file_path, chunksize=chunk_scheduler),
+                                   stop=lambda: progress.cancelled)
+    if progress.cancelled:
+        print(f"Cancelled after {state['total_rows']} rows, writing the partial output")
+    print_pipeline_report(pipeline_report)
+    return state['total_rows'], pipeline_report
+
+# Decode in a background worker while a progress window shows rows, throughput and ETA and offers Cancel
+progress = DecodeProgress(estimate_log_rows(csv_file_path))
+total_rows, pipeline_report = run_in_background(decode_log, progress, f"Decoding {os.path.basename(csv_file_path)}",
+                                                root)
+
+for event in alert_engine.finish():
+    print(format_event(event))
+
+if output_mode == 'delta':
+    df_delta = combine_delta_parts(delta_parts + [delta_encoder.finish()])
+    output_delta_file_path = os.path.join(output_dir, f"decoded_can_delta_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    df_delta.to_csv(output_delta_file_path, index=False)
+    write_zonemap(zonemap_builder.finish(csv_file_path, output_delta_file_path), os.path.splitext(output_delta_file_path)[0])
+    write_run_report({**chunk_scheduler.report(), **progress.report(), 'pipeline': pipeline_report},
+                     os.path.splitext(output_delta_file_path)[0])
+    write_busstats(*bus_stats.finish(), os.path.splitext(output_delta_file_path)[0])
+    write_events(alert_engine, os.path.splitext(output_delta_file_path)[0])
+    print(f"{len(df_delta)} signal changes (from {total_rows} frames{', cancelled' if progress.cancelled else ''}) "
+          f"saved to {output_delta_file_path}")
+    sys.exit(0)
+
+sheet_count = excel_writer.close()
+write_zonemap(zonemap_builder.finish(csv_file_path, output_excel_file_path), os.path.splitext(output_excel_file_path)[0])
+# Record the chosen chunk sizes, footprints and throughput of the run
+write_run_report({**chunk_scheduler.report(), **progress.report(), 'pipeline': pipeline_report},
+                 os.path.splitext(output_excel_file_path)[0])
+# Bus health report of the log
+bus_summary, bus_table = bus_stats.finish()
+write_busstats(bus_summary, bus_table, os.path.splitext(output_excel_file_path)[0])
+print(f"Bus load {bus_summary['bus_load'] or 0:.1%}, {bus_summary['dropped_frames']} dropped frame(s) in "
+      f"{bus_summary['frame_ids_with_drops']}")
+# Events of the whole log (start/end per rule) next to the output
+write_events(alert_engine, os.path.splitext(output_excel_file_path)[0])
+print(f"Decoded CAN data saved to {output_excel_file_path} ({sheet_count} sheet(s)"
+      f"{f', partial: cancelled after {total_rows} rows' if progress.cancelled else ''})")
@@ -0,0 +1,249 @@
+import argparse
+import json
+import math
+import operator
+import os
+import numpy as np
+import pandas as pd
+from can_analytics import PHASE_TO_DC_CURRENT, MOTOR_EFFICIENCY, MAX_TORQUE_NM
+from can_compressed import uncompressed_path
+from can_decode import load_dbc_files, dbc_prefixes, build_prefixed_routing_table, decode_prefixed
+from can_decode import numeric_signal_values
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns
+from can_zonemap import DBC_PREFIX_PATTERN
+
+# Comparisons a rule can use
+RULE_OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq,
+                  '!=': operator.ne}
+
+# Rule types: 'threshold' reports every interval where the condition holds, 'rising_edge' every moment it starts to
+# hold, 'duration' the intervals where it holds for at least duration_s
+RULE_TYPES = ['threshold', 'rising_edge', 'duration']
+
+# Default rules: the battery Fault/Warning signals of 19FF01DA and the 35 Nm torque limit of clubdata_charts.py
+DEFAULT_RULES = [
+    {'name': 'battery_fault', 'signal': 'Fault', 'type': 'threshold', 'op': '!=', 'value': 0, 'severity': 'fault'},
+    {'name': 'battery_warning', 'signal': 'Warning', 'type': 'rising_edge', 'op': '!=', 'value': 0,
+     'severity': 'warning'},
+    {'name': 'torque_over_limit', 'signal': 'torque', 'type': 'duration', 'op': '>', 'value': MAX_TORQUE_NM,
+     'duration_s': 1.0, 'severity': 'warning'},
+]
+
+# Signals computed from held values of decoded signals before the rules run (names without DBC prefix)
+TORQUE_SOURCE_SIGNALS = ['MC_MOTOR_SPEED', 'MC_PH_CURR', 'MC_DC_VOLT']
+
+# Columns of the event records
+EVENT_COLUMNS = ['rule', 'signal', 'type', 'severity', 'start', 'end', 'duration_s', 'peak', 'open']
+
+
+# Function to load rules from a JSON file (a list of rule dicts like DEFAULT_RULES) and check them
+def load_rules(rules_file_path=None):
+    if rules_file_path is None:
+        rules = DEFAULT_RULES
+    else:
+        with open(rules_file_path) as rules_file:
+            rules = json.load(rules_file)
+    for rule in rules:
+        if rule.get('type') not in RULE_TYPES:
+            raise ValueError(f"Rule {rule.get('name')!r}: unknown type {rule.get('type')!r}, expected one of {RULE_TYPES}")
+        if rule.get('op') not in RULE_OPERATORS:
+            raise ValueError(f"Rule {rule.get('name')!r}: unknown operator {rule.get('op')!r}, expected one of "
+                             f"{list(RULE_OPERATORS)}")
+        if rule['type'] == 'duration' and not rule.get('duration_s'):
+            raise ValueError(f"Rule {rule.get('name')!r}: a duration rule needs duration_s")
+    return rules
+
+
+# Function to find the decoded columns a rule signal refers to, with or without their dbc<N>_ prefix
+def matching_columns(columns, signal):
+    return [column for column in columns if column == signal or DBC_PREFIX_PATTERN.sub('', column) == signal]
+
+
+# State of one rule on one column between chunks: whether the condition held at the last sample and the interval
+# that is still open (start time, peak value)
+class RuleState:
+    def __init__(self, rule, column):
+        self.rule = rule
+        self.column = column
+        self.compare = RULE_OPERATORS[rule['op']]
+        # The peak of an interval is the value furthest past the threshold
+        self.peak = np.fmin if rule['op'] in ('<', '<=') else np.fmax
+        self.active = False
+        self.start_ns = None
+        self.peak_value = np.nan
+        self.last_ns = None
+
+    def event(self, start_ns, end_ns, peak, is_open=False):
+        return {'rule': self.rule['name'], 'signal': self.column, 'type': self.rule['type'],
+                'severity': self.rule.get('severity', ''), 'start': int(start_ns), 'end': int(end_ns),
+                'duration_s': (end_ns - start_ns) / NS_PER_SECOND, 'peak': float(peak), 'open': is_open}
+
+    def keep(self, event):
+        if self.rule['type'] != 'duration':
+            return True
+        return event['duration_s'] >= self.rule['duration_s']
+
+    # Function to evaluate the rule on the samples of one chunk (times and values where the column has a value);
+    # returns the events that closed in this chunk
+    def evaluate(self, timestamps_ns, values):
+        if len(values) == 0:
+            return []
+        with np.errstate(invalid='ignore'):
+            holds = self.compare(values, self.rule['value']) & ~np.isnan(values)
+        before = np.concatenate([[self.active], holds[:-1]])
+        starts = np.flatnonzero(holds & ~before)
+        ends = np.flatnonzero(~holds & before)
+        self.last_ns = timestamps_ns[-1]
+
+        if self.rule['type'] == 'rising_edge':
+            self.active = bool(holds[-1])
+            return [self.event(timestamps_ns[i], timestamps_ns[i], values[i]) for i in starts]
+
+        # Peak of every run of samples where the condition holds (runs are contiguous in the holding samples)
+        held = np.flatnonzero(holds)
+        run_starts = np.flatnonzero(np.diff(np.concatenate([[-2], held])) != 1)
+        run_peaks = self.peak.reduceat(values[held], run_starts) if len(held) else np.array([])
+        # A run at the very start of the chunk continues the interval left open by the previous chunk
+        continues = self.active and len(held) and held[0] == 0
+        events = []
+        run = 0
+        if self.active:
+            peak = self.peak(self.peak_value, run_peaks[0]) if continues else self.peak_value
+            run = 1 if continues else 0
+            if len(ends):
+                events.append(self.event(self.start_ns, timestamps_ns[ends[0]], peak))
+                ends = ends[1:]
+            else:
+                self.peak_value = peak
+        for position, start in enumerate(starts):
+            peak = run_peaks[run + position]
+            if position < len(ends):
+                events.append(self.event(timestamps_ns[start], timestamps_ns[ends[position]], peak))
+            else:
+                self.start_ns = timestamps_ns[start]
+                self.peak_value = peak
+        self.active = bool(holds[-1])
+        return [event for event in events if self.keep(event)]
+
+    # Function to close the interval still open at the end of the log
+    def finish(self):
+        if self.rule['type'] == 'rising_edge' or not self.active:
+            return []
+        event = self.event(self.start_ns, self.last_ns, self.peak_value, is_open=True)
+        self.active = False
+        return [event] if self.keep(event) else []
+
+
+# Rule engine over the decoded stream: fed chunk by chunk (or batch by batch in live mode) with the frame times and
+# the decoded signals, it returns the events that closed in each chunk, so nothing but the open intervals is kept
+class AlertEngine:
+    def __init__(self, rules=None):
+        self.rules = load_rules() if rules is None else rules
+        self.states = {}
+        self.held = None
+        self.events = []
+
+    # Torque (Nm) from the held motor speed, phase current and DC voltage, as in clubdata_charts.py; only where the
+    # motor turns and one of the sources was updated
+    def add_derived_signals(self, decoded_df):
+        sources = [(matching_columns(decoded_df.columns, signal) or [None])[0] for signal in TORQUE_SOURCE_SIGNALS]
+        if None in sources:
+            return decoded_df
+        signals = decoded_df[sources].apply(numeric_signal_values)
+        updated = signals.notna().any(axis=1).to_numpy()
+        if self.held is not None:
+            signals = pd.concat([self.held, signals]).ffill().iloc[1:]
+        else:
+            signals = signals.ffill()
+        self.held = signals.iloc[[-1]] if len(signals) else self.held
+        rpm, phase_current, dc_voltage = (signals[source].to_numpy() for source in sources)
+        motor_power = phase_current * PHASE_TO_DC_CURRENT * dc_voltage * MOTOR_EFFICIENCY
+        with np.errstate(divide='ignore', invalid='ignore'):
+            torque = np.where(updated & (rpm > 0), motor_power / (2 * math.pi * rpm / 60), np.nan)
+        return decoded_df.assign(torque=torque)
+
+    def update(self, timestamps_ns, decoded_df):
+        if len(decoded_df) == 0:
+            return []
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        decoded_df = self.add_derived_signals(decoded_df)
+        new_events = []
+        for index, rule in enumerate(self.rules):
+            for column in matching_columns(decoded_df.columns, rule['signal']):
+                state = self.states.get((index, column))
+                if state is None:
+                    state = self.states[(index, column)] = RuleState(rule, column)
+                # Choice signals (Fault, Warning) decoded with decode_choices=True are compared by their raw value
+                values = numeric_signal_values(decoded_df[column]).to_numpy(dtype=float)
+                present = ~np.isnan(values)
+                new_events.extend(state.evaluate(timestamps_ns[present], values[present]))
+        self.events.extend(new_events)
+        return new_events
+
+    def finish(self):
+        new_events = [event for state in self.states.values() for event in state.finish()]
+        self.events.extend(new_events)
+        return new_events
+
+    # All events so far, in time order, with readable timestamps
+    def to_frame(self):
+        events = pd.DataFrame(self.events, columns=EVENT_COLUMNS).sort_values(['start', 'rule'], kind='stable')
+        events['start'] = pd.to_datetime(events['start'])
+        events['end'] = pd.to_datetime(events['end'])
+        return events.reset_index(drop=True)
+
+
+# Function to format an event for printing as soon as it closes
+def format_event(event):
+    return (f"[{event['severity'] or event['type']}] {event['rule']} on {event['signal']}: "
+            f"{pd.Timestamp(event['start'])} - {pd.Timestamp(event['end'])} ({event['duration_s']:.3f} s, "
+            f"peak {event['peak']:g}){' still active at end of log' if event['open'] else ''}")
+
+
+# Function to build the path of the event file written next to an output or a log
+def events_file_path(base_path):
+    return f"{base_path}_events.csv"
+
+
+# Function to write the events of a run next to its output
+def write_events(engine, base_path):
+    events = engine.to_frame()
+    events.to_csv(events_file_path(base_path), index=False)
+    return events
+
+
+# Function to scan one log for events chunk by chunk, printing each event as soon as it closes
+def scan_log(csv_file_path, dbc_file_paths, rules=None, chunksize=200000):
+    prefixes = dbc_prefixes(len(dbc_file_paths))
+    routing_table = build_prefixed_routing_table(load_dbc_files(dbc_file_paths), prefixes)
+    engine = AlertEngine(rules)
+    previous_ns = None
+    for chunk in read_logger_csv(csv_file_path, chunksize=chunksize, columns=DECODE_COLUMNS,
+                                 payload_arrays=True):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = timestamps_ns[-1]
+        for event in engine.update(timestamps_ns, decode_prefixed(chunk, routing_table, prefixes)):
+            print(format_event(event))
+    for event in engine.finish():
+        print(format_event(event))
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan logs for threshold, rising-edge and duration rule events")
+    parser.add_argument('--dbc', action='append', required=True, help="DBC file (repeat for several)")
+    parser.add_argument('--rules', help="JSON file with the rules (the Fault/Warning/torque rules by default)")
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    rules = load_rules(args.rules)
+    for csv_file_path in args.csv_files:
+        engine = scan_log(csv_file_path, args.dbc, rules)
+        events = write_events(engine, os.path.splitext(uncompressed_path(csv_file_path))[0])
+        print(f"{csv_file_path}: {len(events)} event(s) saved to "
+              f"{events_file_path(os.path.splitext(uncompressed_path(csv_file_path))[0])}")
+
+
+if __name__ == '__main__':
+    main()
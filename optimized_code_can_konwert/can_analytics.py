@@ -0,0 +1,293 @@
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from can_decode import load_dbc_files, dbc_prefixes, build_prefixed_routing_table, decode_prefixed
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns
+
+# Decoded columns used by the analytics: motor controller DBC first, battery DBC second (as in newaltered.py)
+SPEED_SIGNAL = 'dbc1_MC_MOTOR_SPEED'
+PHASE_CURRENT_SIGNAL = 'dbc1_MC_PH_CURR'
+DC_VOLTAGE_SIGNAL = 'dbc1_MC_DC_VOLT'
+BATTERY_CURRENT_SIGNAL = 'dbc2_Battery_Current'
+BATTERY_VOLTAGE_SIGNAL = 'dbc2_Battery_Voltage'
+MODE_FLAG_SIGNALS = {'regen': 'dbc1_MC_STATUS_REGEN', 'brake': 'dbc1_MC_STATUS_BRK',
+                     'reverse': 'dbc1_MC_STATUS_REVERSE', 'forward': 'dbc1_MC_STATUS_FWD'}
+ANALYTICS_SIGNALS = [SPEED_SIGNAL, PHASE_CURRENT_SIGNAL, DC_VOLTAGE_SIGNAL, BATTERY_CURRENT_SIGNAL,
+                     BATTERY_VOLTAGE_SIGNAL] + list(MODE_FLAG_SIGNALS.values())
+
+# Conversion factors shared with newaltered.py and clubdata_charts.py
+PHASE_TO_DC_CURRENT = 0.866
+RPM_TO_KMH = 0.012551909
+MOTOR_EFFICIENCY = 0.73  # eco mode
+MAX_TORQUE_NM = 35
+
+# Drive modes; a sample takes the first one that applies: regen and brake flags win over the motor speed,
+# a motor at 0 RPM is standing still, otherwise the direction flags decide and no flag at all is coasting
+DRIVE_MODES = ['regen', 'brake', 'standstill', 'reverse', 'forward', 'coast']
+
+# Samples further apart than this are a gap in the recording and are not integrated
+MAX_GAP_NS = 2 * NS_PER_SECOND
+
+# Default bins of the operating point map
+RPM_BIN_EDGES = np.arange(0, 6001, 250)
+TORQUE_BIN_EDGES = np.arange(0, MAX_TORQUE_NM + 0.1, 2.5)
+
+
+# Function to prepend the last sample of the previous chunk to the arrays of a new chunk
+def with_previous(previous, arrays):
+    if previous is None:
+        return arrays
+    return [np.concatenate([[last], array]) for last, array in zip(previous, arrays)]
+
+
+# Function to get the interval lengths in seconds between consecutive samples and the intervals to integrate
+# (ordered and not longer than max_gap_ns)
+def sample_intervals(timestamps_ns, max_gap_ns):
+    gaps_ns = np.diff(timestamps_ns)
+    return gaps_ns / NS_PER_SECOND, (gaps_ns >= 0) & (gaps_ns <= max_gap_ns)
+
+
+# Function to integrate a piecewise linear signal over each interval, split into the area above and below zero
+# Intervals that cross zero are split at the crossing, so consumed and regenerated energy do not cancel out
+def trapezoid_parts(start, end, seconds):
+    high = np.maximum(start, end)
+    low = np.minimum(start, end)
+    crossing = (high > 0) & (low < 0)
+    span = np.where(crossing, high - low, 1.0)
+    positive = np.where(crossing, high ** 2 / (2 * span), (np.maximum(start, 0) + np.maximum(end, 0)) / 2)
+    negative = np.where(crossing, -low ** 2 / (2 * span), (np.minimum(start, 0) + np.minimum(end, 0)) / 2)
+    return positive * seconds, negative * seconds
+
+
+# Streaming trapezoidal integrator; the last sample is carried over, so chunks integrate like one long series
+# Integrals are in <unit>*seconds: W gives J (Wh = J / 3600), km/h gives km * 3600
+class TrapezoidAccumulator:
+    def __init__(self, max_gap_ns=MAX_GAP_NS):
+        self.max_gap_ns = max_gap_ns
+        self.positive = 0.0
+        self.negative = 0.0
+        self.seconds = 0.0
+        self.previous = None
+
+    def update(self, timestamps_ns, values):
+        values = np.asarray(values, dtype=float)
+        valid = np.isfinite(values)
+        timestamps_ns, values = with_previous(self.previous, [np.asarray(timestamps_ns, dtype=np.int64)[valid],
+                                                              values[valid]])
+        if len(values) == 0:
+            return
+        self.previous = (timestamps_ns[-1], values[-1])
+        seconds, used = sample_intervals(timestamps_ns, self.max_gap_ns)
+        positive, negative = trapezoid_parts(values[:-1], values[1:], seconds)
+        self.positive += positive[used].sum()
+        self.negative += negative[used].sum()
+        self.seconds += seconds[used].sum()
+
+    # Adds the totals of an accumulator filled from another log (the carried sample is not merged)
+    def merge(self, other):
+        self.positive += other.positive
+        self.negative += other.negative
+        self.seconds += other.seconds
+        return self
+
+
+# Function to classify every sample into an index of DRIVE_MODES
+def drive_mode_codes(rpm, flags):
+    conditions = [flags['regen'] > 0, flags['brake'] > 0, rpm == 0, flags['reverse'] > 0, flags['forward'] > 0]
+    return np.select(conditions, range(len(conditions)), default=len(DRIVE_MODES) - 1)
+
+
+# Streaming time-in-mode counter: each interval between samples is credited to the mode of its first sample
+class TimeInModeAccumulator:
+    def __init__(self, max_gap_ns=MAX_GAP_NS):
+        self.max_gap_ns = max_gap_ns
+        self.seconds = np.zeros(len(DRIVE_MODES))
+        self.previous = None
+
+    def update(self, timestamps_ns, mode_codes):
+        timestamps_ns, mode_codes = with_previous(self.previous, [np.asarray(timestamps_ns, dtype=np.int64),
+                                                                  np.asarray(mode_codes, dtype=np.int64)])
+        if len(mode_codes) == 0:
+            return
+        self.previous = (timestamps_ns[-1], mode_codes[-1])
+        seconds, used = sample_intervals(timestamps_ns, self.max_gap_ns)
+        self.seconds += np.bincount(mode_codes[:-1][used], weights=seconds[used], minlength=len(DRIVE_MODES))
+
+    def merge(self, other):
+        self.seconds += other.seconds
+        return self
+
+    def to_series(self):
+        return pd.Series(self.seconds, index=pd.Index(DRIVE_MODES, name='mode'), name='seconds')
+
+
+# Streaming 2-D binned map of the operating points (RPM x torque by default): sample count, time, and the motor
+# (controller DC side) and battery electrical energy per bin; maps with the same bin edges can be merged
+# No torque signal is logged, so the torque axis is the eco-mode estimate from the motor electrical power. A
+# mechanical / electrical efficiency per bin built on that estimate would only return MOTOR_EFFICIENCY, so the map
+# reports measured electrical energy and mean power per bin instead
+class OperatingPointMap:
+    def __init__(self, x_edges=RPM_BIN_EDGES, y_edges=TORQUE_BIN_EDGES, max_gap_ns=MAX_GAP_NS):
+        self.x_edges = np.asarray(x_edges, dtype=float)
+        self.y_edges = np.asarray(y_edges, dtype=float)
+        self.max_gap_ns = max_gap_ns
+        shape = (len(self.x_edges) - 1, len(self.y_edges) - 1)
+        self.samples = np.zeros(shape, dtype=np.int64)
+        self.seconds = np.zeros(shape)
+        self.motor_j = np.zeros(shape)
+        self.battery_j = np.zeros(shape)
+        self.previous = None
+
+    def update(self, timestamps_ns, x, y, motor_w, battery_w):
+        arrays = with_previous(self.previous, [np.asarray(timestamps_ns, dtype=np.int64)] +
+                               [np.asarray(values, dtype=float) for values in (x, y, motor_w, battery_w)])
+        timestamps_ns, x, y, motor_w, battery_w = arrays
+        if len(timestamps_ns) == 0:
+            return
+        self.previous = tuple(array[-1] for array in arrays)
+        seconds, used = sample_intervals(timestamps_ns, self.max_gap_ns)
+        x, y, motor_w, battery_w = x[:-1], y[:-1], motor_w[:-1], battery_w[:-1]
+        nx, ny = self.samples.shape
+        xi = np.searchsorted(self.x_edges, x, side='right') - 1
+        yi = np.searchsorted(self.y_edges, y, side='right') - 1
+        inside = used & (xi >= 0) & (xi < nx) & (yi >= 0) & (yi < ny) & np.isfinite(motor_w) & np.isfinite(battery_w)
+        bins = xi[inside] * ny + yi[inside]
+        seconds = seconds[inside]
+        self.samples += np.bincount(bins, minlength=nx * ny).reshape(nx, ny)
+        self.seconds += np.bincount(bins, weights=seconds, minlength=nx * ny).reshape(nx, ny)
+        self.motor_j += np.bincount(bins, weights=motor_w[inside] * seconds, minlength=nx * ny).reshape(nx, ny)
+        self.battery_j += np.bincount(bins, weights=battery_w[inside] * seconds, minlength=nx * ny).reshape(nx, ny)
+
+    def merge(self, other):
+        if not (np.array_equal(self.x_edges, other.x_edges) and np.array_equal(self.y_edges, other.y_edges)):
+            raise ValueError("Operating point maps with different bin edges cannot be merged")
+        self.samples += other.samples
+        self.seconds += other.seconds
+        self.motor_j += other.motor_j
+        self.battery_j += other.battery_j
+        return self
+
+    # Long format, one row per bin that has samples
+    def to_frame(self):
+        xi, yi = np.nonzero(self.samples)
+        seconds = self.seconds[xi, yi]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            motor_mean_w = np.where(seconds > 0, self.motor_j[xi, yi] / seconds, np.nan)
+            battery_mean_w = np.where(seconds > 0, self.battery_j[xi, yi] / seconds, np.nan)
+        return pd.DataFrame({'rpm_min': self.x_edges[xi], 'rpm_max': self.x_edges[xi + 1],
+                             'torque_min': self.y_edges[yi], 'torque_max': self.y_edges[yi + 1],
+                             'samples': self.samples[xi, yi], 'seconds': seconds,
+                             'motor_wh': self.motor_j[xi, yi] / 3600, 'battery_wh': self.battery_j[xi, yi] / 3600,
+                             'motor_mean_w': motor_mean_w, 'battery_mean_w': battery_mean_w})
+
+
+# Drive-cycle analytics over decoded chunks: battery energy consumed/regenerated, motor energy, distance,
+# time in mode and the RPM x torque operating point map of the motor and battery electrical energy
+class DriveCycleAnalytics:
+    def __init__(self, max_gap_ns=MAX_GAP_NS, rpm_edges=RPM_BIN_EDGES, torque_edges=TORQUE_BIN_EDGES):
+        self.battery_energy = TrapezoidAccumulator(max_gap_ns)
+        self.motor_energy = TrapezoidAccumulator(max_gap_ns)
+        self.distance = TrapezoidAccumulator(max_gap_ns)
+        self.modes = TimeInModeAccumulator(max_gap_ns)
+        self.operating_map = OperatingPointMap(rpm_edges, torque_edges, max_gap_ns)
+        self.held = None
+
+    # Signals arrive in different frames, so each one holds its last value until the next frame carrying it
+    def held_signals(self, decoded_df):
+        signals = decoded_df.reindex(columns=ANALYTICS_SIGNALS).apply(pd.to_numeric, errors='coerce')
+        if self.held is not None:
+            signals = pd.concat([self.held, signals]).ffill().iloc[1:]
+        else:
+            signals = signals.ffill()
+        self.held = signals.iloc[[-1]] if len(signals) else self.held
+        return signals
+
+    def update(self, timestamps_ns, decoded_df):
+        if len(decoded_df) == 0:
+            return
+        signals = self.held_signals(decoded_df)
+        rpm = signals[SPEED_SIGNAL].to_numpy()
+        battery_power = (signals[BATTERY_CURRENT_SIGNAL] * signals[BATTERY_VOLTAGE_SIGNAL]).to_numpy()
+        # Electrical power on the controller DC side, and the estimated shaft power used for the motor energy and
+        # the torque axis of the operating point map
+        motor_electrical_power = (signals[PHASE_CURRENT_SIGNAL] * PHASE_TO_DC_CURRENT
+                                  * signals[DC_VOLTAGE_SIGNAL]).to_numpy()
+        motor_power = motor_electrical_power * MOTOR_EFFICIENCY
+        with np.errstate(divide='ignore', invalid='ignore'):
+            torque = motor_power / (2 * math.pi * rpm / 60)
+        flags = {mode: signals[signal].fillna(0).to_numpy() for mode, signal in MODE_FLAG_SIGNALS.items()}
+
+        self.battery_energy.update(timestamps_ns, battery_power)
+        self.motor_energy.update(timestamps_ns, motor_power)
+        self.distance.update(timestamps_ns, rpm * RPM_TO_KMH)
+        self.modes.update(timestamps_ns, drive_mode_codes(rpm, flags))
+        self.operating_map.update(timestamps_ns, rpm, torque, motor_electrical_power, battery_power)
+
+    def merge(self, other):
+        self.battery_energy.merge(other.battery_energy)
+        self.motor_energy.merge(other.motor_energy)
+        self.distance.merge(other.distance)
+        self.modes.merge(other.modes)
+        self.operating_map.merge(other.operating_map)
+        return self
+
+    def summary(self):
+        distance_km = (self.distance.positive + abs(self.distance.negative)) / 3600
+        consumed_wh = self.battery_energy.positive / 3600
+        regenerated_wh = -self.battery_energy.negative / 3600
+        return {'duration_s': self.battery_energy.seconds, 'distance_km': distance_km,
+                'battery_consumed_wh': consumed_wh, 'battery_regenerated_wh': regenerated_wh,
+                'battery_net_wh': consumed_wh - regenerated_wh,
+                'motor_wh': (self.motor_energy.positive + self.motor_energy.negative) / 3600,
+                'wh_per_km': (consumed_wh - regenerated_wh) / distance_km if distance_km > 0 else math.nan}
+
+
+# Function to run the drive-cycle analytics over one logger CSV, one chunk at a time
+def analyze_log(csv_file_path, dbc_file_paths, chunksize=200000):
+    prefixes = dbc_prefixes(len(dbc_file_paths))
+    routing_table = build_prefixed_routing_table(load_dbc_files(dbc_file_paths), prefixes)
+    analytics = DriveCycleAnalytics()
+    previous_ns = None
+    for chunk in read_logger_csv(csv_file_path, chunksize=chunksize, columns=DECODE_COLUMNS,
+                                 payload_arrays=True):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = timestamps_ns[-1]
+        analytics.update(timestamps_ns, decode_prefixed(chunk, routing_table, prefixes))
+    return analytics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive-cycle energy, time-in-mode and operating point maps over logs")
+    parser.add_argument('--dbc', action='append', required=True,
+                        help="DBC file (repeat for several; motor controller first, battery second)")
+    parser.add_argument('--output', default=r"E:\KONWERT\CAN\Can_analytics", help="Directory for the result CSVs")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Logs analysed in parallel")
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    # Every log is analysed on its own and the accumulators are merged, so logs never have to be loaded together
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(analyze_log, args.csv_files, [args.dbc] * len(args.csv_files)))
+    total = DriveCycleAnalytics()
+    summaries = []
+    for csv_file_path, analytics in zip(args.csv_files, results):
+        summaries.append({'log': os.path.basename(csv_file_path), **analytics.summary()})
+        total.merge(analytics)
+    summaries.append({'log': 'total', **total.summary()})
+
+    os.makedirs(args.output, exist_ok=True)
+    summary_df = pd.DataFrame(summaries)
+    summary_df.to_csv(os.path.join(args.output, 'drive_cycle_summary.csv'), index=False)
+    total.modes.to_series().to_csv(os.path.join(args.output, 'time_in_mode.csv'))
+    total.operating_map.to_frame().to_csv(os.path.join(args.output, 'operating_point_map.csv'), index=False)
+    print(summary_df.to_string(index=False))
+    print(total.modes.to_series().to_string())
+    print(f"Results saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from can_compressed import uncompressed_path
+from can_decode import load_dbc_files, frame_ids_from_text
+from can_ingest import read_logger_csv
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns
+
+# Nominal bit rate of the logged bus
+DEFAULT_BITRATE = 500000
+
+# Bits on the wire per frame without stuff bits, including the 3 bit interframe space: SOF, arbitration, control,
+# CRC, ACK and EOF for 11 bit (standard) and 29 bit (extended) IDs, plus 8 bits per payload byte
+STANDARD_FRAME_BITS = 47
+EXTENDED_FRAME_BITS = 67
+LARGEST_STANDARD_ID = 0x7FF
+
+# A gap longer than this many cycle times counts the frames that should have been in it as dropped
+DROPPED_GAP_CYCLES = 1.5
+
+# Columns the bus statistics need from the logger CSV (no payload decoding)
+BUS_STATS_COLUMNS = ['Timestamp', 'Time', 'Frame ID', 'Length']
+
+
+# Function to collect the DBC cycle times (GenMsgCycleTime, ms) and frame formats of the messages: {frame ID: (cycle
+# time in ns or None, extended)}
+def dbc_frame_info(dbs):
+    info = {}
+    for db in dbs:
+        for message in db.messages:
+            cycle_ns = message.cycle_time * 1000000 if message.cycle_time else None
+            info.setdefault(message.frame_id, (cycle_ns, message.is_extended_frame))
+    return info
+
+
+# Function to get the payload length of every frame: the 'Length' column, or the length of the 'Data' hex text
+def frame_lengths(df_csv):
+    if 'Length' in df_csv.columns:
+        return pd.to_numeric(df_csv['Length'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    return ((df_csv['Data'].astype('string').str.len().fillna(0).to_numpy(dtype=np.int64) + 1) // 3)
+
+
+# Bus statistics fed chunk by chunk with the raw frame arrays (frame times, frame IDs, payload lengths)
+# Per frame ID it keeps the count, the sum and sum of squares of the periods, the largest gap and the dropped-frame
+# estimate; the last time of every ID is carried over so periods across chunk borders are counted too
+class BusStatsAccumulator:
+    def __init__(self, frame_info=None, bitrate=DEFAULT_BITRATE):
+        self.frame_info = frame_info or {}
+        self.bitrate = bitrate
+        self.ids = np.array([], dtype=np.int64)
+        self.counts = np.array([], dtype=np.int64)
+        self.period_sums = np.array([], dtype=np.float64)
+        self.period_squares = np.array([], dtype=np.float64)
+        self.max_gaps = np.array([], dtype=np.int64)
+        self.dropped = np.array([], dtype=np.int64)
+        self.first_ns = np.array([], dtype=np.int64)
+        self.last_ns = np.array([], dtype=np.int64)
+        self.bits_per_second = {}
+        self.bits = 0
+        self.frames = 0
+        self.time_min = None
+        self.time_max = None
+
+    # Function to make room for frame IDs seen for the first time; returns the position of every ID of the chunk
+    def positions(self, chunk_ids):
+        new_ids = np.setdiff1d(chunk_ids, self.ids)
+        if len(new_ids):
+            order = np.argsort(np.concatenate([self.ids, new_ids]), kind='stable')
+            grow = len(new_ids)
+            self.ids = np.concatenate([self.ids, new_ids])[order]
+            self.counts = np.concatenate([self.counts, np.zeros(grow, dtype=np.int64)])[order]
+            self.period_sums = np.concatenate([self.period_sums, np.zeros(grow)])[order]
+            self.period_squares = np.concatenate([self.period_squares, np.zeros(grow)])[order]
+            self.max_gaps = np.concatenate([self.max_gaps, np.zeros(grow, dtype=np.int64)])[order]
+            self.dropped = np.concatenate([self.dropped, np.zeros(grow, dtype=np.int64)])[order]
+            self.first_ns = np.concatenate([self.first_ns, np.full(grow, -1, dtype=np.int64)])[order]
+            self.last_ns = np.concatenate([self.last_ns, np.full(grow, -1, dtype=np.int64)])[order]
+        return np.searchsorted(self.ids, chunk_ids)
+
+    def cycle_times_ns(self):
+        return np.array([self.frame_info.get(int(frame_id), (None, None))[0] or 0 for frame_id in self.ids],
+                        dtype=np.float64)
+
+    def frame_bits(self, frame_ids, lengths):
+        unique_ids, inverse = np.unique(frame_ids, return_inverse=True)
+        extended = np.array([self.frame_info.get(int(frame_id), (None, frame_id > LARGEST_STANDARD_ID))[1]
+                             for frame_id in unique_ids], dtype=bool)[inverse.ravel()]
+        return np.where(extended, EXTENDED_FRAME_BITS, STANDARD_FRAME_BITS) + 8 * lengths
+
+    def update(self, timestamps_ns, frame_ids, lengths):
+        valid = np.asarray(frame_ids) >= 0
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)[valid]
+        frame_ids = np.asarray(frame_ids, dtype=np.int64)[valid]
+        lengths = np.asarray(lengths, dtype=np.int64)[valid]
+        if len(frame_ids) == 0:
+            return
+        self.frames += len(frame_ids)
+        self.time_min = timestamps_ns.min() if self.time_min is None else min(self.time_min, timestamps_ns.min())
+        self.time_max = timestamps_ns.max() if self.time_max is None else max(self.time_max, timestamps_ns.max())
+
+        # Bus load: bits on the wire per second of the log
+        bits = self.frame_bits(frame_ids, lengths)
+        self.bits += int(bits.sum())
+        seconds, second_index = np.unique(timestamps_ns // NS_PER_SECOND, return_inverse=True)
+        for second, second_bits in zip(seconds.tolist(), np.bincount(second_index.ravel(), weights=bits).tolist()):
+            self.bits_per_second[second] = self.bits_per_second.get(second, 0) + second_bits
+
+        # Periods per ID: sort the chunk by ID (stable, so time order is kept inside every ID) and prepend the last
+        # time of each ID from the previous chunks
+        order = np.argsort(frame_ids, kind='stable')
+        sorted_ids = frame_ids[order]
+        sorted_ns = timestamps_ns[order]
+        chunk_ids, starts, counts = np.unique(sorted_ids, return_index=True, return_counts=True)
+        positions = self.positions(chunk_ids)
+        previous_ns = np.full(len(sorted_ns), -1, dtype=np.int64)
+        previous_ns[1:] = sorted_ns[:-1]
+        previous_ns[starts] = self.last_ns[positions]
+        has_previous = previous_ns >= 0
+        periods = np.where(has_previous, sorted_ns - previous_ns, 0).astype(np.float64)
+        group = np.repeat(np.arange(len(chunk_ids)), counts)
+
+        cycles = self.cycle_times_ns()[positions][group]
+        missing = np.where(has_previous & (cycles > 0) & (periods > DROPPED_GAP_CYCLES * cycles),
+                           np.round(periods / np.where(cycles > 0, cycles, 1)) - 1, 0)
+
+        self.counts[positions] += counts
+        self.period_sums[positions] += np.bincount(group, weights=periods, minlength=len(chunk_ids))
+        self.period_squares[positions] += np.bincount(group, weights=periods * periods, minlength=len(chunk_ids))
+        self.dropped[positions] += np.bincount(group, weights=missing, minlength=len(chunk_ids)).astype(np.int64)
+        gaps = np.full(len(chunk_ids), 0, dtype=np.int64)
+        np.maximum.at(gaps, group, periods.astype(np.int64))
+        self.max_gaps[positions] = np.maximum(self.max_gaps[positions], gaps)
+        self.first_ns[positions] = np.where(self.first_ns[positions] < 0, sorted_ns[starts], self.first_ns[positions])
+        self.last_ns[positions] = sorted_ns[starts + counts - 1]
+
+    # Per-ID table and the log summary
+    def finish(self):
+        duration_s = 0 if self.time_min is None else (self.time_max - self.time_min) / NS_PER_SECOND
+        period_counts = np.maximum(self.counts - 1, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            period_mean = self.period_sums / period_counts
+            period_std = np.sqrt(np.maximum(self.period_squares / period_counts - period_mean ** 2, 0))
+            id_duration_ns = (self.last_ns - self.first_ns).astype(np.float64)
+        cycles = self.cycle_times_ns()
+        known_cycle = cycles > 0
+        table = pd.DataFrame({
+            'frame_id': [f"{int(frame_id):08X}" for frame_id in self.ids],
+            'frames': self.counts,
+            'rate_hz': self.counts / duration_s if duration_s > 0 else np.nan,
+            'period_mean_ms': period_mean / 1e6,
+            'period_std_ms': period_std / 1e6,
+            'max_gap_ms': np.where(period_counts > 0, self.max_gaps / 1e6, np.nan),
+            'dbc_cycle_ms': np.where(known_cycle, cycles / 1e6, np.nan),
+            'expected_frames': np.where(known_cycle, np.floor(id_duration_ns / np.where(known_cycle, cycles, 1)) + 1,
+                                        np.nan),
+            'dropped_frames': np.where(known_cycle, self.dropped, np.nan),
+        })
+        table['drop_rate'] = table['dropped_frames'] / (table['frames'] + table['dropped_frames'])
+        loads = np.array(list(self.bits_per_second.values())) / self.bitrate
+        summary = {'frames': self.frames, 'frame_ids': len(self.ids), 'duration_s': duration_s,
+                   'start': None if self.time_min is None else pd.Timestamp(int(self.time_min)).isoformat(),
+                   'end': None if self.time_max is None else pd.Timestamp(int(self.time_max)).isoformat(),
+                   'bitrate': self.bitrate,
+                   'bus_load': self.bits / self.bitrate / duration_s if duration_s > 0 else None,
+                   'peak_bus_load_1s': float(loads.max()) if len(loads) else None,
+                   'dropped_frames': int(self.dropped.sum()),
+                   'frame_ids_with_drops': table.loc[table['dropped_frames'] > 0, 'frame_id'].tolist()}
+        return summary, table
+
+
+# Function to build the path of the bus statistics report written next to an output or a log
+def busstats_file_path(base_path):
+    return f"{base_path}_busstats.json"
+
+
+# Function to write the bus statistics report of one log
+def write_busstats(summary, table, base_path):
+    report = {'summary': summary, 'frame_ids': json.loads(table.to_json(orient='records'))}
+    with open(busstats_file_path(base_path), 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+
+
+# Function to compute the bus statistics of a log on its own (timestamps, frame IDs and lengths only, no decoding)
+def scan_bus_stats(csv_file_path, frame_info=None, bitrate=DEFAULT_BITRATE, chunksize=500000):
+    accumulator = BusStatsAccumulator(frame_info, bitrate)
+    previous_ns = None
+    for chunk in read_logger_csv(csv_file_path, chunksize=chunksize, columns=BUS_STATS_COLUMNS,
+                                 payload_arrays=True):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = timestamps_ns[-1]
+        accumulator.update(timestamps_ns, frame_ids_from_text(chunk['Frame ID']), frame_lengths(chunk))
+    return accumulator.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-ID message rate, period, gaps, dropped frames and bus load")
+    parser.add_argument('--dbc', action='append', default=[], help="DBC file with cycle times (repeat for several)")
+    parser.add_argument('--bitrate', type=int, default=DEFAULT_BITRATE, help="Bus bit rate in bit/s")
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    frame_info = dbc_frame_info(load_dbc_files(args.dbc))
+    for csv_file_path in args.csv_files:
+        summary, table = scan_bus_stats(csv_file_path, frame_info, args.bitrate)
+        write_busstats(summary, table, os.path.splitext(uncompressed_path(csv_file_path))[0])
+        print(f"{csv_file_path}: {summary['frames']} frames, {summary['frame_ids']} frame ID(s), "
+              f"bus load {summary['bus_load'] or 0:.1%} (peak {summary['peak_bus_load_1s'] or 0:.1%}), "
+              f"{summary['dropped_frames']} dropped frame(s)")
+        print(table.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import gzip
+import io
+import json
+import lzma
+import os
+import queue
+import threading
+from itertools import islice
+import pandas as pd
+from can_timestamps import logger_timestamps_ns
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed log formats, picked by file extension
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd', '.xz': 'xz'}
+
+# Decompressed bytes handed from the background thread to the parser at a time, and blocks buffered between them
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+DECOMPRESS_QUEUE_BLOCKS = 16
+
+# Logger rows per independently compressed block of a seekable log (one gzip member / zstd frame / xz stream)
+SEEKABLE_BLOCK_ROWS = 100000
+
+# Metadata and header rows at the top of the logger CSV export (can_ingest.LOGGER_SKIP_ROWS)
+LOGGER_HEADER_LINES = 3
+
+
+# Function to get the compression of a log from its extension (None for a plain CSV)
+def log_compression(file_path):
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(file_path)[1].lower())
+
+
+# Function to drop the compression extension from a log path ('log.csv.zst' -> 'log.csv')
+def uncompressed_path(file_path):
+    return os.path.splitext(file_path)[0] if log_compression(file_path) else file_path
+
+
+# Function to build the path of the block index written next to a seekable compressed log
+def block_index_path(file_path):
+    return f"{file_path}.blocks.json"
+
+
+# Function to open a decompressing reader over a raw binary file (decompresses across concatenated members/frames)
+def decompressing_reader(raw_file, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw_file, mode='rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(raw_file)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("Reading .zst logs needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(raw_file, read_across_frames=True)
+    raise ValueError(f"Unknown compression {compression!r}, expected one of {list(COMPRESSION_EXTENSIONS.values())}")
+
+
+# Function to compress one block of a seekable log as an independent member/frame/stream
+def compress_block(data, compression):
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if compression == 'xz':
+        return lzma.compress(data)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("Writing .zst logs needs the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unknown compression {compression!r}, expected one of {list(COMPRESSION_EXTENSIONS.values())}")
+
+
+# Raw file limited to the byte range [start, end), so a seekable log is decompressed only over the blocks needed
+class ByteRangeFile:
+    def __init__(self, file_path, start=0, end=None):
+        self.file = open(file_path, 'rb')
+        self.file.seek(start)
+        self.remaining = None if end is None else end - start
+
+    def read(self, size=-1):
+        if self.remaining is None:
+            return self.file.read(size)
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+# Readable stream over a compressed log; a background thread reads and decompresses blocks into a bounded queue
+# while the caller parses the previous ones (zlib, lzma and zstd release the GIL while they work)
+# prefix is returned before the decompressed data (the header rows when reading from the middle of a seekable log)
+class BackgroundDecompressor(io.RawIOBase):
+    def __init__(self, file_path, compression=None, start=0, end=None, prefix=b''):
+        self.compression = compression or log_compression(file_path)
+        self.blocks = queue.Queue(maxsize=DECOMPRESS_QUEUE_BLOCKS)
+        self.buffer = memoryview(prefix)
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.decompress, args=(file_path, start, end), daemon=True)
+        self.thread.start()
+
+    def decompress(self, file_path, start, end):
+        raw_file = ByteRangeFile(file_path, start, end)
+        try:
+            reader = decompressing_reader(raw_file, self.compression)
+            while not self.stopped.is_set():
+                block = reader.read(DECOMPRESS_BLOCK_SIZE)
+                if not block:
+                    break
+                self.put(block)
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+        finally:
+            raw_file.close()
+
+    # Blocks while the parser is behind, giving up when the stream is closed early
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not len(self.buffer):
+            if self.finished:
+                return 0
+            block = self.blocks.get()
+            if block is None:
+                self.finished = True
+                return 0
+            if isinstance(block, Exception):
+                self.finished = True
+                raise block
+            self.buffer = memoryview(block)
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        self.stopped.set()
+        super().close()
+
+
+# Function to open a log for the CSV readers: plain CSVs are returned as their path (read natively), compressed
+# logs as a buffered stream decompressed in the background; streams that are already open are returned as they are
+def open_logger_input(file_path):
+    if not isinstance(file_path, str) or log_compression(file_path) is None:
+        return file_path
+    return io.BufferedReader(BackgroundDecompressor(file_path), buffer_size=DECOMPRESS_BLOCK_SIZE)
+
+
+# Function to open a plain or compressed log as text lines
+def open_logger_text(file_path):
+    if log_compression(file_path) is None:
+        return open(file_path, newline='')
+    return io.TextIOWrapper(open_logger_input(file_path), newline='')
+
+
+# Function to read the metadata and header rows of a plain or compressed log
+def logger_header_lines(file_path):
+    with open_logger_text(file_path) as log_file:
+        return [log_file.readline() for _ in range(LOGGER_HEADER_LINES)]
+
+
+# Function to parse the timestamps of raw logger rows (bytes) into epoch ns
+def row_timestamps_ns(rows, previous_ns=None):
+    df = pd.read_csv(io.BytesIO(rows), delimiter=';', header=None, usecols=[1, 2], dtype='string')
+    df.columns = ['Timestamp', 'Time']
+    return logger_timestamps_ns(df, previous_ns=previous_ns)
+
+
+# Function to write a log as a seekable compressed log: the header rows and every block of block_rows rows are
+# compressed independently, and the byte offset and time range of every block go into the block index
+# The rows are copied byte for byte, so the decompressed log is identical to the original
+def write_seekable_log(csv_file_path, output_path, block_rows=SEEKABLE_BLOCK_ROWS):
+    compression = log_compression(output_path)
+    if compression is None:
+        raise ValueError(f"{output_path} has no compressed extension, expected one of {list(COMPRESSION_EXTENSIONS)}")
+    blocks = []
+    previous_ns = None
+    with open(csv_file_path, 'rb') as csv_file, open(output_path, 'wb') as output_file:
+        header = b''.join(islice(csv_file, LOGGER_HEADER_LINES))
+        output_file.write(compress_block(header, compression))
+        while True:
+            rows = b''.join(islice(csv_file, block_rows))
+            if not rows:
+                break
+            timestamps_ns = row_timestamps_ns(rows, previous_ns)
+            offset = output_file.tell()
+            output_file.write(compress_block(rows, compression))
+            blocks.append({'offset': offset, 'end_offset': output_file.tell(), 'rows': len(timestamps_ns),
+                           'first_ns': int(timestamps_ns[0]), 'last_ns': int(timestamps_ns[-1]),
+                           'previous_ns': None if previous_ns is None else int(previous_ns)})
+            previous_ns = timestamps_ns[-1]
+    block_index = {'source': os.path.abspath(csv_file_path), 'compression': compression,
+                   'header': header.decode('utf-8', errors='replace'), 'blocks': blocks}
+    with open(block_index_path(output_path), 'w') as index_file:
+        json.dump(block_index, index_file, indent=1)
+    return block_index
+
+
+# Function to read the block index of a seekable compressed log (None when the log has none)
+def read_block_index(file_path):
+    if not os.path.exists(block_index_path(file_path)):
+        return None
+    with open(block_index_path(file_path)) as index_file:
+        return json.load(index_file)
+
+
+# Function to open only the blocks of a seekable compressed log that overlap [start_ns, end_ns], with the header
+# rows in front so the result reads like a whole log
+# Returns (stream, previous_ns of the first block for the day rollover), or (None, None) when no block overlaps
+def open_log_window(file_path, block_index, start_ns=None, end_ns=None):
+    selected = [block for block in block_index['blocks']
+                if (start_ns is None or block['last_ns'] >= start_ns) and (end_ns is None or block['first_ns'] <= end_ns)]
+    if not selected:
+        return None, None
+    raw = BackgroundDecompressor(file_path, block_index['compression'], selected[0]['offset'],
+                                 selected[-1]['end_offset'], prefix=block_index['header'].encode('utf-8'))
+    return io.BufferedReader(raw, buffer_size=DECOMPRESS_BLOCK_SIZE), selected[0]['previous_ns']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress logger CSVs into seekable block-compressed logs")
+    parser.add_argument('--format', choices=sorted(COMPRESSION_EXTENSIONS), default='.zst',
+                        help="Compression of the output (its extension)")
+    parser.add_argument('--block-rows', type=int, default=SEEKABLE_BLOCK_ROWS,
+                        help="Rows per independently compressed block")
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    for csv_file_path in args.csv_files:
+        output_path = csv_file_path + args.format
+        block_index = write_seekable_log(csv_file_path, output_path, args.block_rows)
+        ratio = os.path.getsize(csv_file_path) / max(os.path.getsize(output_path), 1)
+        print(f"{csv_file_path} -> {output_path}: {len(block_index['blocks'])} block(s), {ratio:.1f}x smaller")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+from itertools import combinations
+import numpy as np
+import cantools
+from can_decode import frame_ids_from_text
+from can_preview import sample_log
+
+# DBC library of the team (see FINAL_CAN_OUT.py)
+DEFAULT_DBC_DIRECTORY = r"E:\KONWERT\CAN_DBC_FILES"
+
+# Catalog cache written into the DBC directory; a DBC is parsed again only when its size or modification time changes
+CATALOG_FILE_NAME = 'dbc_catalog.json'
+CATALOG_VERSION = 1
+
+# Up to this many candidate DBCs the smallest covering set is searched exhaustively, above it greedily
+MAX_EXACT_CANDIDATES = 12
+
+
+# Function to list the DBC files under a directory (recursively), as paths relative to it
+def find_dbc_files(dbc_directory):
+    dbc_files = []
+    for folder, _, file_names in os.walk(dbc_directory):
+        for file_name in file_names:
+            if file_name.lower().endswith('.dbc'):
+                dbc_files.append(os.path.relpath(os.path.join(folder, file_name), dbc_directory))
+    return sorted(dbc_files)
+
+
+# Function to describe the messages and signals of one DBC file for the catalog
+def catalog_entry(dbc_file_path):
+    stat = os.stat(dbc_file_path)
+    entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'messages': []}
+    try:
+        db = cantools.database.load_file(dbc_file_path)
+    except Exception as e:
+        print(f"Skipping {dbc_file_path}: {e}")
+        entry['error'] = str(e)
+        return entry
+    for message in db.messages:
+        entry['messages'].append({'name': message.name, 'frame_id': message.frame_id,
+                                  'extended': message.is_extended_frame, 'cycle_ms': message.cycle_time,
+                                  'signals': [signal.name for signal in message.signals]})
+    return entry
+
+
+# Function to build or refresh the catalog of a DBC directory; unchanged DBCs are taken from the cached catalog
+def build_catalog(dbc_directory=DEFAULT_DBC_DIRECTORY, rebuild=False):
+    if not os.path.isdir(dbc_directory):
+        raise FileNotFoundError(f"DBC directory {dbc_directory} not found")
+    catalog_path = os.path.join(dbc_directory, CATALOG_FILE_NAME)
+    cached = {}
+    if not rebuild and os.path.exists(catalog_path):
+        with open(catalog_path) as catalog_file:
+            catalog = json.load(catalog_file)
+        if catalog.get('version') == CATALOG_VERSION:
+            cached = catalog['dbcs']
+
+    dbcs = {}
+    parsed = 0
+    for dbc_file in find_dbc_files(dbc_directory):
+        stat = os.stat(os.path.join(dbc_directory, dbc_file))
+        entry = cached.get(dbc_file)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = catalog_entry(os.path.join(dbc_directory, dbc_file))
+            parsed += 1
+        dbcs[dbc_file] = entry
+    catalog = {'version': CATALOG_VERSION, 'directory': os.path.abspath(dbc_directory), 'dbcs': dbcs}
+    if parsed or set(dbcs) != set(cached):
+        try:
+            with open(catalog_path, 'w') as catalog_file:
+                json.dump(catalog, catalog_file, indent=1)
+        except OSError as e:
+            print(f"Could not write the DBC catalog {catalog_path}: {e}")
+    return DbcCatalog(catalog)
+
+
+# Catalog of a DBC library: signal name -> [(DBC, message, frame ID)] and frame ID -> [DBC], with the choice of the
+# smallest set of DBCs that covers the signals a run needs or the frame IDs seen in a log
+class DbcCatalog:
+    def __init__(self, catalog):
+        self.directory = catalog['directory']
+        self.dbc_files = [dbc_file for dbc_file, entry in catalog['dbcs'].items() if 'error' not in entry]
+        self.mtimes = {dbc_file: catalog['dbcs'][dbc_file]['mtime_ns'] for dbc_file in self.dbc_files}
+        self.signal_index = {}
+        self.frame_id_index = {}
+        for dbc_file in self.dbc_files:
+            for message in catalog['dbcs'][dbc_file]['messages']:
+                self.frame_id_index.setdefault(message['frame_id'], [])
+                if dbc_file not in self.frame_id_index[message['frame_id']]:
+                    self.frame_id_index[message['frame_id']].append(dbc_file)
+                for signal in message['signals']:
+                    self.signal_index.setdefault(signal, []).append((dbc_file, message['name'], message['frame_id']))
+
+    def path(self, dbc_file):
+        return os.path.join(self.directory, dbc_file)
+
+    def signal_locations(self, signal):
+        return self.signal_index.get(signal, [])
+
+    def dbcs_for_frame_id(self, frame_id):
+        return self.frame_id_index.get(frame_id, [])
+
+    # Function to pick the smallest set of DBCs covering the wanted items ({item: [DBCs defining it]}); among
+    # sets of the same size the one covering the most weight wins (frames seen, or one per signal), and among sets
+    # that still tie (several DBCs defining the same signals, e.g. versions of one file) the set holding the most
+    # recently modified DBC wins, with a warning naming the other sets
+    # Returns (DBC files in catalog order, items no DBC defines)
+    def covering_dbcs(self, candidates_by_item, weights=None):
+        weights = weights or {}
+        uncovered = [item for item, dbc_files in candidates_by_item.items() if not dbc_files]
+        items = {item: set(dbc_files) for item, dbc_files in candidates_by_item.items() if dbc_files}
+        if not items:
+            return [], uncovered
+        candidates = sorted(set().union(*items.values()), key=self.dbc_files.index)
+
+        def covered_weight(dbc_files):
+            return sum(weights.get(item, 1) for item, defined_by in items.items() if defined_by & set(dbc_files))
+
+        def newest(dbc_files):
+            return max(self.mtimes[dbc_file] for dbc_file in dbc_files)
+
+        total = covered_weight(candidates)
+        if len(candidates) <= MAX_EXACT_CANDIDATES:
+            for size in range(1, len(candidates) + 1):
+                covering = [dbc_files for dbc_files in combinations(candidates, size)
+                            if all(defined_by & set(dbc_files) for defined_by in items.values())]
+                if covering:
+                    best_weight = max(map(covered_weight, covering))
+                    tied = [dbc_files for dbc_files in covering if covered_weight(dbc_files) == best_weight]
+                    selected = max(tied, key=newest)
+                    self.warn_ties(selected, tied)
+                    return list(selected), uncovered
+        selected = []
+        while covered_weight(selected) < total:
+            selected.append(max((dbc_file for dbc_file in candidates if dbc_file not in selected),
+                                key=lambda dbc_file: (covered_weight(selected + [dbc_file]), self.mtimes[dbc_file])))
+        return sorted(selected, key=self.dbc_files.index), uncovered
+
+    # Function to print which of several equally good DBC sets was picked, so a stale duplicate is noticed
+    def warn_ties(self, selected, tied):
+        if len(tied) > 1:
+            others = [list(dbc_files) for dbc_files in tied if dbc_files != selected]
+            print(f"Warning: {len(tied)} DBC sets in {self.directory} qualify, using the most recently modified "
+                  f"{list(selected)} over {others}")
+
+    def select_for_signals(self, signals):
+        return self.covering_dbcs({signal: [dbc_file for dbc_file, _, _ in self.signal_locations(signal)]
+                                   for signal in signals})
+
+    # frame_counts: {frame ID: frames seen}, so the DBCs of the busiest frames win ties
+    def select_for_frame_ids(self, frame_counts):
+        return self.covering_dbcs({frame_id: self.dbcs_for_frame_id(frame_id) for frame_id in frame_counts},
+                                  frame_counts)
+
+
+# Function to count the frame IDs of a log from a sample of it (head plus strided blocks, see can_preview.py)
+def observed_frame_ids(csv_file_path):
+    frame_ids = np.concatenate([frame_ids_from_text(block['Frame ID']) for block in sample_log(csv_file_path)])
+    ids, counts = np.unique(frame_ids[frame_ids >= 0], return_counts=True)
+    return dict(zip(ids.tolist(), counts.tolist()))
+
+
+# Function to choose the DBCs for a log from the library: the smallest set defining the frame IDs seen in it
+# Returns (DBC file paths, frame IDs no DBC of the library defines)
+def select_dbcs_for_log(csv_file_path, dbc_directory=DEFAULT_DBC_DIRECTORY):
+    catalog = build_catalog(dbc_directory)
+    dbc_files, unknown_ids = catalog.select_for_frame_ids(observed_frame_ids(csv_file_path))
+    return [catalog.path(dbc_file) for dbc_file in dbc_files], unknown_ids
+
+
+# Function to choose the DBCs that define a list of signals; raises KeyError when the library lacks one of them
+def select_dbcs_for_signals(signals, dbc_directory=DEFAULT_DBC_DIRECTORY):
+    catalog = build_catalog(dbc_directory)
+    dbc_files, missing = catalog.select_for_signals(signals)
+    if missing:
+        raise KeyError(f"No DBC in {dbc_directory} defines the signal(s) {missing}")
+    return [catalog.path(dbc_file) for dbc_file in dbc_files]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog a DBC library and pick the DBCs for logs or signals")
+    parser.add_argument('--dir', default=DEFAULT_DBC_DIRECTORY, help="DBC directory")
+    parser.add_argument('--rebuild', action='store_true', help="Parse every DBC again instead of using the cache")
+    parser.add_argument('--signal', action='append', default=[], help="Signal to look up (repeat for several)")
+    parser.add_argument('--log', action='append', default=[], help="Log to pick the DBCs for (repeat for several)")
+    args = parser.parse_args()
+
+    catalog = build_catalog(args.dir, args.rebuild)
+    print(f"{len(catalog.dbc_files)} DBC(s), {len(catalog.frame_id_index)} frame ID(s), "
+          f"{len(catalog.signal_index)} signal name(s) in {catalog.directory}")
+    for signal in args.signal:
+        for dbc_file, message_name, frame_id in catalog.signal_locations(signal) or [(None, None, None)]:
+            print(f"{signal}: " + (f"{dbc_file} / {message_name} ({frame_id:08X})" if dbc_file else "not found"))
+    if args.signal:
+        dbc_files, missing = catalog.select_for_signals(args.signal)
+        print(f"DBCs for the signals: {dbc_files}" + (f", not found: {missing}" if missing else ""))
+    for csv_file_path in args.log:
+        dbc_files, unknown_ids = catalog.select_for_frame_ids(observed_frame_ids(csv_file_path))
+        print(f"{csv_file_path}: {dbc_files}" +
+              (f", frame IDs in no DBC: {[f'{frame_id:08X}' for frame_id in unknown_ids]}" if unknown_ids else ""))
+
+
+if __name__ == '__main__':
+    main()
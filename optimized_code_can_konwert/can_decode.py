@@ -0,0 +1,411 @@
+import numpy as np
+import pandas as pd
+import cantools
+from cantools.database.namedsignalvalue import NamedSignalValue
+
+# Signals summarised with 'max' instead of 'mean' in the per-second aggregates (same rule as newaltered.py)
+MAX_AGGREGATED_SIGNALS = ['Battery_Current', 'Battery_Voltage']
+
+# Value of every ASCII hex digit, 255 for any other character
+HEX_DIGIT_VALUES = np.full(256, 255, dtype=np.uint8)
+for digit in '0123456789ABCDEF':
+    HEX_DIGIT_VALUES[ord(digit)] = HEX_DIGIT_VALUES[ord(digit.lower())] = int(digit, 16)
+
+# Columns carrying the payload bytes of traces read with their frame arrays (see can_traces.batch_frame) instead of
+# the 'Data' hex text; a CAN FD frame fills up to 64 of them
+PAYLOAD_BYTE_COLUMNS = [f'Byte {i}' for i in range(64)]
+
+# What to do with a frame ID defined by more than one DBC in a prefixed routing table:
+# 'first' / 'last' keep the message of the first / last DBC, 'all' decodes it into the columns of every DBC
+# that defines it, 'error' refuses the combination
+DBC_CONFLICT_RULES = ['first', 'last', 'all', 'error']
+
+
+# Function to load one or more DBC files
+def load_dbc_files(dbc_file_paths):
+    return [cantools.database.load_file(dbc_file_path) for dbc_file_path in dbc_file_paths]
+
+
+# Function to build a frame ID -> message lookup table, so decoding does not scan db.messages for every row
+def build_routing_table(dbs):
+    routing_table = {}
+    for db in dbs:
+        for message in db.messages:
+            # The first DBC that defines a frame ID wins
+            routing_table.setdefault(message.frame_id, message)
+    return routing_table
+
+
+# Function to build the column prefixes of N DBCs: dbc1_, dbc2_, ...
+def dbc_prefixes(count):
+    return [f"dbc{i + 1}_" for i in range(count)]
+
+
+# Function to merge any number of DBCs into one frame ID -> [(column prefix, message)] table
+def build_prefixed_routing_table(dbs, prefixes=None, conflict='first'):
+    if conflict not in DBC_CONFLICT_RULES:
+        raise ValueError(f"Unknown DBC conflict rule {conflict!r}, expected one of {DBC_CONFLICT_RULES}")
+    prefixes = prefixes or dbc_prefixes(len(dbs))
+    routing_table = {}
+    for prefix, db in zip(prefixes, dbs):
+        for message in db.messages:
+            routes = routing_table.setdefault(message.frame_id, [])
+            if routes and conflict == 'error':
+                raise ValueError(f"Frame ID {message.frame_id:08X} is defined by both {routes[0][0]} and {prefix} DBCs")
+            if routes and conflict == 'first':
+                continue
+            if routes and conflict == 'last':
+                routes.clear()
+            routes.append((prefix, message))
+    return routing_table
+
+
+# Function to list the prefixed signal columns of a prefixed routing table, grouped by DBC in prefix order
+def prefixed_signal_names(routing_table, prefixes):
+    signal_names = []
+    for prefix in prefixes:
+        for routes in routing_table.values():
+            for route_prefix, message in routes:
+                if route_prefix != prefix:
+                    continue
+                for signal in message.signals:
+                    if prefix + signal.name not in signal_names:
+                        signal_names.append(prefix + signal.name)
+    return signal_names
+
+
+# Function to list the signal names of a routing table in DBC order, without duplicates
+def routing_signal_names(routing_table):
+    signal_names = []
+    for message in routing_table.values():
+        for signal in message.signals:
+            if signal.name not in signal_names:
+                signal_names.append(signal.name)
+    return signal_names
+
+
+# Function to convert the logger's hex text columns into a frame ID and payload bytes
+def parse_frame_text(frame_id_text, data_text):
+    return int(frame_id_text, 16), bytes.fromhex(data_text.replace(' ', ''))
+
+
+# Function to decode a single CAN frame using the routing table
+def decode_frame(routing_table, frame_id, data):
+    message = routing_table.get(frame_id)
+    if message is None:
+        return {}
+    return decode_message(message, data)
+
+
+# Function to decode a payload with one message; by default choice signals keep their raw numbers so every
+# decoded value stays numeric
+def decode_message(message, data, decode_choices=False):
+    try:
+        return message.decode(data, decode_choices=decode_choices)
+    except Exception as e:
+        print(f"Error decoding frame {message.frame_id:08X} : {e}, data: {data.hex()}")
+        return {}
+
+
+# Function to parse the 'Data' hex text of one frame; None (with the error printed) for empty, NaN or malformed text,
+# so one bad row is skipped like an undecodable one instead of aborting the log
+def payload_bytes(message, data_text):
+    try:
+        return bytes.fromhex(str(data_text).replace(' ', ''))
+    except ValueError as e:
+        print(f"Error decoding frame {message.frame_id:08X} : {e}, data: {data_text}")
+        return None
+
+
+# Function to get the numbers of a decoded signal column; choice names (decode_choices=True) count as their raw
+# value, any other text is NaN
+def numeric_signal_values(column):
+    if column.dtype == object:
+        column = column.map(lambda value: value.value if isinstance(value, NamedSignalValue) else value)
+    return pd.to_numeric(column, errors='coerce')
+
+
+# Function to convert the 'Frame ID' hex text column into integers (-1 where the text is not a valid ID)
+def frame_ids_from_text(frame_id_column):
+    if pd.api.types.is_integer_dtype(frame_id_column.dtype):
+        # Numeric IDs of a trace read with its frame arrays
+        return frame_id_column.to_numpy(dtype=np.int64)
+    if isinstance(frame_id_column.dtype, pd.CategoricalDtype):
+        # Dictionary encoded column: convert each distinct ID once
+        category_ids = frame_ids_from_text(pd.Series(frame_id_column.cat.categories, dtype=object))
+        codes = frame_id_column.cat.codes.to_numpy()
+        return np.where(codes >= 0, category_ids[codes], -1)
+    frame_ids = np.full(len(frame_id_column), -1, dtype=np.int64)
+    for i, frame_id_text in enumerate(frame_id_column):
+        try:
+            frame_ids[i] = int(frame_id_text, 16)
+        except (TypeError, ValueError):
+            pass
+    return frame_ids
+
+
+# Function to parse the logger 'Data' hex text of many frames at once into a (frames x bytes) matrix
+# Both 'FE 01 5B' and 'FE015B' text is parsed; returns (payload matrix, payload lengths, parsed flags), rows with any
+# other text are not parsed and left to bytes.fromhex
+def payload_matrix(data_texts):
+    n = len(data_texts)
+    try:
+        text = np.asarray(data_texts, dtype='S')
+    except (UnicodeEncodeError, TypeError, ValueError):
+        return np.zeros((n, 0), dtype=np.uint8), np.zeros(n, dtype=np.int64), np.zeros(n, dtype=bool)
+    chars = text.view(np.uint8).reshape(n, text.itemsize)
+    text_lengths = np.count_nonzero(chars, axis=1)
+
+    # 'XX XX XX': every byte is two hex digits and a separator (the last one is the padding)
+    triples = np.pad(chars, ((0, 0), (0, 3 - chars.shape[1] % 3))).reshape(n, -1, 3)
+    lengths = (text_lengths + 1) // 3
+    in_payload = np.arange(triples.shape[1]) < lengths[:, None]
+    high = HEX_DIGIT_VALUES[triples[:, :, 0]]
+    low = HEX_DIGIT_VALUES[triples[:, :, 1]]
+    separated = (triples[:, :, 2] == ord(' ')) | (np.arange(triples.shape[1]) >= lengths[:, None] - 1)
+    parsed = ((text_lengths + 1) % 3 == 0) | (text_lengths == 0)
+    parsed &= ~(((high > 15) | (low > 15) | ~separated) & in_payload).any(axis=1)
+    payloads = np.where(in_payload, (high << 4) | low, 0).astype(np.uint8)
+
+    # 'XXXXXX': the same digits without separators
+    compact = np.flatnonzero(~parsed & (text_lengths % 2 == 0))
+    if len(compact):
+        pairs = np.pad(chars[compact], ((0, 0), (0, chars.shape[1] % 2))).reshape(len(compact), -1, 2)
+        compact_lengths = text_lengths[compact] // 2
+        in_compact = np.arange(pairs.shape[1]) < compact_lengths[:, None]
+        high = HEX_DIGIT_VALUES[pairs[:, :, 0]]
+        low = HEX_DIGIT_VALUES[pairs[:, :, 1]]
+        compact_parsed = ~(((high > 15) | (low > 15)) & in_compact).any(axis=1)
+        width = max(payloads.shape[1], pairs.shape[1])
+        payloads = np.pad(payloads, ((0, 0), (0, width - payloads.shape[1])))
+        payloads[compact, :pairs.shape[1]] = np.where(in_compact, (high << 4) | low, 0)
+        lengths[compact] = compact_lengths
+        parsed[compact] = compact_parsed
+    return payloads, lengths, parsed
+
+
+# Function to check whether a message can be decoded in bulk: no container frames, integer signals that fit int64
+# and IEEE float signals
+def batch_decodable(message):
+    if message.is_container:
+        return False
+    for signal in message.signals:
+        if signal.is_float and signal.length not in (32, 64):
+            return False
+        if not signal.is_float and signal.length > (64 if signal.is_signed else 63):
+            return False
+    return True
+
+
+# Function to read the raw bits of one signal from every row of a payload matrix, following the DBC bit numbering
+# of its byte order (little endian: start is the lowest bit; big endian: start is the highest bit, counted
+# downwards and on into the next byte)
+def signal_raw_bits(payloads, signal):
+    value = np.zeros(len(payloads), dtype=np.uint64)
+    remaining = signal.length
+    byte = signal.start // 8
+    if signal.byte_order == 'little_endian':
+        low = signal.start % 8
+        shift = 0
+        while remaining:
+            take = min(8 - low, remaining)
+            part = (payloads[:, byte].astype(np.uint64) >> np.uint64(low)) & np.uint64((1 << take) - 1)
+            value |= part << np.uint64(shift)
+            shift += take
+            remaining -= take
+            byte += 1
+            low = 0
+    else:
+        high = signal.start % 8
+        while remaining:
+            take = min(high + 1, remaining)
+            part = (payloads[:, byte].astype(np.uint64) >> np.uint64(high + 1 - take)) & np.uint64((1 << take) - 1)
+            value = (value << np.uint64(take)) | part
+            remaining -= take
+            byte += 1
+            high = 7
+    return value
+
+
+# Function to turn raw signal bits into raw values (sign, IEEE float) and then into the values message.decode
+# returns: integer scale and offset keep integers, any other scaling gives floats, as in cantools' conversions
+# Returns (values, numeric values before choice names)
+def signal_values(raw, signal, decode_choices):
+    if signal.is_float and signal.length == 32:
+        with np.errstate(invalid='ignore'):
+            raw_values = raw.astype(np.uint32).view(np.float32).astype(np.float64)
+    elif signal.is_float:
+        raw_values = raw.view(np.float64)
+    elif signal.is_signed and signal.length == 64:
+        raw_values = raw.view(np.int64)
+    elif signal.is_signed:
+        raw_values = raw.astype(np.int64) - np.where(raw >> np.uint64(signal.length - 1), 1 << signal.length, 0)
+    else:
+        raw_values = raw.astype(np.int64)
+    if signal.scale == 1 and signal.offset == 0:
+        numeric = raw_values
+    elif float(signal.scale).is_integer() and float(signal.offset).is_integer() and not signal.is_float:
+        numeric = raw_values * int(signal.scale) + int(signal.offset)
+    else:
+        numeric = raw_values * signal.scale + signal.offset
+    if not (decode_choices and signal.choices):
+        return numeric, numeric
+    values = numeric.astype(object)
+    keys = raw_values.astype(np.int64)
+    for key, choice in signal.choices.items():
+        values[keys == key] = choice
+    return values, numeric
+
+
+# Function to decode the rows of one signal layout (the unmultiplexed signals, or those of one multiplexer value)
+# and recurse into the layouts selected by its multiplexer signals; rows whose multiplexer value no layout defines
+# are collected in rejected
+def decode_layout(message, payloads, rows, signals, decode_choices, parts, rejected):
+    layout_payloads = payloads[rows]
+    for signal in signals:
+        raw = signal_raw_bits(layout_payloads, signal)
+        values, numeric = signal_values(raw, signal, decode_choices)
+        parts.setdefault(signal.name, []).append((rows, values))
+        if not signal.is_multiplexer:
+            continue
+        # Multiplexer value as cantools takes it: the scaled value, or the raw key of a choice name
+        mux = np.trunc(numeric).astype(np.int64)
+        if decode_choices and signal.choices:
+            keys = raw.astype(np.int64)
+            mux = np.where(np.isin(keys, list(signal.choices)), keys, mux)
+        children = [child for child in message.signals if child.multiplexer_signal == signal.name]
+        mux_ids = {mux_id for child in children for mux_id in child.multiplexer_ids}
+        for mux_id in np.unique(mux).tolist():
+            group = rows[mux == mux_id]
+            if mux_id not in mux_ids:
+                rejected.append(group)
+                continue
+            decode_layout(message, payloads, group, [child for child in children if mux_id in child.multiplexer_ids],
+                          decode_choices, parts, rejected)
+
+
+# Function to decode all frames of one message at once: the payloads (up to 64 bytes for CAN FD) are parsed into a
+# byte matrix, every signal is read for all rows with array operations, and multiplexed messages are split by
+# multiplexer value so each group is decoded with its own signal layout (nested multiplexers too)
+# Returns {signal name: (row positions, values)}, a sparse form: a multiplexed signal only lists the rows whose
+# layout carries it. Rows that cannot be decoded in bulk (malformed text, short payload, undefined multiplexer
+# value) go through decode_message one by one, as before; rows whose text is not hex at all decode to nothing.
+def decode_message_batch(message, data_texts, decode_choices=False):
+    data_texts = np.asarray(data_texts, dtype=object)
+    payloads, lengths, parsed = payload_matrix(data_texts)
+    return decode_payload_matrix(message, payloads, lengths, parsed,
+                                 lambda position: payload_bytes(message, data_texts[position]), decode_choices)
+
+
+# Function to decode frames received as payload bytes (a live bus) at once, like decode_message_batch
+def decode_payloads_batch(message, payloads, decode_choices=False):
+    lengths = np.fromiter(map(len, payloads), dtype=np.int64, count=len(payloads))
+    matrix = np.zeros((len(payloads), int(lengths.max(initial=0))), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(payloads)), lengths)
+    columns = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix[rows, columns] = np.frombuffer(b''.join(payloads), dtype=np.uint8)
+    return decode_payload_matrix(message, matrix, lengths, np.ones(len(payloads), dtype=bool),
+                                 lambda position: bytes(payloads[position]), decode_choices)
+
+
+# Function to decode a payload matrix (see payload_matrix) with one message; row_data(position) gives the payload
+# bytes of a row the bulk path leaves to decode_message (None to skip it)
+def decode_payload_matrix(message, payloads, lengths, parsed, row_data, decode_choices=False):
+    parts = {}
+    rejected = []
+    bulk = parsed & (lengths >= message.length) if batch_decodable(message) else np.zeros(len(payloads), bool)
+    if bulk.any():
+        # Longer payloads are cut to the message length, like message.decode does
+        payloads = np.pad(payloads, ((0, 0), (0, max(message.length - payloads.shape[1], 0))))[:, :message.length]
+        decode_layout(message, payloads, np.flatnonzero(bulk),
+                      [signal for signal in message.signals if signal.multiplexer_signal is None], decode_choices,
+                      parts, rejected)
+    fallback = np.flatnonzero(~bulk)
+    if rejected:
+        rejected = np.concatenate(rejected)
+        parts = {name: [(rows[~np.isin(rows, rejected)], values[~np.isin(rows, rejected)]) for rows, values in pieces]
+                 for name, pieces in parts.items()}
+        fallback = np.sort(np.concatenate([fallback, rejected]))
+    for position in fallback.tolist():
+        data = row_data(position)
+        for name, value in (decode_message(message, data, decode_choices) if data is not None else {}).items():
+            parts.setdefault(name, []).append((np.array([position]), np.array([value], dtype=object)))
+
+    decoded = {}
+    for name, pieces in parts.items():
+        rows = np.concatenate([rows for rows, _ in pieces])
+        values = np.concatenate([values for _, values in pieces])
+        order = np.argsort(rows, kind='stable')
+        decoded[name] = (rows[order], values[order])
+    return decoded
+
+
+# Function to get the bulk decoder of the rows of a logger DataFrame: decode(message, positions, decode_choices) reads
+# the payload byte columns and 'Length' of a trace read with its frame arrays straight into decode_payload_matrix,
+# and parses the 'Data' hex text of any other log
+def rows_decoder(df_csv):
+    if 'Data' in df_csv.columns or 'Length' not in df_csv.columns:
+        data_column = df_csv['Data'].to_numpy()
+        return lambda message, positions, decode_choices: decode_message_batch(message, data_column[positions],
+                                                                                decode_choices)
+    payloads = df_csv[[column for column in PAYLOAD_BYTE_COLUMNS if column in df_csv.columns]].to_numpy(dtype=np.uint8)
+    lengths = df_csv['Length'].to_numpy(dtype=np.int64)
+
+    def decode(message, positions, decode_choices):
+        group = payloads[positions]
+        group_lengths = lengths[positions]
+        return decode_payload_matrix(message, group, group_lengths, np.ones(len(positions), dtype=bool),
+                                     lambda position: bytes(group[position, :group_lengths[position]]),
+                                     decode_choices)
+    return decode
+
+
+# Function to build the DataFrame of one message's signals from decode_message_batch output; with sparse, the
+# multiplexed signals become pandas sparse columns instead of mostly empty dense ones
+def batch_frame(message, decoded, index, sparse=False):
+    columns = {}
+    for signal in message.signals:
+        rows, values = decoded.get(signal.name, (np.array([], dtype=np.int64), np.array([])))
+        column = pd.Series(values, index=rows, dtype=values.dtype)
+        if values.dtype == object:
+            column = column.infer_objects()
+        # NaN in the rows whose layout does not carry the signal
+        column = column.reindex(range(len(index))).to_numpy()
+        columns[signal.name] = pd.arrays.SparseArray(column) if sparse and signal.multiplexer_ids else column
+    return pd.DataFrame(columns, index=index, columns=[signal.name for signal in message.signals])
+
+
+# Function to decode a logger DataFrame one frame ID group at a time, each group in bulk (see decode_message_batch)
+# Returns {frame_id: DataFrame of that message's signals, indexed like the rows of df_csv it came from}; with
+# sparse, multiplexed signals are sparse columns
+def decode_by_frame(df_csv, routing_table, sparse=False):
+    frame_ids = frame_ids_from_text(df_csv['Frame ID'])
+    decode_rows = rows_decoder(df_csv)
+    decoded = {}
+    for frame_id, positions in pd.Series(frame_ids).groupby(frame_ids).indices.items():
+        message = routing_table.get(int(frame_id))
+        if message is None:
+            continue
+        decoded[message.frame_id] = batch_frame(message, decode_rows(message, positions, False),
+                                                df_csv.index[positions], sparse)
+    return decoded
+
+
+# Function to decode a logger DataFrame against a prefixed routing table in a single pass over the log
+# Every frame ID group is decoded in bulk once per routed message; the result has one prefixed column per signal
+# (see prefixed_signal_names) and is indexed like df_csv, with NaN where a frame does not carry the signal
+def decode_prefixed(df_csv, routing_table, prefixes, decode_choices=False):
+    frame_ids = frame_ids_from_text(df_csv['Frame ID'])
+    decode_rows = rows_decoder(df_csv)
+    parts = []
+    for frame_id, positions in pd.Series(frame_ids).groupby(frame_ids).indices.items():
+        routes = routing_table.get(int(frame_id))
+        if not routes:
+            continue
+        index = df_csv.index[positions]
+        parts.append(pd.concat([batch_frame(message, decode_rows(message, positions, decode_choices),
+                                            index).add_prefix(prefix) for prefix, message in routes], axis=1))
+    columns = prefixed_signal_names(routing_table, prefixes)
+    if not parts:
+        return pd.DataFrame(index=df_csv.index, columns=columns, dtype=float)
+    return pd.concat(parts).reindex(index=df_csv.index, columns=columns)
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+# Columns of a change-only output: one row per signal sample that differs from the previously written one
+DELTA_COLUMNS = ['timestamp_ns', 'signal', 'value']
+
+# Searching the next sample outside the deadband: the first DEADBAND_SCALAR_ROWS samples are compared one by one
+# (short gaps of noisy signals), the rest in numpy windows of DEADBAND_SEARCH_ROWS that double while no sample
+# leaves the band (long gaps of slowly moving signals)
+DEADBAND_SCALAR_ROWS = 4
+DEADBAND_SEARCH_ROWS = 64
+
+# After this many steps, a signal averaging fewer samples per step than DEADBAND_LOOP_SPACING changes too often for
+# stepping to pay off and the rest of its chunk goes through a plain loop
+DEADBAND_LOOP_STEPS = 64
+DEADBAND_LOOP_SPACING = 32
+
+
+# Function to find the first sample from position on that is more than the deadband from the reference value
+# (len(values) when there is none)
+def next_outside_band(values, position, reference, deadband):
+    scalar_end = min(position + DEADBAND_SCALAR_ROWS, len(values))
+    for i in range(position, scalar_end):
+        if abs(values[i] - reference) > deadband:
+            return i
+    position = scalar_end
+    window = DEADBAND_SEARCH_ROWS
+    while position < len(values):
+        outside = np.flatnonzero(np.abs(values[position:position + window] - reference) > deadband)
+        if len(outside):
+            return position + int(outside[0])
+        position += window
+        window *= 2
+    return len(values)
+
+
+# Function to mark the samples that move more than the deadband away from the last written value
+# Each kept sample becomes the reference of the next ones, so the samples are not visited one by one but in steps:
+# the next sample outside the band around the reference is searched (next_outside_band), and the run of samples
+# that each move more than the deadband from the one before it is kept whole after it. A step costs a few scalar
+# comparisons or array operations, and there is one per such run: slowly moving signals take a handful per chunk.
+# A signal changing every few samples falls back to a loop over every sample, the cost of the plain method.
+def deadband_mask(values, last_value, deadband):
+    keep = np.zeros(len(values), dtype=bool)
+    # Last samples of the runs of large steps: the samples followed by one within the deadband of them
+    run_ends = np.flatnonzero(np.concatenate([np.abs(np.diff(values)) <= deadband, [True]]))
+    position = 0
+    steps = 0
+    while position < len(values):
+        if steps >= DEADBAND_LOOP_STEPS and position < steps * DEADBAND_LOOP_SPACING:
+            for i, value in enumerate(values[position:].tolist(), position):
+                if abs(value - last_value) > deadband:
+                    keep[i] = True
+                    last_value = value
+            break
+        steps += 1
+        found = position if last_value is None else next_outside_band(values, position, last_value, deadband)
+        if found == len(values):
+            break
+        end = int(run_ends[np.searchsorted(run_ends, found)]) + 1
+        keep[found:end] = True
+        last_value = values[end - 1]
+        position = end
+    return keep
+
+
+# Change-only encoder; keeps the last written value of every signal so it can be fed one chunk at a time
+class DeltaEncoder:
+    def __init__(self, deadbands=None):
+        self.deadbands = deadbands or {}
+        self.last_written = {}
+        self.last_seen = {}
+
+    # Returns the change rows of one decoded chunk (rows without a value for a signal are ignored for it)
+    def encode(self, timestamps_ns, decoded_df):
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        parts = []
+        for signal in decoded_df.columns:
+            column = decoded_df[signal]
+            present = column.notna().to_numpy()
+            if not present.any():
+                continue
+            times = timestamps_ns[present]
+            numeric = pd.to_numeric(column[present], errors='coerce')
+            # Non-numeric values (e.g. choice names) are compared as text and never use a deadband
+            values = numeric.to_numpy(dtype=float) if numeric.notna().all() else column[present].astype(str).to_numpy()
+            last_value = self.last_written.get(signal, (None, None))[1]
+            deadband = self.deadbands.get(signal)
+            if deadband and values.dtype.kind == 'f':
+                keep = deadband_mask(values, last_value, deadband)
+            else:
+                keep = np.ones(len(values), dtype=bool)
+                keep[1:] = values[1:] != values[:-1]
+                keep[0] = last_value is None or values[0] != last_value
+            self.last_seen[signal] = (times[-1], values[-1])
+            if keep.any():
+                kept = np.flatnonzero(keep)
+                self.last_written[signal] = (times[kept[-1]], values[kept[-1]])
+                parts.append(pd.DataFrame({'timestamp_ns': times[kept], 'signal': signal, 'value': values[kept]}))
+        return combine_delta_parts(parts)
+
+    # Returns the last observation of every signal that was not written, so readers know where each signal ends
+    def finish(self):
+        parts = []
+        for signal, (seen_time, value) in self.last_seen.items():
+            if self.last_written.get(signal, (None, None))[0] != seen_time:
+                parts.append(pd.DataFrame({'timestamp_ns': [seen_time], 'signal': [signal], 'value': [value]}))
+                self.last_written[signal] = (seen_time, value)
+        return combine_delta_parts(parts)
+
+
+# Function to merge per-signal change rows into one time-ordered frame
+def combine_delta_parts(parts):
+    if not parts:
+        return pd.DataFrame(columns=DELTA_COLUMNS)
+    return pd.concat(parts, ignore_index=True).sort_values('timestamp_ns', kind='stable').reset_index(drop=True)
+
+
+# Function to change-encode a whole decoded table at once
+def delta_encode(timestamps_ns, decoded_df, deadbands=None):
+    encoder = DeltaEncoder(deadbands)
+    return combine_delta_parts([encoder.encode(timestamps_ns, decoded_df), encoder.finish()])
+
+
+# Function to read a change-only CSV written by the extraction scripts
+def read_delta_csv(csv_file_path):
+    delta_df = pd.read_csv(csv_file_path)
+    numeric = pd.to_numeric(delta_df['value'], errors='coerce')
+    if numeric.notna().sum() == delta_df['value'].notna().sum():
+        delta_df['value'] = numeric
+    return delta_df
+
+
+# Function to reconstruct the held value of each signal at the given timestamps (NaN before its first sample)
+def held_values(delta_df, timestamps_ns, signals=None):
+    timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+    result = pd.DataFrame(index=pd.Index(timestamps_ns, name='timestamp_ns'))
+    for signal, group in delta_df.groupby('signal', sort=False):
+        if signals is not None and signal not in signals:
+            continue
+        times = group['timestamp_ns'].to_numpy(dtype=np.int64)
+        values = group['value'].to_numpy()
+        positions = np.searchsorted(times, timestamps_ns, side='right') - 1
+        held = pd.Series(values[np.clip(positions, 0, None)], index=result.index)
+        result[signal] = held.where(positions >= 0)
+    if signals is not None:
+        result = result.reindex(columns=list(signals))
+    return result
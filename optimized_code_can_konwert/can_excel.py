@@ -0,0 +1,108 @@
+import math
+import numbers
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+# Rows per worksheet, header row included (Excel's limit)
+EXCEL_MAX_ROWS = 1048576
+
+# Rows handed to the writer at a time when a whole DataFrame is exported
+EXCEL_WRITE_CHUNK_ROWS = 100000
+
+
+# Streaming Excel writer: rows go straight to disk in xlsxwriter's constant-memory mode, so the workbook is never
+# held in memory, and a new sheet (with the header repeated) is started whenever the current one is full.
+# Rows must be written in order, one chunk at a time; missing values become empty cells.
+class StreamingExcelWriter:
+    def __init__(self, excel_file_path, columns=None, sheet_prefix='Sheet', max_rows=EXCEL_MAX_ROWS):
+        self.excel_file_path = excel_file_path
+        self.workbook = xlsxwriter.Workbook(excel_file_path, {'constant_memory': True})
+        self.columns = list(columns) if columns is not None else None
+        self.sheet_prefix = sheet_prefix
+        self.max_rows = max_rows
+        self.worksheet = None
+        self.row = 0
+        self.sheet_count = 0
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def new_sheet(self):
+        self.sheet_count += 1
+        self.worksheet = self.workbook.add_worksheet(f"{self.sheet_prefix}{self.sheet_count}")
+        self.worksheet.write_row(0, 0, [str(column) for column in self.columns])
+        self.row = 1
+
+    # Appends the rows of one DataFrame chunk; later chunks are aligned to the columns of the first one
+    def write_frame(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        else:
+            df = df.reindex(columns=self.columns)
+        if self.worksheet is None:
+            self.new_sheet()
+        cell_writers = [self.cell_writer(df.iloc[:, i]) for i in range(len(self.columns))]
+        column_values = [column_cells(df.iloc[:, i]) for i in range(len(self.columns))]
+        for row_values in zip(*column_values):
+            if self.row >= self.max_rows:
+                self.new_sheet()
+            for col, (write_cell, value) in enumerate(zip(cell_writers, row_values)):
+                if value is not None:
+                    write_cell(self.row, col, value)
+            self.row += 1
+        self.rows_written += len(df)
+
+    # Picks the cell writer once per column instead of letting xlsxwriter guess the type of every cell
+    def cell_writer(self, column):
+        if pd.api.types.is_bool_dtype(column):
+            return lambda row, col, value: self.worksheet.write_boolean(row, col, value)
+        if pd.api.types.is_numeric_dtype(column):
+            return lambda row, col, value: self.worksheet.write_number(row, col, value)
+        return self.write_cell
+
+    # Writes one cell of a mixed column: numbers as numeric cells, everything else as text
+    def write_cell(self, row, col, value):
+        if isinstance(value, numbers.Number) and not isinstance(value, bool):
+            if math.isfinite(value):
+                self.worksheet.write_number(row, col, value)
+        else:
+            self.worksheet.write_string(row, col, str(value))
+
+    def close(self):
+        # An export without rows still gets its header (or an empty sheet) so the workbook is valid
+        if self.worksheet is None and self.columns is not None:
+            self.new_sheet()
+        elif self.worksheet is None:
+            self.workbook.add_worksheet()
+        self.workbook.close()
+        return self.sheet_count
+
+
+# Function to convert a column into Python values for the writer, with None for the cells that stay empty
+# ('null' placeholders, NaN and infinities included)
+def column_cells(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        column = column.dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    if pd.api.types.is_float_dtype(column):
+        missing = ~np.isfinite(column.to_numpy(dtype=float, na_value=np.nan))
+    elif column.dtype == object or isinstance(column.dtype, pd.StringDtype):
+        missing = column.isna().to_numpy() | (column == 'null').fillna(False).to_numpy(dtype=bool)
+    else:
+        missing = column.isna().to_numpy()
+    values = column.astype(object).tolist()
+    for i in missing.nonzero()[0]:
+        values[i] = None
+    return values
+
+
+# Function to export a whole DataFrame through the streaming writer; returns the number of sheets written
+def write_excel_streaming(df, excel_file_path, sheet_prefix='Sheet', max_rows=EXCEL_MAX_ROWS):
+    with StreamingExcelWriter(excel_file_path, df.columns, sheet_prefix, max_rows) as writer:
+        for start in range(0, len(df), EXCEL_WRITE_CHUNK_ROWS):
+            writer.write_frame(df.iloc[start:start + EXCEL_WRITE_CHUNK_ROWS])
+    return writer.sheet_count
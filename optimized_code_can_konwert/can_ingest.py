@@ -0,0 +1,197 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from can_compressed import open_logger_input, read_block_index, open_log_window
+from can_memory import chunk_rows
+from can_timestamps import logger_timestamps_ns, datetime_to_ns
+from can_traces import trace_format, read_trace
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+# Column names of the logger CSV export, in file order
+LOGGER_COLUMNS = ['Index', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
+
+# Columns the decoders need: timestamps, frame ID and payload ('Index', 'Type' and 'Length' are never used)
+DECODE_COLUMNS = ['Timestamp', 'Time', 'Frame ID', 'Data']
+
+# Rows before the data: two metadata rows and the header row (replaced by LOGGER_COLUMNS)
+LOGGER_SKIP_ROWS = 3
+
+# Fixed schema of the logger CSV; 'Type' and 'Frame ID' repeat a handful of values, so they are dictionary encoded
+PANDAS_DTYPES = {'Index': 'int64', 'Timestamp': 'string', 'Time': 'string', 'Type': 'category',
+                 'Frame ID': 'category', 'Length': 'int64', 'Data': 'string'}
+ARROW_TYPES = None if pa is None else {
+    'Index': pa.int64(), 'Timestamp': pa.string(), 'Time': pa.string(), 'Type': pa.dictionary(pa.int32(), pa.string()),
+    'Frame ID': pa.dictionary(pa.int32(), pa.string()), 'Length': pa.int64(), 'Data': pa.string()}
+
+# Bytes handed to each Arrow parser thread at a time
+ARROW_BLOCK_SIZE = 16 << 20
+
+CSV_ENGINES = ['auto', 'arrow', 'pandas']
+
+
+# Function to read the logger CSV export with the fixed schema
+# columns prunes the result to the listed columns (all of LOGGER_COLUMNS by default); with chunksize an iterator
+# of DataFrames is returned, numbered continuously like pandas chunks. chunksize may also be a
+# can_memory.ChunkScheduler, which is asked for the size of every chunk. engine 'auto' uses the multithreaded Arrow
+# reader when pyarrow is installed and falls back to the pandas C engine when it is not or cannot parse the file.
+# Compressed logs (.gz, .zst, .xz) are read as a stream decompressed in a background thread while parsing runs.
+# BLF/ASC/TRC traces are read straight from the binary/trace file into the same schema (see can_traces.py); callers
+# that only decode, time and count the frames pass payload_arrays to get a trace's frame arrays instead of the 'Data'
+# and 'Frame ID' text (see can_traces.batch_frame). Logger CSVs are read the same either way.
+def read_logger_csv(csv_file_path, chunksize=None, columns=None, engine='auto', payload_arrays=False):
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV engine {engine!r}, expected one of {CSV_ENGINES}")
+    columns = [column for column in LOGGER_COLUMNS if columns is None or column in columns]
+    if trace_format(csv_file_path):
+        return read_trace(csv_file_path, chunksize, columns, payload_arrays)
+    if engine == 'pandas' or pa_csv is None:
+        if engine == 'arrow':
+            raise ImportError("The arrow CSV engine needs pyarrow")
+        return read_logger_csv_pandas(csv_file_path, chunksize, columns)
+    if chunksize is not None:
+        return read_logger_csv_arrow_chunks(csv_file_path, chunksize, columns, engine == 'auto')
+    try:
+        return read_logger_csv_arrow(open_logger_input(csv_file_path), columns)
+    except pa.ArrowInvalid as e:
+        if engine == 'arrow':
+            raise
+        print(f"Arrow CSV reader failed on {csv_file_path} ({e}), falling back to pandas")
+        return read_logger_csv_pandas(csv_file_path, chunksize, columns)
+
+
+# Function to read the logger CSV with the pandas C engine
+def read_logger_csv_pandas(csv_file_path, chunksize, columns):
+    scheduled = hasattr(chunksize, 'next_rows')
+    reader = pd.read_csv(open_logger_input(csv_file_path), delimiter=';', skiprows=LOGGER_SKIP_ROWS, header=None,
+                         names=LOGGER_COLUMNS, usecols=columns,
+                         dtype={column: PANDAS_DTYPES[column] for column in columns},
+                         chunksize=None if scheduled else chunksize, iterator=scheduled)
+    return read_scheduled_chunks(reader, chunksize) if scheduled else reader
+
+
+# Function to read pandas chunks of the size the scheduler asks for at every step
+def read_scheduled_chunks(reader, scheduler):
+    with reader:
+        while True:
+            try:
+                yield reader.get_chunk(scheduler.next_rows())
+            except StopIteration:
+                return
+
+
+# Function to build the Arrow CSV options for the fixed schema
+def arrow_csv_options(columns):
+    read_options = pa_csv.ReadOptions(skip_rows=LOGGER_SKIP_ROWS, column_names=LOGGER_COLUMNS, use_threads=True,
+                                      block_size=ARROW_BLOCK_SIZE)
+    parse_options = pa_csv.ParseOptions(delimiter=';')
+    convert_options = pa_csv.ConvertOptions(column_types={column: ARROW_TYPES[column] for column in columns},
+                                            include_columns=columns, strings_can_be_null=False)
+    return read_options, parse_options, convert_options
+
+
+# Function to read the whole logger CSV with the multithreaded Arrow reader
+def read_logger_csv_arrow(csv_file_path, columns):
+    read_options, parse_options, convert_options = arrow_csv_options(columns)
+    return pa_csv.read_csv(csv_file_path, read_options, parse_options, convert_options).to_pandas()
+
+
+# Function to stream the logger CSV in chunks of chunksize rows with the Arrow reader
+# Blocks are parsed by the Arrow reader and re-cut into chunks of the requested size
+def read_logger_csv_arrow_chunks(csv_file_path, chunksize, columns, fallback=True):
+    read_options, parse_options, convert_options = arrow_csv_options(columns)
+    try:
+        reader = pa_csv.open_csv(open_logger_input(csv_file_path), read_options, parse_options, convert_options)
+    except pa.ArrowInvalid as e:
+        if not fallback:
+            raise
+        print(f"Arrow CSV reader failed on {csv_file_path} ({e}), falling back to pandas")
+        yield from read_logger_csv_pandas(csv_file_path, chunksize, columns)
+        return
+    pending = []
+    pending_rows = 0
+    start = 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        rows = chunk_rows(chunksize)
+        while pending_rows >= rows:
+            table = pa.Table.from_batches(pending)
+            yield arrow_chunk_frame(table.slice(0, rows), start)
+            start += rows
+            pending = table.slice(rows).to_batches()
+            pending_rows -= rows
+            rows = chunk_rows(chunksize)
+    if pending_rows:
+        yield arrow_chunk_frame(pa.Table.from_batches(pending), start)
+
+
+# Function to convert one Arrow chunk to pandas, with the row numbers continuing from the previous chunk
+def arrow_chunk_frame(table, start):
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+# Function to read only the frames of a log between start and end (datetimes, strings or epoch ns), in chunks
+# Yields (timestamps_ns, chunk) pairs. Seekable compressed logs (written by can_compressed.py) decompress only the
+# blocks overlapping the window; other logs are streamed until the first chunk past the end of the window.
+def read_logger_window(csv_file_path, start=None, end=None, chunksize=100000, columns=None, engine='auto'):
+    start_ns = None if start is None else datetime_to_ns(start)
+    end_ns = None if end is None else datetime_to_ns(end)
+    block_index = read_block_index(csv_file_path) if isinstance(csv_file_path, str) else None
+    source, previous_ns = csv_file_path, None
+    if block_index is not None:
+        source, previous_ns = open_log_window(csv_file_path, block_index, start_ns, end_ns)
+        if source is None:
+            return
+    for chunk in read_logger_csv(source, chunksize=chunksize, columns=columns, engine=engine):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = timestamps_ns[-1]
+        in_window = np.ones(len(chunk), dtype=bool)
+        if start_ns is not None:
+            in_window &= timestamps_ns >= start_ns
+        if end_ns is not None:
+            in_window &= timestamps_ns <= end_ns
+        if in_window.any():
+            yield timestamps_ns[in_window], chunk[in_window]
+        if end_ns is not None and timestamps_ns[-1] > end_ns:
+            break
+
+
+# Function to time the CSV engines on one file; returns {engine: seconds}
+def benchmark_engines(csv_file_path, columns=None, repeat=3):
+    results = {}
+    for engine in ['pandas', 'arrow']:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = read_logger_csv(csv_file_path, columns=columns, engine=engine)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[engine] = best
+        print(f"{engine:7s}: {best:.3f} s for {len(df)} rows, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the logger CSV readers (pandas C engine vs Arrow)")
+    parser.add_argument('csv_files', nargs='+', help="Logger CSV exports to read")
+    parser.add_argument('--decode-columns', action='store_true', help="Read only the columns the decoders need")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per engine, the best one is reported")
+    args = parser.parse_args()
+
+    for csv_file_path in args.csv_files:
+        print(csv_file_path)
+        results = benchmark_engines(csv_file_path, DECODE_COLUMNS if args.decode_columns else None, args.repeat)
+        print(f"arrow speed-up: {results['pandas'] / results['arrow']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from can_decode import load_dbc_files, build_routing_table, decode_by_frame
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_timestamps import logger_timestamps_ns, datetime_to_ns
+from can_rollup import ROLLUP_LEVELS, RollupPyramid, choose_rollup_level
+
+# Rows per Parquet row group; row groups are the unit the reader skips by time range
+ROW_GROUP_SIZE = 100000
+
+# Frames read, decoded and written per chunk (or a can_memory.ChunkScheduler sizing every chunk)
+LAKE_CHUNK_ROWS = 500000
+
+# Sidecar written in every log partition, listing its files with their statistics
+MANIFEST_FILE_NAME = '_manifest.json'
+
+
+# Function to build the partition directory of one log: <lake>/date=YYYY-MM-DD/vehicle=<vehicle>/log=<log name>
+def log_partition(lake_directory, date, vehicle, log_name):
+    return os.path.join(lake_directory, f"date={date}", f"vehicle={vehicle}", f"log={log_name}")
+
+
+# Function to compute the per-file statistics kept in the manifest
+def file_statistics(table_df, message):
+    stats = {'frame_id': f"{message.frame_id:08X}", 'message': message.name, 'rows': len(table_df),
+             'time_min': int(table_df['timestamp_ns'].min()), 'time_max': int(table_df['timestamp_ns'].max()),
+             'signals': {}}
+    for signal in message.signals:
+        values = table_df[signal.name]
+        stats['signals'][signal.name] = {
+            'min': None if values.isna().all() else float(values.min()),
+            'max': None if values.isna().all() else float(values.max()),
+            'nulls': int(values.isna().sum())}
+    return stats
+
+
+# Function to fold the statistics of one more chunk of a file into the statistics of the rows before it
+def merge_statistics(stats, chunk_stats):
+    if stats is None:
+        return chunk_stats
+    stats['rows'] += chunk_stats['rows']
+    stats['time_min'] = min(stats['time_min'], chunk_stats['time_min'])
+    stats['time_max'] = max(stats['time_max'], chunk_stats['time_max'])
+    for name, signal_stats in chunk_stats['signals'].items():
+        merged = stats['signals'][name]
+        for key, pick in (('min', min), ('max', max)):
+            if signal_stats[key] is not None:
+                merged[key] = signal_stats[key] if merged[key] is None else pick(merged[key], signal_stats[key])
+        merged['nulls'] += signal_stats['nulls']
+    return stats
+
+
+# Function to get the Parquet type of a decoded signal: integers where the scaling keeps them integer (nullable, for
+# the frames a multiplexed signal is not in), floats otherwise; fixed from the DBC so every chunk has the same schema
+def signal_arrow_type(signal):
+    if signal.is_float or not (float(signal.scale).is_integer() and float(signal.offset).is_integer()):
+        return pa.float64()
+    return pa.int64()
+
+
+# Parquet file of one frame ID in one log partition, written chunk by chunk: rows are buffered until a full row
+# group is reached, so row groups keep their size whatever the chunk size, and the manifest statistics are merged
+# as the rows arrive
+class LakeFileWriter:
+    def __init__(self, file_path, message):
+        self.file_path = file_path
+        self.message = message
+        self.schema = pa.schema([('timestamp_ns', pa.int64())] +
+                                [(signal.name, signal_arrow_type(signal)) for signal in message.signals])
+        self.writer = None
+        self.pending = []
+        self.pending_rows = 0
+        self.stats = None
+
+    def write(self, date_df):
+        self.pending.append(pa.Table.from_pandas(date_df, schema=self.schema, preserve_index=False))
+        self.pending_rows += len(date_df)
+        self.stats = merge_statistics(self.stats, file_statistics(date_df, self.message))
+        if self.pending_rows >= ROW_GROUP_SIZE:
+            self.flush(ROW_GROUP_SIZE)
+
+    # Function to write the buffered rows in whole row groups of size rows (the remainder stays buffered)
+    def flush(self, size):
+        table = pa.concat_tables(self.pending)
+        rows = len(table) // size * size
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.file_path, self.schema)
+        self.writer.write_table(table.slice(0, rows), row_group_size=size)
+        self.pending = [table.slice(rows)]
+        self.pending_rows = len(table) - rows
+
+    def close(self):
+        if self.pending_rows:
+            self.flush(self.pending_rows)
+        self.writer.close()
+
+
+# Function to decode one logger CSV and write it into the lake, one Parquet file per date and frame ID
+# The log is read, decoded and written chunk by chunk (chunksize frames, or a can_memory.ChunkScheduler): every chunk
+# appends its rows to the Parquet files of its partitions and its statistics to their manifests, so memory follows
+# the chunk size rather than the log. With rollups=True the rollup pyramid is built during the same pass and stored
+# as rollup=<level> files
+def write_log_to_lake(lake_directory, csv_file_path, routing_table, vehicle='unknown', log_name=None, rollups=False,
+                      chunksize=LAKE_CHUNK_ROWS):
+    if log_name is None:
+        log_name = os.path.basename(csv_file_path).split('.')[0]
+    writers = {}
+    pyramid = RollupPyramid() if rollups else None
+    previous_ns = None
+    for df_csv in read_logger_csv(csv_file_path, chunksize=chunksize, columns=DECODE_COLUMNS, payload_arrays=True):
+        frame_times = logger_timestamps_ns(df_csv, previous_ns=previous_ns)
+        previous_ns = frame_times[-1]
+        for frame_id, decoded in decode_by_frame(df_csv, routing_table).items():
+            message = routing_table[frame_id]
+            positions = df_csv.index.get_indexer(decoded.index)
+            decoded = decoded.apply(pd.to_numeric, errors='coerce')
+            decoded.insert(0, 'timestamp_ns', frame_times[positions])
+            # Sorted by time so every row group covers a narrow, non-overlapping time range
+            decoded = decoded.sort_values('timestamp_ns', kind='stable').reset_index(drop=True)
+            if pyramid is not None:
+                pyramid.update(decoded['timestamp_ns'].to_numpy(), decoded.drop(columns='timestamp_ns'))
+            row_dates = decoded['timestamp_ns'].to_numpy().astype('datetime64[ns]').astype('datetime64[D]').astype(str)
+            for date, date_df in decoded.groupby(row_dates):
+                partition = log_partition(lake_directory, date, vehicle, log_name)
+                if (partition, frame_id) not in writers:
+                    frame_directory = os.path.join(partition, f"frame={frame_id:08X}")
+                    os.makedirs(frame_directory, exist_ok=True)
+                    writers[partition, frame_id] = LakeFileWriter(os.path.join(frame_directory, 'part-00000.parquet'),
+                                                                  message)
+                writers[partition, frame_id].write(date_df)
+    manifests = {}
+    for (partition, _), writer in sorted(writers.items(), key=lambda item: item[0][1]):
+        writer.close()
+        stats = writer.stats
+        stats['file'] = os.path.relpath(writer.file_path, partition)
+        manifests.setdefault(partition, []).append(stats)
+    rollup_levels = []
+    if pyramid is not None:
+        for level, rollup_df in pyramid.finish().items():
+            rollup_df = rollup_df.reset_index()
+            bucket_dates = rollup_df['bucket_ns'].to_numpy().astype('datetime64[ns]').astype('datetime64[D]').astype(str)
+            for date, date_df in rollup_df.groupby(bucket_dates):
+                rollup_directory = os.path.join(log_partition(lake_directory, date, vehicle, log_name), f"rollup={level}")
+                os.makedirs(rollup_directory, exist_ok=True)
+                date_df.to_parquet(os.path.join(rollup_directory, 'part-00000.parquet'), index=False)
+            rollup_levels.append(level)
+    for partition, files in manifests.items():
+        with open(os.path.join(partition, MANIFEST_FILE_NAME), 'w') as f:
+            json.dump({'log': log_name, 'vehicle': vehicle, 'files': files, 'rollup_levels': rollup_levels}, f,
+                      indent=1)
+    return list(manifests)
+
+
+# Function to convert a query time (string, datetime or epoch ns) into epoch nanoseconds
+def to_epoch_ns(value):
+    return None if value is None else datetime_to_ns(value)
+
+
+# Function to pick the partition value out of a 'key=value' directory name
+def partition_value(directory):
+    return os.path.basename(directory).split('=', 1)[1]
+
+
+# Function to yield (log directory, manifest) for every log partition inside the date range and filters,
+# deciding from directory names alone which manifests to open
+def iter_log_partitions(lake_directory, start_ns=None, end_ns=None, logs=None, vehicles=None):
+    start_date = None if start_ns is None else str(np.datetime64(start_ns, 'ns').astype('datetime64[D]'))
+    end_date = None if end_ns is None else str(np.datetime64(end_ns, 'ns').astype('datetime64[D]'))
+    for date_directory in sorted(glob.glob(os.path.join(lake_directory, 'date=*'))):
+        date = partition_value(date_directory)
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        for log_directory in sorted(glob.glob(os.path.join(date_directory, 'vehicle=*', 'log=*'))):
+            if vehicles and partition_value(os.path.dirname(log_directory)) not in vehicles:
+                continue
+            if logs and partition_value(log_directory) not in logs:
+                continue
+            manifest_path = os.path.join(log_directory, MANIFEST_FILE_NAME)
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path) as f:
+                yield log_directory, json.load(f)
+
+
+# Function to list the files that can hold the requested signals and time range, using only directory names
+# and manifests (no Parquet file is opened here)
+def plan_lake_query(lake_directory, signals, start=None, end=None, logs=None, vehicles=None):
+    start_ns, end_ns = to_epoch_ns(start), to_epoch_ns(end)
+    planned = []
+    for log_directory, manifest in iter_log_partitions(lake_directory, start_ns, end_ns, logs, vehicles):
+        for stats in manifest['files']:
+            wanted = [signal for signal in signals if signal in stats['signals']]
+            if not wanted:
+                continue
+            if (start_ns is not None and stats['time_max'] < start_ns) or \
+                    (end_ns is not None and stats['time_min'] > end_ns):
+                continue
+            planned.append({'path': os.path.join(log_directory, stats['file']), 'log': manifest['log'],
+                            'vehicle': manifest['vehicle'], 'signals': wanted, 'time_min': stats['time_min'],
+                            'time_max': stats['time_max']})
+    return planned
+
+
+# Function to list the row groups of a Parquet file whose timestamp statistics overlap the time range
+def overlapping_row_groups(parquet_file, start_ns, end_ns):
+    column = parquet_file.schema_arrow.get_field_index('timestamp_ns')
+    row_groups = []
+    for i in range(parquet_file.metadata.num_row_groups):
+        stats = parquet_file.metadata.row_group(i).column(column).statistics
+        if stats is not None and stats.has_min_max:
+            if (start_ns is not None and stats.max < start_ns) or (end_ns is not None and stats.min > end_ns):
+                continue
+        row_groups.append(i)
+    return row_groups
+
+
+# Function to read signals from the lake between start and end; partitions, files and row groups that cannot
+# match are skipped before any data is read. Returns one time-sorted DataFrame with 'timestamp_ns' and 'log'.
+def read_lake(lake_directory, signals, start=None, end=None, logs=None, vehicles=None):
+    start_ns, end_ns = to_epoch_ns(start), to_epoch_ns(end)
+    parts = []
+    for planned in plan_lake_query(lake_directory, signals, start_ns, end_ns, logs, vehicles):
+        parquet_file = pq.ParquetFile(planned['path'])
+        row_groups = overlapping_row_groups(parquet_file, start_ns, end_ns)
+        if not row_groups:
+            continue
+        df = parquet_file.read_row_groups(row_groups, columns=['timestamp_ns'] + planned['signals']).to_pandas()
+        mask = np.ones(len(df), dtype=bool)
+        if start_ns is not None:
+            mask &= df['timestamp_ns'].to_numpy() >= start_ns
+        if end_ns is not None:
+            mask &= df['timestamp_ns'].to_numpy() <= end_ns
+        df = df[mask]
+        df.insert(1, 'log', planned['log'])
+        parts.append(df)
+    if not parts:
+        return pd.DataFrame(columns=['timestamp_ns', 'log'] + list(signals))
+    result = pd.concat(parts, ignore_index=True).sort_values(['timestamp_ns', 'log'], kind='stable')
+    return result.reindex(columns=['timestamp_ns', 'log'] + list(signals)).reset_index(drop=True)
+
+
+# Function to read signals for charting: picks the coarsest rollup level that still gives min_points buckets over
+# the requested span (or the span covered by the data), falling back to raw rows for short spans.
+# Returns (level or None, DataFrame); rollup frames hold 'bucket_ns', 'log' and <signal>_<stat> columns.
+def read_lake_auto(lake_directory, signals, start=None, end=None, logs=None, vehicles=None, min_points=1000,
+                   stats=('min', 'max', 'mean', 'last')):
+    start_ns, end_ns = to_epoch_ns(start), to_epoch_ns(end)
+    planned = plan_lake_query(lake_directory, signals, start_ns, end_ns, logs, vehicles)
+    if not planned:
+        return None, read_lake(lake_directory, signals, start_ns, end_ns, logs, vehicles)
+    span_start = start_ns if start_ns is not None else min(p['time_min'] for p in planned)
+    span_end = end_ns if end_ns is not None else max(p['time_max'] for p in planned)
+    level = choose_rollup_level(span_end - span_start, min_points)
+    partitions = list(iter_log_partitions(lake_directory, start_ns, end_ns, logs, vehicles))
+    if level is None or not all(level in manifest.get('rollup_levels', []) for _, manifest in partitions):
+        return None, read_lake(lake_directory, signals, start_ns, end_ns, logs, vehicles)
+    columns = [f"{signal}_{stat}" for signal in signals for stat in stats]
+    parts = []
+    for log_directory, manifest in partitions:
+        rollup_path = os.path.join(log_directory, f"rollup={level}", 'part-00000.parquet')
+        if not os.path.exists(rollup_path):
+            continue
+        available = pq.read_schema(rollup_path).names
+        df = pd.read_parquet(rollup_path, columns=['bucket_ns'] + [col for col in columns if col in available])
+        if start_ns is not None:
+            # Keep the bucket that contains the start time
+            df = df[df['bucket_ns'] + ROLLUP_LEVELS[level] * 10**9 > start_ns]
+        if end_ns is not None:
+            df = df[df['bucket_ns'] <= end_ns]
+        df.insert(1, 'log', manifest['log'])
+        parts.append(df)
+    if not parts:
+        return level, pd.DataFrame(columns=['bucket_ns', 'log'] + columns)
+    result = pd.concat(parts, ignore_index=True).sort_values(['bucket_ns', 'log'], kind='stable')
+    return level, result.reindex(columns=['bucket_ns', 'log'] + columns).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write decoded logs into a partitioned Parquet signal lake, or query it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    write_parser = subparsers.add_parser('write', help="Decode logger CSVs into the lake")
+    write_parser.add_argument('--lake', required=True)
+    write_parser.add_argument('--dbc', action='append', required=True, help="DBC file (repeat for several)")
+    write_parser.add_argument('--vehicle', default='unknown')
+    write_parser.add_argument('--rollups', action='store_true', help="Also write the 1s/10s/1min/10min rollup levels")
+    write_parser.add_argument('csv_files', nargs='+')
+    query_parser = subparsers.add_parser('query', help="Read signals from the lake")
+    query_parser.add_argument('--lake', required=True)
+    query_parser.add_argument('--signals', required=True, help="Comma separated signal names")
+    query_parser.add_argument('--start')
+    query_parser.add_argument('--end')
+    query_parser.add_argument('--log', action='append')
+    query_parser.add_argument('--vehicle', action='append')
+    query_parser.add_argument('--auto-resolution', action='store_true',
+                              help="Read the coarsest rollup level that still resolves the time span")
+    query_parser.add_argument('--min-points', type=int, default=1000)
+    query_parser.add_argument('--output', help="CSV file for the result; prints the head if omitted")
+    args = parser.parse_args()
+
+    if args.command == 'write':
+        routing_table = build_routing_table(load_dbc_files(args.dbc))
+        for csv_file_path in args.csv_files:
+            partitions = write_log_to_lake(args.lake, csv_file_path, routing_table, args.vehicle, rollups=args.rollups)
+            print(f"{csv_file_path} written to {len(partitions)} partition(s)")
+    else:
+        signals = args.signals.split(',')
+        planned = plan_lake_query(args.lake, signals, args.start, args.end, args.log, args.vehicle)
+        print(f"{len(planned)} file(s) selected after partition pruning")
+        if args.auto_resolution:
+            level, result = read_lake_auto(args.lake, signals, args.start, args.end, args.log, args.vehicle,
+                                           args.min_points)
+            print(f"Resolution: {level or 'raw'}")
+        else:
+            result = read_lake(args.lake, signals, args.start, args.end, args.log, args.vehicle)
+        if args.output:
+            result.to_csv(args.output, index=False)
+            print(f"{len(result)} rows saved to: {args.output}")
+        else:
+            print(result.head())
+
+
+if __name__ == '__main__':
+    main()
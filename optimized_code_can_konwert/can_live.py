@@ -0,0 +1,366 @@
+import argparse
+import collections
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import can
+from can_decode import (MAX_AGGREGATED_SIGNALS, load_dbc_files, build_routing_table, routing_signal_names,
+                        parse_frame_text, decode_payloads_batch)
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns
+from can_alerts import AlertEngine, load_rules, format_event, write_events
+
+# What the bus reader does when the decoder falls behind and the frame queue is full
+BACKPRESSURE_POLICIES = ['drop-oldest', 'drop-newest', 'block']
+
+# Sustained decode rate live mode has to keep up with (frames/s on one core), checked in the run report
+TARGET_FRAMES_PER_S = 10000
+
+
+# Ring buffer holding the most recent decoded frames as a timestamp vector and a signal matrix (NaN = not in frame)
+class DecodedRingBuffer:
+    def __init__(self, signal_names, capacity):
+        self.signal_names = list(signal_names)
+        self.columns = {name: i for i, name in enumerate(self.signal_names)}
+        self.capacity = capacity
+        self.timestamps = np.full(capacity, np.nan)
+        self.values = np.full((capacity, len(self.signal_names)), np.nan)
+        self.count = 0
+
+    # Append a block of decoded frames at once (values: one row per frame, NaN where a signal is not in the frame)
+    def extend(self, timestamps, values):
+        count = len(timestamps)
+        # Of a block larger than the buffer only the newest rows survive
+        keep = min(count, self.capacity)
+        positions = np.arange(self.count + count - keep, self.count + count) % self.capacity
+        self.timestamps[positions] = timestamps[count - keep:]
+        self.values[positions] = values[count - keep:]
+        self.count += count
+
+    # Rows written since the absolute row number 'start' that have not been overwritten yet, oldest first
+    def rows_since(self, start):
+        start = max(start, self.count - self.capacity)
+        positions = np.arange(start, self.count) % self.capacity
+        return self.timestamps[positions], self.values[positions]
+
+    # The most recent n decoded rows as a DataFrame
+    def latest(self, n):
+        timestamps, values = self.rows_since(self.count - n)
+        df = pd.DataFrame(values, columns=self.signal_names)
+        df.insert(0, 'Timestamp', timestamps)
+        return df
+
+
+# Per-second aggregation over the ring buffer, publishing one row per completed second
+class SecondAggregator:
+    def __init__(self, ring_buffer, publish):
+        self.ring_buffer = ring_buffer
+        self.publish = publish
+        self.max_columns = np.array([name in MAX_AGGREGATED_SIGNALS for name in ring_buffer.signal_names])
+        self.second = None
+        self.start_row = 0
+        self.published = 0
+
+    # Call before appending a frame with this timestamp; closes the current second when the frame starts a new one
+    def advance(self, timestamp):
+        second = int(timestamp)
+        if self.second is None:
+            self.second = second
+        elif second > self.second:
+            self.flush()
+            self.second = second
+            self.start_row = self.ring_buffer.count
+
+    def flush(self):
+        if self.second is None or self.ring_buffer.count == self.start_row:
+            return
+        timestamps, values = self.ring_buffer.rows_since(self.start_row)
+        with np.errstate(all='ignore'):
+            seen = ~np.isnan(values)
+            counts = seen.sum(axis=0)
+            sums = np.where(seen, values, 0.0).sum(axis=0)
+            maxima = np.where(seen, values, -np.inf).max(axis=0)
+            aggregated = np.where(self.max_columns, maxima, sums / counts)
+        aggregated[counts == 0] = np.nan
+        row = {'Time': datetime.fromtimestamp(self.second).strftime('%H:%M:%S'), 'frames': len(timestamps)}
+        # Rows can only be missing if one second held more frames than the ring buffer capacity
+        row['frames_overwritten'] = self.ring_buffer.count - self.start_row - len(timestamps)
+        row.update(zip(self.ring_buffer.signal_names, aggregated.tolist()))
+        self.publish(row)
+        self.published += 1
+
+
+# Fixed-size sample of per-frame end-to-end latencies (received from the bus, on the wall clock -> decoded row in
+# the ring buffer)
+class LatencyRecorder:
+    def __init__(self, capacity=100000):
+        self.samples = np.zeros(capacity)
+        self.count = 0
+
+    def record(self, latencies):
+        latencies = latencies[-len(self.samples):]
+        positions = np.arange(self.count, self.count + len(latencies)) % len(self.samples)
+        self.samples[positions] = latencies
+        self.count += len(latencies)
+
+    def summary(self):
+        samples = self.samples[:min(self.count, len(self.samples))] * 1000
+        if len(samples) == 0:
+            return {'latency_p50_ms': np.nan, 'latency_p99_ms': np.nan, 'latency_max_ms': np.nan}
+        return {'latency_p50_ms': np.percentile(samples, 50), 'latency_p99_ms': np.percentile(samples, 99),
+                'latency_max_ms': samples.max()}
+
+
+# Bounded queue between the bus reader thread and the decoder, applying the backpressure policy when full
+# Every check of the fill level and the change it leads to happen under one condition, so the reader and the decoder
+# never act on a stale length; a blocked reader and an idle decoder wait on it instead of polling
+class FrameQueue:
+    def __init__(self, size, policy):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {BACKPRESSURE_POLICIES}")
+        self.size = size
+        self.policy = policy
+        self.frames = collections.deque()
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, frame):
+        with self.condition:
+            if len(self.frames) >= self.size:
+                if self.policy == 'drop-newest':
+                    self.dropped += 1
+                    return
+                if self.policy == 'drop-oldest':
+                    self.frames.popleft()
+                    self.dropped += 1
+                else:
+                    self.condition.wait_for(lambda: len(self.frames) < self.size or self.closed)
+            self.frames.append(frame)
+            self.condition.notify_all()
+
+    # Function to take up to max_frames frames, waiting up to timeout seconds for the first one
+    def get_batch(self, max_frames=1000, timeout=None):
+        with self.condition:
+            if timeout is not None:
+                self.condition.wait_for(lambda: self.frames or self.closed, timeout)
+            batch = [self.frames.popleft() for _ in range(min(max_frames, len(self.frames)))]
+            if batch:
+                # Room for a reader blocked on a full queue
+                self.condition.notify_all()
+            return batch
+
+    # Function to stop the queue: a reader blocked on it and a decoder waiting for frames return at once
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+# Thread that moves frames from the python-can bus into the frame queue with their bus timestamp and the wall-clock
+# time they were received (msg.timestamp is the interface's hardware or driver clock on most interfaces, so the
+# latency is measured from the receipt time)
+def read_bus(bus, frame_queue, stop_event):
+    while not stop_event.is_set():
+        msg = bus.recv(timeout=0.1)
+        if msg is None:
+            continue
+        frame_queue.put((msg.timestamp, time.time(), msg.arbitration_id, bytes(msg.data)))
+
+
+# Thread that replays a logger CSV onto a bus, keeping the original frame spacing (speed=0 sends as fast as possible)
+def replay_logger_csv(csv_file_path, bus, speed, stop_event, chunksize=100000):
+    wall_start = time.time()
+    log_start = None
+    previous_ns = None
+    for chunk in read_logger_csv(csv_file_path, chunksize=chunksize, columns=DECODE_COLUMNS):
+        frame_times_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = frame_times_ns[-1]
+        frame_times = frame_times_ns / NS_PER_SECOND
+        for frame_time, frame_id_text, data_text in zip(frame_times, chunk['Frame ID'], chunk['Data']):
+            if stop_event.is_set():
+                return
+            if log_start is None:
+                log_start = frame_time
+            if speed > 0:
+                delay = wall_start + (frame_time - log_start) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            frame_id, data = parse_frame_text(frame_id_text, str(data_text))
+            bus.send(can.Message(arbitration_id=frame_id, data=data, is_extended_id=frame_id > 0x7FF))
+
+
+# Function to decode the frames drained in one poll with the bulk decoder, one frame ID group at a time
+# Returns (bus timestamps, receipt times, signal matrix in ring buffer column order) of the frames that decoded,
+# in arrival order
+def decode_batch(routing_table, columns, batch):
+    timestamps, received, frame_ids, payloads = zip(*batch)
+    frame_ids = np.array(frame_ids)
+    values = np.full((len(batch), len(columns)), np.nan)
+    decoded = np.zeros(len(batch), dtype=bool)
+    for frame_id, positions in pd.Series(frame_ids).groupby(frame_ids).indices.items():
+        message = routing_table.get(int(frame_id))
+        if message is None:
+            continue
+        for name, (rows, signal_values) in decode_payloads_batch(message, [payloads[i] for i in positions]).items():
+            values[positions[rows], columns[name]] = signal_values
+            decoded[positions[rows]] = True
+    return np.array(timestamps)[decoded], np.array(received)[decoded], values[decoded]
+
+
+# Decoder loop: drain the frame queue, decode each drained batch at once into the ring buffer and publish
+# per-second rows. With an alert engine every decoded batch is also checked against the rules and closed events are
+# printed at once. Returns (frames taken from the queue, frames decoded, seconds spent decoding).
+def decode_live(frame_queue, routing_table, ring_buffer, aggregator, latencies, stop_event, alert_engine=None):
+    received_frames = 0
+    decoded_frames = 0
+    busy_time = 0.0
+    while True:
+        # Wait for frames on the queue; the timeout bounds how late a stop is noticed
+        batch = frame_queue.get_batch(timeout=0.05)
+        if not batch:
+            if stop_event.is_set() or frame_queue.closed:
+                break
+            continue
+        batch_start = time.perf_counter()
+        received_frames += len(batch)
+        timestamps, received, values = decode_batch(routing_table, ring_buffer.columns, batch)
+        # The aggregator closes a second when a frame starts a new one, so the block is appended second by second
+        seconds = timestamps.astype(np.int64)
+        starts = np.flatnonzero(np.concatenate([[True], seconds[1:] != seconds[:-1]])) if len(seconds) else []
+        for start, end in zip(starts, list(starts[1:]) + [len(seconds)]):
+            aggregator.advance(timestamps[start])
+            ring_buffer.extend(timestamps[start:end], values[start:end])
+        latencies.record(time.time() - received)
+        decoded_frames += len(timestamps)
+        if alert_engine is not None and len(timestamps):
+            arrivals_ns = np.round(timestamps * NS_PER_SECOND).astype(np.int64)
+            decoded_df = pd.DataFrame(values, columns=ring_buffer.signal_names).dropna(axis=1, how='all')
+            for event in alert_engine.update(arrivals_ns, decoded_df):
+                print(format_event(event))
+        busy_time += time.perf_counter() - batch_start
+    aggregator.flush()
+    if alert_engine is not None:
+        for event in alert_engine.finish():
+            print(format_event(event))
+    return received_frames, decoded_frames, busy_time
+
+
+# Publisher that appends each per-second row to a CSV file (or prints it when no file is given)
+def make_publisher(output_csv_file_path, signal_names):
+    if not output_csv_file_path:
+        return lambda row: print(f"{row['Time']}: {row['frames']} frames")
+    output_file = open(output_csv_file_path, 'w', newline='')
+    writer = csv.DictWriter(output_file, fieldnames=['Time', 'frames', 'frames_overwritten'] + list(signal_names))
+    writer.writeheader()
+
+    def publish(row):
+        writer.writerow(row)
+        output_file.flush()
+    return publish
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode frames from a live CAN bus into per-second aggregates")
+    parser.add_argument('--dbc', action='append', help="DBC file (repeat for several); asks with a dialog if omitted")
+    parser.add_argument('--interface', default='virtual', help="python-can interface, e.g. virtual, socketcan, pcan")
+    parser.add_argument('--channel', default='can_live', help="python-can channel")
+    parser.add_argument('--bitrate', type=int, default=None)
+    parser.add_argument('--replay', help="Logger CSV to replay onto the bus (virtual interface)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed factor, 0 = as fast as possible")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument('--queue-size', type=int, default=50000)
+    parser.add_argument('--backpressure', choices=BACKPRESSURE_POLICIES, default='drop-oldest')
+    parser.add_argument('--buffer-size', type=int, default=65536, help="Ring buffer capacity in decoded frames")
+    parser.add_argument('--output', help="CSV file receiving the per-second aggregates")
+    parser.add_argument('--alerts', action='store_true', help="Check the decoded stream against the alert rules")
+    parser.add_argument('--rules', help="JSON file with the alert rules (implies --alerts; Fault/Warning/torque "
+                                        "rules by default)")
+    args = parser.parse_args()
+
+    dbc_file_paths = args.dbc
+    if not dbc_file_paths:
+        from tkinter import Tk
+        from tkinter.filedialog import askopenfilenames
+        root = Tk()
+        root.withdraw()
+        dbc_file_paths = askopenfilenames(title="Select the DBC Files", filetypes=[("DBC files", "*.dbc")])
+        if not dbc_file_paths:
+            raise FileNotFoundError("No DBC file selected")
+
+    routing_table = build_routing_table(load_dbc_files(dbc_file_paths))
+    signal_names = routing_signal_names(routing_table)
+    ring_buffer = DecodedRingBuffer(signal_names, args.buffer_size)
+    aggregator = SecondAggregator(ring_buffer, make_publisher(args.output, signal_names))
+    latencies = LatencyRecorder()
+    frame_queue = FrameQueue(args.queue_size, args.backpressure)
+    stop_event = threading.Event()
+    alert_engine = AlertEngine(load_rules(args.rules)) if args.alerts or args.rules else None
+
+    bus = can.Bus(interface=args.interface, channel=args.channel, bitrate=args.bitrate)
+    reader = threading.Thread(target=read_bus, args=(bus, frame_queue, stop_event), daemon=True)
+    reader.start()
+
+    replay_bus = None
+    replayer = None
+    if args.replay:
+        replay_bus = can.Bus(interface=args.interface, channel=args.channel)
+        replayer = threading.Thread(target=replay_logger_csv, args=(args.replay, replay_bus, args.speed, stop_event),
+                                    daemon=True)
+
+    # Stop when the duration elapses, or once a replay has been sent and the bus has gone quiet
+    def watch():
+        watch_start = time.time()
+        if replayer is not None:
+            replayer.start()
+        while not stop_event.is_set():
+            time.sleep(0.1)
+            if args.duration is not None and time.time() - watch_start >= args.duration:
+                break
+            if replayer is not None and not replayer.is_alive() and not frame_queue.frames:
+                time.sleep(0.5)
+                if not frame_queue.frames:
+                    break
+        stop_event.set()
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+
+    run_start = time.time()
+    try:
+        received_frames, decoded_frames, busy_time = decode_live(frame_queue, routing_table, ring_buffer, aggregator,
+                                                                 latencies, stop_event, alert_engine)
+    except KeyboardInterrupt:
+        stop_event.set()
+        aggregator.flush()
+        received_frames, decoded_frames, busy_time = ring_buffer.count, ring_buffer.count, np.nan
+    elapsed = time.time() - run_start
+    frame_queue.close()
+    reader.join(timeout=1)
+    bus.shutdown()
+    if replay_bus is not None:
+        replay_bus.shutdown()
+
+    # Achieved rates: frames/s over the run (bounded by what the bus delivered) and the decoder's capacity, frames
+    # per second of decoding time, which has to reach TARGET_FRAMES_PER_S
+    decode_capacity = received_frames / busy_time if busy_time else np.nan
+    report = {'received_frames': received_frames, 'decoded_frames': decoded_frames,
+              'dropped_frames': frame_queue.dropped, 'backpressure': args.backpressure,
+              'seconds_published': aggregator.published, 'elapsed_s': elapsed,
+              'achieved_fps': received_frames / elapsed if elapsed else np.nan,
+              'decode_throughput_fps': decode_capacity,
+              'meets_target_fps': bool(decode_capacity >= TARGET_FRAMES_PER_S)}
+    report.update(latencies.summary())
+    if alert_engine is not None:
+        report['alert_events'] = len(alert_engine.events)
+        if args.output:
+            write_events(alert_engine, os.path.splitext(args.output)[0])
+    for key, value in report.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
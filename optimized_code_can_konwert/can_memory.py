@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+import numpy as np
+
+# Memory a run may use for the chunks it holds at once (raw rows, decoded rows and decoding temporaries)
+DEFAULT_MEMORY_BUDGET_BYTES = 1 << 30
+
+# First guess of the cost of one row before any chunk has been measured: the raw logger row plus one float per
+# decoded signal, times the temporaries of decoding (per-row dicts, payload bytes, column copies)
+RAW_ROW_BYTES = 200
+SIGNAL_CELL_BYTES = 8
+DECODE_PEAK_FACTOR = 4
+
+# Bounds of the chunk size; the size is rounded to CHUNK_ROWS_STEP rows
+MIN_CHUNK_ROWS = 10000
+MAX_CHUNK_ROWS = 2000000
+CHUNK_ROWS_STEP = 1000
+
+# Weight of the newest measurement in the running per-row cost
+ROW_BYTES_SMOOTHING = 0.5
+
+
+# Function to get the size of the next chunk: a fixed chunksize or the next size chosen by a ChunkScheduler
+def chunk_rows(chunksize):
+    return chunksize.next_rows() if hasattr(chunksize, 'next_rows') else chunksize
+
+
+# Function to estimate the peak bytes per row of a decode run from the number of decoded signal columns
+def estimate_row_bytes(signal_count):
+    return (RAW_ROW_BYTES + signal_count * SIGNAL_CELL_BYTES) * DECODE_PEAK_FACTOR
+
+
+# Chunk scheduler: picks the number of rows per read/decode chunk so the chunks held at once fit the memory
+# budget. It starts from the DBC signal count and corrects the per-row cost from the measured footprint of every
+# chunk; the largest size that fits is used, since bigger chunks amortise the per-chunk overhead of parsing and
+# decoding. Pass it as chunksize to can_ingest.read_logger_csv; observe() may be called from several decode threads.
+class ChunkScheduler:
+    def __init__(self, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, signal_count=0, chunks_in_flight=1):
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self.signal_count = signal_count
+        self.chunks_in_flight = chunks_in_flight
+        self.initial_row_bytes = estimate_row_bytes(signal_count)
+        self.row_bytes = self.initial_row_bytes
+        self.rows = self.rows_for_budget()
+        self.chunks = []
+        self.started = time.perf_counter()
+        self.last_time = self.started
+        self.lock = threading.Lock()
+
+    def rows_for_budget(self):
+        rows = self.memory_budget_bytes / self.chunks_in_flight / self.row_bytes
+        rows = int(np.clip(rows, MIN_CHUNK_ROWS, MAX_CHUNK_ROWS)) // CHUNK_ROWS_STEP * CHUNK_ROWS_STEP
+        return max(rows, MIN_CHUNK_ROWS)
+
+    def next_rows(self):
+        with self.lock:
+            return self.rows
+
+    # Record one processed chunk from the objects it kept alive (raw DataFrame, decoded DataFrame, ...)
+    def observe(self, *frames):
+        rows = len(frames[0])
+        if rows == 0:
+            return
+        footprint = int(sum(np.sum(frame.memory_usage(deep=True)) for frame in frames))
+        # The measured frames outlive decoding; its temporaries come on top of them
+        measured_row_bytes = footprint * DECODE_PEAK_FACTOR / rows
+        with self.lock:
+            now = time.perf_counter()
+            if self.chunks:
+                self.row_bytes += ROW_BYTES_SMOOTHING * (measured_row_bytes - self.row_bytes)
+            else:
+                self.row_bytes = measured_row_bytes
+            seconds = now - self.last_time
+            self.last_time = now
+            self.chunks.append({'rows': rows, 'footprint_bytes': footprint, 'row_bytes': round(measured_row_bytes, 1),
+                                'seconds': round(seconds, 3), 'rows_per_s': round(rows / max(seconds, 1e-9))})
+            self.rows = self.rows_for_budget()
+
+    def report(self):
+        with self.lock:
+            rows = sum(chunk['rows'] for chunk in self.chunks)
+            seconds = time.perf_counter() - self.started
+            chunks = list(self.chunks)
+        return {'memory_budget_bytes': self.memory_budget_bytes, 'signal_count': self.signal_count,
+                'chunks_in_flight': self.chunks_in_flight, 'initial_row_bytes': self.initial_row_bytes,
+                'final_row_bytes': round(self.row_bytes, 1), 'chunk_sizes': [chunk['rows'] for chunk in chunks],
+                'peak_estimate_bytes': int(max((chunk['footprint_bytes'] for chunk in chunks), default=0)
+                                           * DECODE_PEAK_FACTOR * self.chunks_in_flight),
+                'rows': rows, 'seconds': round(seconds, 3), 'rows_per_s': round(rows / max(seconds, 1e-9)),
+                'chunks': chunks}
+
+
+# Function to build the path of the run report written next to an output
+def run_report_path(base_path):
+    return f"{base_path}_run.json"
+
+
+# Function to write the run report of a decode run (chunk sizes, footprints, throughput) next to its output
+def write_run_report(report, base_path):
+    with open(run_report_path(base_path), 'w') as report_file:
+        json.dump(report, report_file, indent=1, default=str)
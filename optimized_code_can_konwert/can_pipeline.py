@@ -0,0 +1,187 @@
+import os
+import queue
+import threading
+import time
+
+# Items buffered between two stages; with the item each stage is working on, this bounds what is held at once
+PIPELINE_QUEUE_SIZE = 2
+
+# Decode workers; decoding holds the GIL for most of its work, so more than a couple rarely pays off, the gain of
+# the pipeline is that reading (parser and decompression release the GIL) and writing overlap with it
+DEFAULT_DECODE_WORKERS = min(2, os.cpu_count() or 1)
+
+# How often a blocked stage checks whether the pipeline was stopped
+STOP_POLL_S = 0.1
+
+# Marks the end of the stream in the queues
+END = object()
+
+
+# Busy time and item count of one stage, shared by its threads
+class StageStats:
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.busy_s = 0.0
+        self.items = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.busy_s += seconds
+            self.items += 1
+
+    def report(self, wall_s):
+        return {'workers': self.workers, 'items': self.items, 'busy_s': round(self.busy_s, 3),
+                'utilization': round(self.busy_s / max(wall_s * self.workers, 1e-9), 3)}
+
+
+# Staged pipeline: a reader thread pulls items (chunks, files) from an iterator, decode workers run decode(item) on
+# them and a writer thread runs write(result) in the original order, with bounded queues in between. The next item
+# is read while the current one decodes and the previous one is written; the busy time of every stage shows which
+# one is the bottleneck (utilization near 1). An error in any stage stops the others and is raised by run().
+class StagedPipeline:
+    def __init__(self, decode, write, decode_workers=DEFAULT_DECODE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE):
+        self.decode = decode
+        self.write = write
+        self.decode_workers = max(int(decode_workers), 1)
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size + self.decode_workers)
+        self.stopped = threading.Event()
+        # Sequence number of the next result to write, and the condition decode workers wait on to hand over theirs
+        self.next_sequence = 0
+        self.written = threading.Condition()
+        self.errors = []
+        self.stats = {'read': StageStats('read'), 'decode': StageStats('decode', self.decode_workers),
+                      'write': StageStats('write')}
+        self.wall_s = 0.0
+
+    # Blocks while the next stage is behind, giving up when the pipeline is stopped
+    def put(self, target_queue, item):
+        while not self.stopped.is_set():
+            try:
+                target_queue.put(item, timeout=STOP_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source_queue):
+        while not self.stopped.is_set():
+            try:
+                return source_queue.get(timeout=STOP_POLL_S)
+            except queue.Empty:
+                continue
+        return END
+
+    # A result more than decode_workers items past the next one to write waits here, so out-of-order results held by
+    # the writer stay bounded however slow an early item is
+    def wait_turn(self, sequence):
+        with self.written:
+            while sequence >= self.next_sequence + self.decode_workers:
+                if self.stopped.is_set():
+                    return False
+                self.written.wait(STOP_POLL_S)
+        return True
+
+    def fail(self, error):
+        self.errors.append(error)
+        self.stopped.set()
+
+    def read_stage(self, items, stop):
+        try:
+            iterator = iter(items)
+            sequence = 0
+            while not self.stopped.is_set() and not (stop is not None and stop()):
+                start = time.perf_counter()
+                item = next(iterator, END)
+                if item is END:
+                    break
+                self.stats['read'].record(time.perf_counter() - start)
+                if not self.put(self.decode_queue, (sequence, item)):
+                    return
+                sequence += 1
+        except Exception as e:
+            self.fail(e)
+        finally:
+            for _ in range(self.decode_workers):
+                self.put(self.decode_queue, END)
+
+    def decode_stage(self):
+        try:
+            while True:
+                entry = self.get(self.decode_queue)
+                if entry is END:
+                    break
+                sequence, item = entry
+                start = time.perf_counter()
+                result = self.decode(item)
+                self.stats['decode'].record(time.perf_counter() - start)
+                if not self.wait_turn(sequence) or not self.put(self.write_queue, (sequence, result)):
+                    return
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.put(self.write_queue, END)
+
+    # Results are written in the order the items were read, whichever worker finished first
+    def write_stage(self):
+        pending = {}
+        ended_workers = 0
+        try:
+            while ended_workers < self.decode_workers:
+                entry = self.get(self.write_queue)
+                if entry is END:
+                    ended_workers += 1
+                    if self.stopped.is_set():
+                        return
+                    continue
+                sequence, result = entry
+                pending[sequence] = result
+                while self.next_sequence in pending:
+                    start = time.perf_counter()
+                    self.write(pending.pop(self.next_sequence))
+                    self.stats['write'].record(time.perf_counter() - start)
+                    with self.written:
+                        self.next_sequence += 1
+                        self.written.notify_all()
+        except Exception as e:
+            self.fail(e)
+
+    # Function to push every item through the stages; stop() is asked before every read, so a cancelled run ends
+    # after the items already read are decoded and written
+    def run(self, items, stop=None):
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self.read_stage, args=(items, stop), name='pipeline-read', daemon=True)]
+        threads += [threading.Thread(target=self.decode_stage, name=f'pipeline-decode-{i + 1}', daemon=True)
+                    for i in range(self.decode_workers)]
+        threads.append(threading.Thread(target=self.write_stage, name='pipeline-write', daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_s = time.perf_counter() - started
+        if self.errors:
+            raise self.errors[0]
+        return self.report()
+
+    def report(self):
+        stages = {name: stats.report(self.wall_s) for name, stats in self.stats.items()}
+        return {'wall_s': round(self.wall_s, 3), 'stages': stages,
+                'bottleneck': max(stages, key=lambda name: stages[name]['utilization'])}
+
+
+# Function to count the chunks a pipeline holds at once (the chunks_in_flight of a can_memory.ChunkScheduler sizing
+# its chunks): the reader's and a full decode queue, one per decode worker, and the results between the workers and
+# the write (write queue, reorder buffer and the one being written), which wait_turn keeps to decode_workers
+def pipeline_chunks_in_flight(decode_workers=DEFAULT_DECODE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE):
+    return 1 + queue_size + decode_workers + decode_workers
+
+
+# Function to print the stage utilization of a pipeline run
+def print_pipeline_report(report):
+    stages = []
+    for name, stage in report['stages'].items():
+        workers = f" on {stage['workers']} workers" if stage['workers'] > 1 else ""
+        stages.append(f"{name} {stage['utilization']:.0%} ({stage['items']} item(s), {stage['busy_s']:.2f} s{workers})")
+    print(f"Pipeline {report['wall_s']:.2f} s: {', '.join(stages)}; bottleneck: {report['bottleneck']}")
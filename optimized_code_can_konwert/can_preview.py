@@ -0,0 +1,160 @@
+import argparse
+import io
+import os
+import time
+from itertools import islice
+import numpy as np
+import pandas as pd
+from can_busstats import dbc_frame_info
+from can_compressed import BackgroundDecompressor, log_compression, read_block_index
+from can_decode import load_dbc_files, dbc_prefixes, build_prefixed_routing_table, decode_prefixed, frame_ids_from_text
+from can_ingest import LOGGER_COLUMNS, LOGGER_SKIP_ROWS, DECODE_COLUMNS, PANDAS_DTYPES, read_logger_csv
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns
+
+# Rows read from the top of the log, and the strided samples of SAMPLE_BLOCK_ROWS rows spread over the rest of it;
+# the decode cost follows these numbers, not the size of the log
+PREVIEW_HEAD_ROWS = 5000
+PREVIEW_SAMPLE_BLOCKS = 10
+SAMPLE_BLOCK_ROWS = 1000
+
+# Sample values shown per signal
+PREVIEW_SIGNAL_ROWS = 20
+
+
+# Function to parse raw logger rows (bytes) into the decode columns
+def parse_sample_rows(rows):
+    return pd.read_csv(io.BytesIO(rows), delimiter=';', header=None, names=LOGGER_COLUMNS, usecols=DECODE_COLUMNS,
+                       dtype={column: PANDAS_DTYPES[column] for column in DECODE_COLUMNS})
+
+
+# Function to read sample_blocks blocks of block_rows rows at evenly spaced byte offsets of a plain CSV; every block
+# starts at the first whole row after its offset
+def plain_sample_blocks(csv_file_path, sample_blocks, block_rows):
+    blocks = []
+    file_size = os.path.getsize(csv_file_path)
+    with open(csv_file_path, 'rb') as csv_file:
+        for _ in range(LOGGER_SKIP_ROWS):
+            csv_file.readline()
+        data_start = csv_file.tell()
+        for offset in np.linspace(data_start, file_size, sample_blocks + 2)[1:-1].astype(np.int64):
+            csv_file.seek(offset)
+            csv_file.readline()
+            rows = b''.join(islice(csv_file, block_rows))
+            if rows:
+                blocks.append(parse_sample_rows(rows))
+    return blocks
+
+
+# Function to read the first block_rows rows of evenly spaced blocks of a seekable compressed log, decompressing
+# only those blocks
+def seekable_sample_blocks(csv_file_path, block_index, sample_blocks, block_rows):
+    blocks = []
+    selected = np.unique(np.linspace(0, len(block_index['blocks']) - 1, sample_blocks + 2)[1:-1].astype(int))
+    for block in (block_index['blocks'][i] for i in selected):
+        with io.BufferedReader(BackgroundDecompressor(csv_file_path, block_index['compression'], block['offset'],
+                                                      block['end_offset'])) as stream:
+            rows = b''.join(islice(stream, block_rows))
+        if rows:
+            blocks.append(parse_sample_rows(rows))
+    return blocks
+
+
+# Function to sample a log: its head plus strided blocks over the rest where the format allows seeking (plain CSVs
+# and seekable compressed logs); other compressed logs and traces are previewed from their head only
+def sample_log(csv_file_path, head_rows=PREVIEW_HEAD_ROWS, sample_blocks=PREVIEW_SAMPLE_BLOCKS,
+               block_rows=SAMPLE_BLOCK_ROWS):
+    chunks = read_logger_csv(csv_file_path, chunksize=head_rows, columns=DECODE_COLUMNS)
+    head = next(iter(chunks), None)
+    if hasattr(chunks, 'close'):
+        chunks.close()
+    blocks = [] if head is None else [head]
+    if log_compression(csv_file_path) is None:
+        if csv_file_path.lower().endswith('.csv') and head is not None and len(head) == head_rows:
+            blocks += plain_sample_blocks(csv_file_path, sample_blocks, block_rows)
+    else:
+        block_index = read_block_index(csv_file_path)
+        if block_index is not None and len(block_index['blocks']) > 1:
+            blocks += seekable_sample_blocks(csv_file_path, block_index, sample_blocks, block_rows)
+    return blocks
+
+
+# Function to preview a log against DBCs from a sample: the share of sampled frames the DBCs know, the DBC messages
+# present with their rates, and sample values of the decoded signals
+def preview_log(csv_file_path, dbs, head_rows=PREVIEW_HEAD_ROWS, sample_blocks=PREVIEW_SAMPLE_BLOCKS,
+                block_rows=SAMPLE_BLOCK_ROWS):
+    started = time.perf_counter()
+    prefixes = dbc_prefixes(len(dbs))
+    routing_table = build_prefixed_routing_table(dbs, prefixes, 'all')
+    frame_info = dbc_frame_info(dbs)
+    blocks = sample_log(csv_file_path, head_rows, sample_blocks, block_rows)
+    if not blocks:
+        raise ValueError(f"No frames in {csv_file_path}")
+
+    # Rates from the frames seen over the time each sample block spans
+    sampled_seconds = 0.0
+    for block in blocks:
+        timestamps_ns = logger_timestamps_ns(block)
+        sampled_seconds += (timestamps_ns[-1] - timestamps_ns[0]) / NS_PER_SECOND
+    sample = pd.concat(blocks, ignore_index=True)
+    frame_ids = frame_ids_from_text(sample['Frame ID'])
+    sample_ids, frame_counts = np.unique(frame_ids[frame_ids >= 0], return_counts=True)
+    known = np.isin(frame_ids, list(routing_table))
+
+    messages = []
+    for frame_id, frames in zip(sample_ids.tolist(), frame_counts.tolist()):
+        routes = routing_table.get(frame_id, [])
+        cycle_ns = frame_info.get(frame_id, (None, None))[0]
+        messages.append({'frame_id': f"{frame_id:08X}", 'message': ', '.join(message.name for _, message in routes),
+                         'dbc': ', '.join(prefix.rstrip('_') for prefix, _ in routes), 'frames': frames,
+                         'rate_hz': frames / sampled_seconds if sampled_seconds > 0 else np.nan,
+                         'dbc_cycle_ms': cycle_ns / 1e6 if cycle_ns else np.nan})
+    messages = pd.DataFrame(messages, columns=['frame_id', 'message', 'dbc', 'frames', 'rate_hz', 'dbc_cycle_ms'])
+
+    decoded_df = decode_prefixed(sample[known], routing_table, prefixes)
+    signals = []
+    for column in decoded_df.columns:
+        values = pd.to_numeric(decoded_df[column], errors='coerce').dropna()
+        if len(values):
+            signals.append({'signal': column, 'samples': len(values), 'first': values.iloc[0],
+                            'min': values.min(), 'max': values.max(),
+                            'values': values.head(PREVIEW_SIGNAL_ROWS).tolist()})
+    dbc_ids = set(routing_table)
+    return {'log': csv_file_path, 'sampled_rows': len(sample), 'sample_blocks': len(blocks),
+            'sampled_seconds': sampled_seconds,
+            'match_percent': 100.0 * known.sum() / len(sample),
+            'dbc_messages': len(dbc_ids), 'dbc_messages_present': len(dbc_ids & set(sample_ids.tolist())),
+            'messages': messages, 'signals': pd.DataFrame(signals, columns=['signal', 'samples', 'first', 'min', 'max',
+                                                                            'values']),
+            'seconds': time.perf_counter() - started}
+
+
+# Function to print a preview
+def print_preview(preview):
+    print(f"Preview of {preview['log']}: {preview['sampled_rows']} rows in {preview['sample_blocks']} sample(s), "
+          f"{preview['seconds']:.2f} s")
+    print(f"  {preview['match_percent']:.1f}% of the sampled frames are in the DBC(s), "
+          f"{preview['dbc_messages_present']} of {preview['dbc_messages']} DBC message(s) present")
+    if preview['match_percent'] == 0:
+        print("  No sampled frame matches the DBC(s) - check the DBC selection before decoding the whole log")
+    print(preview['messages'].to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+    if len(preview['signals']):
+        print(preview['signals'].drop(columns='values').to_string(index=False, float_format=lambda value: f"{value:g}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview logs against DBCs from a sample before a full decode")
+    parser.add_argument('--dbc', action='append', required=True, help="DBC file (repeat for several)")
+    parser.add_argument('--head-rows', type=int, default=PREVIEW_HEAD_ROWS, help="Rows read from the top of the log")
+    parser.add_argument('--samples', type=int, default=PREVIEW_SAMPLE_BLOCKS,
+                        help="Strided sample blocks over the rest of the log")
+    parser.add_argument('--sample-rows', type=int, default=SAMPLE_BLOCK_ROWS, help="Rows per sample block")
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    dbs = load_dbc_files(args.dbc)
+    for csv_file_path in args.csv_files:
+        print_preview(preview_log(csv_file_path, dbs, args.head_rows, args.samples, args.sample_rows))
+
+
+if __name__ == '__main__':
+    main()
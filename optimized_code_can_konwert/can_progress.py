@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from can_compressed import LOGGER_HEADER_LINES, log_compression, read_block_index
+
+try:
+    import tkinter
+    from tkinter import ttk
+except ImportError:
+    tkinter = None
+
+# How often the progress window (ms) and the console fallback (s) refresh
+PROGRESS_REFRESH_MS = 250
+CONSOLE_PROGRESS_INTERVAL_S = 5
+
+# Bytes read from the top of a plain log to estimate its bytes per row
+ROW_ESTIMATE_SAMPLE_BYTES = 1 << 16
+
+
+# Function to estimate the number of frames in a log for the ETA: the block index of a seekable compressed log, or
+# the file size over the mean row length of the first rows of a plain CSV; None when it cannot be told cheaply
+def estimate_log_rows(csv_file_path):
+    if log_compression(csv_file_path) is not None:
+        block_index = read_block_index(csv_file_path)
+        return sum(block['rows'] for block in block_index['blocks']) if block_index else None
+    if not csv_file_path.lower().endswith('.csv'):
+        return None
+    with open(csv_file_path, 'rb') as csv_file:
+        header_bytes = sum(len(csv_file.readline()) for _ in range(LOGGER_HEADER_LINES))
+        sample = csv_file.read(ROW_ESTIMATE_SAMPLE_BYTES)
+    sample_rows = sample.count(b'\n')
+    if sample_rows == 0:
+        return None
+    return int((os.path.getsize(csv_file_path) - header_bytes) / (len(sample) / sample_rows))
+
+
+# Progress of a decode run shared between the worker thread and the window: rows processed, throughput, ETA and
+# the cancel request. The worker calls update() after every chunk and checks cancelled between chunks.
+# fraction can be given instead of a row total when progress is better measured another way (time window covered)
+class DecodeProgress:
+    def __init__(self, total_rows=None):
+        self.total_rows = total_rows
+        self.rows = 0
+        self.fraction_done = None
+        self.started = time.perf_counter()
+        self.cancel_requested = threading.Event()
+        self.lock = threading.Lock()
+
+    def update(self, rows, fraction=None):
+        with self.lock:
+            self.rows += rows
+            if fraction is not None:
+                self.fraction_done = min(max(fraction, 0.0), 1.0)
+
+    def cancel(self):
+        self.cancel_requested.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_requested.is_set()
+
+    def fraction(self):
+        if self.fraction_done is not None:
+            return self.fraction_done
+        if self.total_rows:
+            return min(self.rows / self.total_rows, 1.0)
+        return None
+
+    def rows_per_s(self):
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+    # Seconds left at the throughput so far (None until there is a fraction to extrapolate from)
+    def eta_s(self):
+        fraction = self.fraction()
+        if not fraction:
+            return None
+        return (time.perf_counter() - self.started) * (1 - fraction) / fraction
+
+    def text(self):
+        with self.lock:
+            total = f" / ~{self.total_rows:,}" if self.total_rows else ""
+            eta = self.eta_s()
+            eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else "unknown"
+            return f"{self.rows:,}{total} rows | {self.rows_per_s():,.0f} rows/s | ETA {eta_text}"
+
+    def report(self):
+        return {'cancelled': self.cancelled, 'estimated_rows': self.total_rows, 'processed_rows': self.rows}
+
+
+# Function to open the progress window (label, bar, Cancel button) over the hidden root window; None when no window
+# can be shown (tkinter missing, no display), in which case progress goes to the console
+def open_progress_window(progress, title, root=None):
+    if tkinter is None:
+        return None
+    try:
+        window = tkinter.Toplevel(root)
+    except (tkinter.TclError, RuntimeError):
+        return None
+    window.title(title)
+    window.resizable(False, False)
+    label = tkinter.Label(window, text=title, anchor='w', width=60)
+    label.pack(padx=10, pady=(10, 4), fill='x')
+    mode = 'determinate' if progress.fraction() is not None else 'indeterminate'
+    bar = ttk.Progressbar(window, length=400, mode=mode, maximum=1000)
+    bar.pack(padx=10, pady=4, fill='x')
+    status = tkinter.Label(window, text=progress.text(), anchor='w')
+    status.pack(padx=10, pady=4, fill='x')
+    button = tkinter.Button(window, text="Cancel")
+    button.pack(padx=10, pady=(4, 10))
+
+    def cancel():
+        progress.cancel()
+        button.configure(text="Cancelling...", state='disabled')
+        label.configure(text=f"{title} - stopping after the current chunk, the rows so far are kept")
+
+    button.configure(command=cancel)
+    # Closing the window cancels the run the same way
+    window.protocol('WM_DELETE_WINDOW', cancel)
+    if bar['mode'] == 'indeterminate':
+        bar.start()
+    window.bar = bar
+    window.status = status
+    return window
+
+
+# Function to run work(progress) in a background thread while the progress window (or the console) shows rows,
+# throughput and ETA; returns what work returned and raises what it raised
+# work must check progress.cancelled between chunks and return normally with what it has done so far
+def run_in_background(work, progress, title="Decoding", root=None):
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = work(progress)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name='decode-worker', daemon=True)
+    thread.start()
+    window = open_progress_window(progress, title, root)
+    if window is not None:
+        def refresh():
+            if not thread.is_alive():
+                window.destroy()
+                return
+            fraction = progress.fraction()
+            if fraction is not None:
+                if window.bar['mode'] == 'indeterminate':
+                    window.bar.stop()
+                    window.bar.configure(mode='determinate')
+                window.bar['value'] = fraction * 1000
+            window.status.configure(text=progress.text())
+            window.after(PROGRESS_REFRESH_MS, refresh)
+
+        window.after(PROGRESS_REFRESH_MS, refresh)
+        window.wait_window()
+    else:
+        # Console progress; Ctrl+C cancels like the Cancel button and the run still ends cleanly
+        print(f"{title} (Ctrl+C to stop and keep the rows decoded so far)")
+        while thread.is_alive():
+            try:
+                thread.join(CONSOLE_PROGRESS_INTERVAL_S)
+                if thread.is_alive():
+                    print(progress.text())
+            except KeyboardInterrupt:
+                print("Cancelling after the current chunk...")
+                progress.cancel()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('result')
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import collections
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import pandas as pd
+from can_decode import MAX_AGGREGATED_SIGNALS
+from can_rollup import ROLLUP_LEVELS, available_rollup_levels, rollup_file_path
+from can_timestamps import NS_PER_SECOND, timestamp_column_ns
+from can_zonemap import DBC_PREFIX_PATTERN
+
+# Decoded outputs written by the extraction scripts
+DECODED_FILE_PATTERNS = ['gen_can_data_*.csv', 'extractedcan_*.csv', 'extractedcan_*.xlsx', 'decoded_can_data_*.xlsx']
+
+# Columns copied from the logger CSV that are not signals
+NON_SIGNAL_COLUMNS = ['Index', 'Nr', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
+
+
+# Function to load one decoded output into a time-indexed numeric DataFrame; a workbook that rolled over to more
+# sheets at the Excel row limit (Part_1, Part_2, ...) is read sheet after sheet
+def load_decoded_file(file_path):
+    if file_path.endswith('.xlsx'):
+        df = pd.concat(pd.read_excel(file_path, sheet_name=None).values(), ignore_index=True)
+    else:
+        df = pd.read_csv(file_path, low_memory=False)
+    if 'Timestamp' in df.columns:
+        index = timestamp_column_ns(df['Timestamp'])
+    elif 'Time' in df.columns:
+        index = timestamp_column_ns(df['Time'])
+    else:
+        raise KeyError(f"No 'Timestamp' or 'Time' column in {file_path}")
+    signals = df.drop(columns=[col for col in NON_SIGNAL_COLUMNS if col in df.columns])
+    # The scripts write missing values as 'null' strings
+    signals = signals.apply(pd.to_numeric, errors='coerce')
+    signals.index = pd.DatetimeIndex(index.astype('datetime64[ns]'), name='Timestamp')
+    if not signals.index.is_monotonic_increasing:
+        signals = signals.sort_index(kind='stable')
+    return signals
+
+
+# Function to tell whether an output column holds per-second maxima rather than means
+def is_max_aggregated(signal):
+    return DBC_PREFIX_PATTERN.sub('', signal) in MAX_AGGREGATED_SIGNALS
+
+
+# Function to load the rollup levels written next to a decoded output, on the time base of the loaded log (the
+# outputs keep the time of day only, the rollups the full logger time, so whole days are shifted away)
+def load_rollups(file_path, log_df):
+    base_path = os.path.splitext(file_path)[0]
+    day_ns = 86400 * NS_PER_SECOND
+    rollups = {}
+    for level in available_rollup_levels(base_path):
+        rollup_df = pd.read_parquet(rollup_file_path(base_path, level))
+        buckets = rollup_df.pop('bucket_ns').to_numpy(dtype=np.int64)
+        if len(log_df) and len(buckets):
+            buckets = buckets + (log_df.index[0].value // day_ns - buckets[0] // day_ns) * day_ns
+        rollup_df.index = pd.DatetimeIndex(buckets.astype('datetime64[ns]'), name='Timestamp')
+        rollups[level] = rollup_df
+    return rollups
+
+
+# All decoded outputs in a directory, opened once and kept in memory; logs are named by their file name, so the CSV
+# and the Excel output of the same log stay apart
+class SignalStore:
+    def __init__(self, directory):
+        self.logs = {}
+        self.rollups = {}
+        for pattern in DECODED_FILE_PATTERNS:
+            for file_path in sorted(glob.glob(os.path.join(directory, pattern))):
+                log_name = os.path.basename(file_path)
+                try:
+                    self.logs[log_name] = load_decoded_file(file_path)
+                    self.rollups[log_name] = load_rollups(file_path, self.logs[log_name])
+                    print(f"Loaded {log_name}: {len(self.logs[log_name])} rows"
+                          + (f", rollups {list(self.rollups[log_name])}" if self.rollups[log_name] else ""))
+                except Exception as e:
+                    print(f"Error loading {file_path}: {e}")
+
+    def describe(self):
+        return [{'log': name, 'rows': len(df), 'signals': list(df.columns),
+                 'start': df.index[0].isoformat() if len(df) else None,
+                 'end': df.index[-1].isoformat() if len(df) else None,
+                 'rollup_levels': list(self.rollups.get(name, {}))} for name, df in self.logs.items()]
+
+    # Function to find a log by file name, or by the name without extension when only one output has it
+    def resolve_log(self, log_name):
+        if log_name in self.logs:
+            return log_name
+        matches = [name for name in self.logs if os.path.splitext(name)[0] == log_name]
+        if len(matches) == 1:
+            return matches[0]
+        if matches:
+            raise KeyError(f"Log '{log_name}' is ambiguous, use one of {matches}")
+        raise KeyError(f"Unknown log '{log_name}'")
+
+    # Signals between start and end (inclusive), optionally resampled to a pandas offset like '1s' or '100ms'
+    def query(self, log_name, signals, start, end, resample):
+        log_name = self.resolve_log(log_name)
+        df = self.logs[log_name]
+        missing = [signal for signal in signals if signal not in df.columns]
+        if missing:
+            raise KeyError(f"Signals not in {log_name}: {missing}")
+        signals = signals or list(df.columns)
+        level = self.rollup_level(log_name, signals, resample)
+        if level is not None:
+            return self.query_rollup(log_name, level, signals, start, end, resample)
+        first = df.index.searchsorted(parse_query_time(start, df), side='left') if start else 0
+        last = df.index.searchsorted(parse_query_time(end, df), side='right') if end else len(df)
+        result = df.iloc[first:last][signals]
+        if resample:
+            result = result.resample(resample).mean().dropna(how='all')
+        return result
+
+    # Function to pick the rollup level a resampled query is answered from: the coarsest level whose bucket width
+    # divides the resample interval and that has all the signals; None to scan the full-resolution data (no
+    # rollups, a finer interval, or a calendar offset like 'MS'). Per-second maxima need the 1 s level.
+    def rollup_level(self, log_name, signals, resample):
+        rollups = self.rollups.get(log_name)
+        if not rollups or not resample:
+            return None
+        try:
+            interval_ns = pd.Timedelta(pd.tseries.frequencies.to_offset(resample)).value
+        except ValueError:
+            return None
+        for level in sorted(rollups, key=ROLLUP_LEVELS.get, reverse=True):
+            if ROLLUP_LEVELS[level] != 1 and any(is_max_aggregated(signal) for signal in signals):
+                continue
+            level_ns = ROLLUP_LEVELS[level] * NS_PER_SECOND
+            if interval_ns % level_ns == 0 and all(f"{signal}_mean" in rollups[level].columns for signal in signals):
+                return level
+        return None
+
+    # Function to resample from a rollup level; the mean of every interval is the frame-count weighted mean of its
+    # buckets (the plain mean of the 1 s maxima for per-second maxima), and the buckets overlapping start/end are
+    # taken whole
+    def query_rollup(self, log_name, level, signals, start, end, resample):
+        rollup_df = self.rollups[log_name][level]
+        df = self.logs[log_name]
+        width = pd.Timedelta(seconds=ROLLUP_LEVELS[level])
+        first = rollup_df.index.searchsorted(parse_query_time(start, df) - width, side='right') if start else 0
+        last = rollup_df.index.searchsorted(parse_query_time(end, df), side='right') if end else len(rollup_df)
+        buckets = rollup_df.iloc[first:last]
+        counts = buckets[[f"{signal}_count" for signal in signals]].set_axis(signals, axis=1)
+        sums = buckets[[f"{signal}_mean" for signal in signals]].set_axis(signals, axis=1) * counts
+        result = sums.resample(resample).sum(min_count=1) / counts.resample(resample).sum().where(lambda n: n > 0)
+        for signal in filter(is_max_aggregated, signals):
+            result[signal] = buckets[f"{signal}_max"].resample(resample).mean()
+        return result.dropna(how='all')
+
+
+# Function to parse a query time; a bare time of day is taken on the log's first date
+def parse_query_time(value, df):
+    timestamp = pd.Timestamp(value)
+    if ':' in value and '-' not in value and len(df):
+        timestamp = pd.Timestamp.combine(df.index[0].date(), timestamp.time())
+    return timestamp
+
+
+# Function to encode a query result as JSON or an Arrow IPC stream
+def encode_result(result, output_format):
+    if output_format == 'arrow':
+        import pyarrow as pa
+        table = pa.Table.from_pandas(result.reset_index(), preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), 'application/vnd.apache.arrow.stream'
+    body = result.reset_index().to_json(orient='split', index=False, date_format='iso', date_unit='ms')
+    return body.encode(), 'application/json'
+
+
+# Least-recently-used cache of encoded query responses
+class ResultCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+# HTTP front end: answers /logs and /query, running queries on a thread pool so requests are served concurrently
+class QueryService:
+    def __init__(self, store, cache_size, workers):
+        self.store = store
+        self.cache = ResultCache(cache_size)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.in_flight = {}
+
+    def run_query(self, key):
+        log_name, signals, start, end, resample, output_format = key
+        result = self.store.query(log_name, list(signals), start, end, resample)
+        return encode_result(result, output_format)
+
+    async def answer_query(self, params):
+        signals = tuple(s for s in params.get('signals', '').split(',') if s)
+        key = (params.get('log', ''), signals, params.get('start'), params.get('end'), params.get('resample'),
+               params.get('format', 'json'))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # Identical queries arriving together share one computation
+        if key not in self.in_flight:
+            loop = asyncio.get_running_loop()
+            self.in_flight[key] = loop.run_in_executor(self.executor, self.run_query, key)
+        try:
+            response = await self.in_flight[key]
+        finally:
+            self.in_flight.pop(key, None)
+        self.cache.put(key, response)
+        return response
+
+    # Function to answer one request target; bad parameters get a 400 and any other failure a 500, both with a JSON
+    # error, so the client always gets a response
+    async def route(self, target):
+        try:
+            url = urlsplit(target)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if url.path == '/logs':
+                return 200, json.dumps(self.store.describe()).encode(), 'application/json'
+            if url.path == '/stats':
+                stats = {'cache_entries': len(self.cache.entries), 'cache_hits': self.cache.hits,
+                         'cache_misses': self.cache.misses}
+                return 200, json.dumps(stats).encode(), 'application/json'
+            if url.path == '/query':
+                body, content_type = await self.answer_query(params)
+                return 200, body, content_type
+            return 404, json.dumps({'error': f"Unknown path {url.path}"}).encode(), 'application/json'
+        except (KeyError, ValueError, ImportError) as e:
+            message = e.args[0] if isinstance(e, KeyError) and e.args else str(e)
+            return 400, json.dumps({'error': message}).encode(), 'application/json'
+        except Exception as e:
+            print(f"Request {target} failed: {e!r}")
+            return 500, json.dumps({'error': f"Internal error: {e}"}).encode(), 'application/json'
+
+    # Function to write one HTTP response
+    async def respond(self, writer, status, body, content_type, elapsed_ms, keep_alive):
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                     f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"X-Query-Time-Ms: {elapsed_ms:.3f}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    # Not 'METHOD target version': answer and close, the rest of the stream cannot be trusted
+                    await self.respond(writer, 400, b'{"error": "Malformed request line"}', 'application/json', 0.0,
+                                       False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                started = time.perf_counter()
+                if method != 'GET':
+                    status, body, content_type = 405, b'{"error": "Only GET is supported"}', 'application/json'
+                else:
+                    status, body, content_type = await self.route(target)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, body, content_type, elapsed_ms, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Serving {len(service.store.logs)} decoded logs on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve decoded CAN signals over HTTP with result caching")
+    parser.add_argument('--directory', default=r"E:\KONWERT\CAN\Can_extracted_csv",
+                        help="Directory holding the decoded outputs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=256, help="Number of query results kept in the LRU cache")
+    parser.add_argument('--workers', type=int, default=4, help="Threads used to run uncached queries")
+    args = parser.parse_args()
+
+    store = SignalStore(args.directory)
+    if not store.logs:
+        raise FileNotFoundError(f"No decoded outputs found in {args.directory}")
+    try:
+        asyncio.run(serve(QueryService(store, args.cache_size, args.workers), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
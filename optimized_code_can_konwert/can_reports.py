@@ -0,0 +1,227 @@
+import argparse
+import html
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from can_analytics import PHASE_TO_DC_CURRENT, RPM_TO_KMH, MOTOR_EFFICIENCY, MAX_TORQUE_NM
+from can_decode import load_dbc_files, dbc_prefixes, build_prefixed_routing_table, decode_prefixed
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_rollup import RollupPyramid
+from can_timestamps import logger_timestamps_ns, timestamp_column_ns
+from can_trips import TRIP_MANIFEST_FILE_NAME, trip_files
+
+# The 3x3 chart set of clubdata_charts.py, one entry per panel:
+# (x column, y column, column whose max/min is annotated, title, x label, y label, color, annotation label, plain y)
+CHART_PANELS = [
+    ('Time', 'dbc1_MC_MOTOR_SPEED', 'dbc1_MC_MOTOR_SPEED', 'RPM Over Time', 'Time', 'RPM', 'blue', 'RPM', True),
+    ('Time', 'motor_current', 'motor_current', 'Motor Current Over Time', 'Time', 'Current (A)', 'green', 'Current',
+     True),
+    ('Time', 'dbc1_MC_DC_VOLT', 'dbc1_MC_DC_VOLT', 'DC Voltage Over Time', 'Time', 'Voltage (V)', 'red', 'Voltage',
+     True),
+    ('dbc2_Availablecapacity', 'dbc2_State_of_Charge', 'dbc2_State_of_Charge', 'SOC vs Battery Capacity',
+     'Battery Capacity', 'SOC (%)', 'purple', 'SOC', False),
+    ('dbc2_Battery_Voltage', 'dbc2_Battery_Current', 'dbc2_Battery_Current', 'Current vs Voltage', 'Voltage (V)',
+     'Current (A)', 'blue', 'Current', True),
+    ('power', 'battery_power', 'power', 'Motor Power vs Battery Power', 'Motor Power (W)', 'Battery Power (W)', 'green',
+     'Power', True),
+    ('motor_current', 'torque', 'torque', 'Torque vs Current', 'Current (A)', 'Torque (Nm)', 'red', 'Torque', True),
+    ('dbc1_MC_MOTOR_SPEED', 'motor_current', 'motor_current', 'RPM vs Motor Current', 'RPM', 'Current (A)', 'purple',
+     'Current', True),
+    ('dbc1_MC_MOTOR_SPEED', 'power', 'power', 'Power vs RPM', 'RPM', 'Power (W)', 'orange', 'Power', True),
+]
+
+# Output formats written for every report
+REPORT_FORMATS = ['png', 'pdf']
+
+# Figure template of the current worker process, built once and reused for every job it renders
+figure_template = None
+
+
+# Function to load one job's data at one row per second: an Excel output of newaltered.py, or a logger CSV / trip
+# partition decoded against the DBCs (motor controller first, battery second) and averaged per second
+def load_report_data(file_path, dbc_file_paths):
+    if file_path.lower().endswith('.xlsx'):
+        df = pd.read_excel(file_path)
+        df = df.apply(lambda column: column if column.name == 'Time' else pd.to_numeric(column, errors='coerce'))
+        df['Time'] = pd.to_datetime(timestamp_column_ns(df['Time']))
+        return df
+    prefixes = dbc_prefixes(len(dbc_file_paths))
+    routing_table = build_prefixed_routing_table(load_dbc_files(dbc_file_paths), prefixes)
+    pyramid = RollupPyramid({'1s': 1})
+    previous_ns = None
+    for chunk in read_logger_csv(file_path, chunksize=200000, columns=DECODE_COLUMNS,
+                                 payload_arrays=True):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = timestamps_ns[-1]
+        pyramid.update(timestamps_ns, decode_prefixed(chunk, routing_table, prefixes))
+    rollup = pyramid.finish().get('1s')
+    if rollup is None:
+        raise ValueError(f"No frames in {file_path}")
+    df = rollup[[column for column in rollup.columns if column.endswith('_mean')]]
+    df = df.rename(columns=lambda column: column[:-len('_mean')]).reset_index()
+    df.insert(0, 'Time', pd.to_datetime(df.pop('bucket_ns')))
+    # Same derived columns as newaltered.py
+    df['motor_current'] = df.get('dbc1_MC_PH_CURR', np.nan) * PHASE_TO_DC_CURRENT
+    df['vehicle_speed'] = df.get('dbc1_MC_MOTOR_SPEED', np.nan) * RPM_TO_KMH
+    return df
+
+
+# Function to add power, torque and battery power the way clubdata_charts.py does (eco mode efficiency, torque
+# above 35 Nm filtered out)
+def add_power_columns(df):
+    df = df.sort_values('Time')
+    if {'motor_current', 'dbc1_MC_DC_VOLT', 'dbc1_MC_MOTOR_SPEED'} <= set(df.columns):
+        df['power'] = df['motor_current'] * df['dbc1_MC_DC_VOLT'] * MOTOR_EFFICIENCY
+        df['torque'] = df['power'] / (2 * math.pi * df['dbc1_MC_MOTOR_SPEED'] / 60)
+        # Rows without a torque estimate (signals missing in this log or trip) are kept for the other panels
+        df = df[~(df['torque'] > MAX_TORQUE_NM)]
+    if {'dbc2_Battery_Current', 'dbc2_Battery_Voltage'} <= set(df.columns):
+        df['battery_power'] = df['dbc2_Battery_Current'] * df['dbc2_Battery_Voltage']
+    return df
+
+
+# Figure template: the 3x3 grid with titles, labels and one empty line per panel; jobs only swap the line data
+# and the annotations, which is much cheaper than building a figure with nine subplots per job
+class ReportFigure:
+    def __init__(self):
+        self.figure, axes = plt.subplots(3, 3, figsize=(18, 12))
+        self.axes = axes.ravel()
+        self.lines = []
+        self.annotations = []
+        for ax, (x, y, key, title, xlabel, ylabel, color, label, plain) in zip(self.axes, CHART_PANELS):
+            empty_x = np.array([], dtype='datetime64[ns]') if x == 'Time' else np.array([])
+            self.lines.append(ax.plot(empty_x, np.array([]), color=color)[0])
+            ax.set_title(title)
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            ax.grid(True)
+            if plain:
+                ax.ticklabel_format(axis='y', style='plain')
+        self.title = self.figure.suptitle('')
+        # Titles and labels never change, so the layout is computed once for the template
+        self.figure.tight_layout(rect=(0, 0, 1, 0.97))
+        # Limits of the empty panels, restored for a job without the data of a panel
+        self.empty_limits = [(ax.get_xlim(), ax.get_ylim()) for ax in self.axes]
+
+    def render(self, df, title, output_base):
+        for annotation in self.annotations:
+            annotation.remove()
+        self.annotations = []
+        for ax, line, limits, (x, y, key, *_, label, plain) in zip(self.axes, self.lines, self.empty_limits,
+                                                                  CHART_PANELS):
+            if x not in df.columns or y not in df.columns:
+                # Nothing of the previous job may stay: empty line, template limits, no tick labels and a note
+                line.set_data(line.get_xdata()[:0], [])
+                # auto=True keeps autoscaling on for the next job that has the data
+                ax.set_xlim(limits[0], auto=True)
+                ax.set_ylim(limits[1], auto=True)
+                ax.tick_params(labelbottom=False, labelleft=False)
+                self.annotations.append(ax.text(0.5, 0.5, 'No data', transform=ax.transAxes, ha='center',
+                                                va='center', color='gray', fontsize=14))
+                continue
+            line.set_data(df[x].to_numpy(), df[y].to_numpy(dtype=float))
+            ax.tick_params(labelbottom=True, labelleft=True)
+            ax.relim()
+            ax.autoscale_view()
+            values = pd.to_numeric(df[key], errors='coerce')
+            if values.notna().any():
+                for index, text, offset in ((values.idxmax(), 'Max', (-20, 20)), (values.idxmin(), 'Min', (-20, -30))):
+                    self.annotations.append(ax.annotate(
+                        f'{text} {label}\n{values[index]:.2f}', xy=(df.at[index, x], df.at[index, y]), xytext=offset,
+                        textcoords='offset points', arrowprops=dict(arrowstyle='->', color='black')))
+        self.title.set_text(title)
+        paths = []
+        for file_format in REPORT_FORMATS:
+            paths.append(f"{output_base}.{file_format}")
+            self.figure.savefig(paths[-1])
+        return paths
+
+
+# Function to summarise one job for the index
+def report_summary(df):
+    summary = {'rows': len(df), 'start': df['Time'].min(), 'end': df['Time'].max()}
+    for column, stat in (('dbc1_MC_MOTOR_SPEED', 'max'), ('motor_current', 'max'), ('torque', 'max'),
+                         ('power', 'max'), ('dbc2_State_of_Charge', 'min')):
+        summary[f"{stat}_{column}"] = getattr(df[column], stat)() if column in df.columns else None
+    return summary
+
+
+# Function to render the report of one log or trip in a worker process
+def render_report(file_path, dbc_file_paths, output_directory):
+    global figure_template
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    parent = os.path.basename(os.path.dirname(file_path))
+    if os.path.exists(os.path.join(os.path.dirname(file_path), TRIP_MANIFEST_FILE_NAME)):
+        # Trip partitions share file names across logs, so they are named after their log as well
+        name = f"{parent}_{name}"
+    try:
+        df = add_power_columns(load_report_data(file_path, dbc_file_paths))
+        if figure_template is None:
+            figure_template = ReportFigure()
+        paths = figure_template.render(df, name, os.path.join(output_directory, name))
+        return {'report': name, 'source': file_path, 'files': paths, 'error': None, **report_summary(df)}
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return {'report': name, 'source': file_path, 'files': [], 'error': str(e)}
+
+
+# Function to expand the inputs: trip directories (written by can_trips.py) become their trip files
+def expand_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(trip_files(path))
+        else:
+            files.append(path)
+    return files
+
+
+# Function to write the summary index as CSV and as an HTML page linking every report
+def write_report_index(results, output_directory):
+    index_df = pd.DataFrame(results)
+    index_df['files'] = index_df['files'].apply(lambda paths: ';'.join(os.path.basename(path) for path in paths))
+    index_df.to_csv(os.path.join(output_directory, 'index.csv'), index=False)
+    rows = []
+    for result in results:
+        links = ' '.join(f'<a href="{html.escape(os.path.basename(path))}">{path.rsplit(".", 1)[-1]}</a>'
+                         for path in result['files'])
+        image = next((path for path in result['files'] if path.endswith('.png')), None)
+        thumbnail = f'<img src="{html.escape(os.path.basename(image))}" width="360">' if image else \
+            html.escape(result['error'] or '')
+        rows.append(f"<tr><td>{html.escape(result['report'])}</td><td>{result.get('rows', '')}</td>"
+                    f"<td>{result.get('start', '')}</td><td>{result.get('end', '')}</td><td>{links}</td>"
+                    f"<td>{thumbnail}</td></tr>")
+    with open(os.path.join(output_directory, 'index.html'), 'w') as index_file:
+        index_file.write("<html><head><title>CAN reports</title></head><body><table border=\"1\">\n"
+                         "<tr><th>Report</th><th>Rows</th><th>Start</th><th>End</th><th>Files</th><th>Charts</th></tr>\n"
+                         + "\n".join(rows) + "\n</table></body></html>\n")
+    return index_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the clubdata chart set for many logs or trips in parallel")
+    parser.add_argument('--dbc', action='append', default=[],
+                        help="DBC file for logger CSV inputs (repeat; motor controller first, battery second)")
+    parser.add_argument('--output', default=r"E:\KONWERT\CAN\Can_reports", help="Directory for the reports")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Reports rendered in parallel")
+    parser.add_argument('inputs', nargs='+',
+                        help="newaltered.py Excel outputs, logger CSVs or trip directories written by can_trips.py")
+    args = parser.parse_args()
+
+    files = expand_inputs(args.inputs)
+    os.makedirs(args.output, exist_ok=True)
+    # One job per log or trip; each worker keeps its figure template between jobs
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(render_report, files, [args.dbc] * len(files), [args.output] * len(files),
+                                    chunksize=max(1, len(files) // (4 * (args.workers or 1)))))
+    index_df = write_report_index(results, args.output)
+    print(f"{index_df['error'].isna().sum()} of {len(files)} report(s) saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Rollup levels and their bucket width in seconds, finest first
+ROLLUP_LEVELS = {'1s': 1, '10s': 10, '1min': 60, '10min': 600}
+
+# Partial statistics per bucket and signal; 'sum' and 'count' keep partial rollups mergeable and give the mean
+PARTIAL_STATS = ['min', 'max', 'sum', 'count', 'last']
+
+
+# Function to compute the partial statistics of one decoded chunk for one bucket width
+def partial_rollup(timestamps_ns, signals_df, bucket_ns):
+    buckets = pd.Index(np.asarray(timestamps_ns, dtype=np.int64) // bucket_ns * bucket_ns, name='bucket_ns')
+    grouped = signals_df.set_axis(buckets).groupby(level=0, sort=True)
+    return pd.concat({'min': grouped.min(), 'max': grouped.max(), 'sum': grouped.sum(min_count=1),
+                      'count': grouped.count(), 'last': grouped.last()}, axis=1)
+
+
+# Function to merge partial rollups that may share buckets (chunk boundaries, frame groups, finer levels)
+def merge_partials(partials):
+    combined = pd.concat(partials)
+    if combined.index.is_unique:
+        return combined.sort_index()
+    grouped = {stat: combined[stat].groupby(level=0, sort=True) for stat in PARTIAL_STATS}
+    return pd.concat({'min': grouped['min'].min(), 'max': grouped['max'].max(),
+                      'sum': grouped['sum'].sum(min_count=1), 'count': grouped['count'].sum(),
+                      'last': grouped['last'].last()}, axis=1)
+
+
+# Function to roll a finer partial up into wider buckets
+def coarsen_partial(partial, bucket_ns):
+    return merge_partials([partial.set_axis(pd.Index(partial.index // bucket_ns * bucket_ns, name='bucket_ns'))])
+
+
+# Function to turn a partial rollup into the stored layout: <signal>_min/_max/_mean/_last/_count per bucket
+def finalize_rollup(partial):
+    columns = {}
+    for signal in partial['min'].columns:
+        count = partial['count'][signal]
+        columns[f"{signal}_min"] = partial['min'][signal]
+        columns[f"{signal}_max"] = partial['max'][signal]
+        columns[f"{signal}_mean"] = partial['sum'][signal] / count.where(count > 0)
+        columns[f"{signal}_last"] = partial['last'][signal]
+        columns[f"{signal}_count"] = count.fillna(0).astype('int64')
+    return pd.DataFrame(columns, index=partial.index)
+
+
+# Rollup pyramid built incrementally from decoded chunks: call update() per chunk during decoding, then finish()
+class RollupPyramid:
+    def __init__(self, levels=None):
+        self.levels = dict(levels or ROLLUP_LEVELS)
+        self.finest = min(self.levels, key=self.levels.get)
+        self.partials = []
+
+    def update(self, timestamps_ns, signals_df):
+        if len(signals_df) == 0:
+            return
+        signals_df = signals_df.apply(pd.to_numeric, errors='coerce')
+        self.partials.append(partial_rollup(timestamps_ns, signals_df, self.levels[self.finest] * 10**9))
+        # Compact now and then so memory follows the number of buckets rather than the number of chunks
+        if len(self.partials) >= 64:
+            self.partials = [merge_partials(self.partials)]
+
+    # Coarser levels are derived from the finest one, so the raw rows are only grouped once
+    def finish(self):
+        if not self.partials:
+            return {}
+        finest = merge_partials(self.partials)
+        return {level: finalize_rollup(finest if level == self.finest else coarsen_partial(finest, seconds * 10**9))
+                for level, seconds in self.levels.items()}
+
+
+# Function to build the file path of one rollup level stored next to a decoded output
+def rollup_file_path(base_path, level):
+    return f"{base_path}_rollup_{level}.parquet"
+
+
+# Function to write every level of a finished pyramid next to a decoded output
+def write_rollups(rollups, base_path):
+    for level, rollup_df in rollups.items():
+        rollup_df.reset_index().to_parquet(rollup_file_path(base_path, level), index=False)
+
+
+# Function to list the rollup levels available next to a decoded output
+def available_rollup_levels(base_path):
+    return [level for level in ROLLUP_LEVELS if os.path.exists(rollup_file_path(base_path, level))]
+
+
+# Function to pick the coarsest level that still gives at least min_points buckets over the time span
+# Returns None when even the finest level is too coarse, meaning raw data should be used
+def choose_rollup_level(span_ns, min_points=1000, levels=None):
+    levels = levels or ROLLUP_LEVELS
+    for level in sorted(levels, key=levels.get, reverse=True):
+        if span_ns / (levels[level] * 10**9) >= min_points:
+            return level
+    return None
+
+
+# Function to read one statistic of a rollup level as a frame with a 'Time' column and plain signal names
+def read_rollup(base_path, level, stat='mean'):
+    rollup_df = pd.read_parquet(rollup_file_path(base_path, level))
+    suffix = f"_{stat}"
+    signal_columns = [col for col in rollup_df.columns if col.endswith(suffix)]
+    result = rollup_df[signal_columns].rename(columns=lambda col: col[:-len(suffix)])
+    result.insert(0, 'Time', pd.to_datetime(rollup_df['bucket_ns']))
+    return result
@@ -0,0 +1,203 @@
+import re
+import numpy as np
+import pandas as pd
+
+NS_PER_SECOND = 10**9
+NS_PER_DAY = 86400 * NS_PER_SECOND
+
+# A time of day that jumps back by more than half a day is a midnight rollover, smaller steps back are jitter
+ROLLOVER_THRESHOLD_NS = NS_PER_DAY // 2
+
+# Fixed formats written by the logger; the first value of a column decides which parser is used
+ISO_DATETIME = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?$')
+DOTTED_DATETIME = re.compile(r'^\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}:\d{2}(\.\d+)?$')
+TIME_OF_DAY = re.compile(r'^\d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+
+# Function to turn a column of ASCII strings into a (width x rows) uint8 array, zero padded; character position k
+# of every row is then one contiguous vector, which keeps all the per-position arithmetic below vectorized
+def char_columns(values):
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.StringDtype) and values.dtype.storage == 'pyarrow':
+        matrix = arrow_char_matrix(values)
+    else:
+        encoded = np.asarray(values, dtype=object).astype('S')
+        if len(encoded) == 0:
+            return np.zeros((0, 0), dtype=np.uint8)
+        matrix = encoded.view(np.uint8).reshape(len(encoded), encoded.dtype.itemsize)
+    return np.ascontiguousarray(matrix.T)
+
+
+# Function to build the (rows x width) char matrix straight from the Arrow buffers of an Arrow-backed string
+# column, without creating a Python object per row
+def arrow_char_matrix(values):
+    import pyarrow as pa
+    array = pa.array(values)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if array.null_count:
+        raise ValueError("Missing timestamps")
+    offset_type = np.int64 if pa.types.is_large_string(array.type) else np.int32
+    offsets = np.frombuffer(array.buffers()[1], dtype=offset_type)[array.offset:array.offset + len(array) + 1]
+    data = np.frombuffer(array.buffers()[2], dtype=np.uint8) if len(array) else np.zeros(0, dtype=np.uint8)
+    lengths = np.diff(offsets)
+    width = int(lengths.max()) if len(lengths) else 0
+    if len(lengths) and lengths.min() == width:
+        # Fixed-width values (the normal case) are already laid out as a matrix in the data buffer
+        return data[offsets[0]:offsets[-1]].reshape(len(lengths), width)
+    positions = offsets[:-1, None] + np.arange(width)
+    inside = np.arange(width) < lengths[:, None]
+    return np.where(inside, data[np.where(inside, positions, 0)], 0).astype(np.uint8)
+
+
+# Function to read a fixed-position run of decimal digits from every row
+def digits_at(chars, start, length):
+    if start + length > len(chars):
+        raise ValueError(f"Expected {length} digits at position {start}")
+    value = np.zeros(chars.shape[1], dtype=np.int64)
+    for position in range(start, start + length):
+        digit = chars[position] - np.uint8(ord('0'))
+        # Characters below '0' wrap around, so one comparison rejects everything that is not a digit
+        if (digit > 9).any():
+            raise ValueError(f"Expected a digit at position {position}")
+        value = value * 10 + digit
+    return value
+
+
+# Function to check that every row has one of the given separators at a fixed position
+def check_separator(chars, position, separators):
+    if position >= len(chars) or not np.isin(chars[position], [ord(separator) for separator in separators]).all():
+        raise ValueError(f"Expected one of {separators!r} at position {position}")
+
+
+# Function to read an optional '.ffffff' fraction starting at a fixed position as nanoseconds
+def fraction_ns(chars, start):
+    value = np.zeros(chars.shape[1], dtype=np.int64)
+    if len(chars) <= start:
+        return value
+    check_separator(chars, start, '.\0')
+    digit_positions = range(start + 1, min(len(chars), start + 10))
+    for position in digit_positions:
+        digit = chars[position] - np.uint8(ord('0'))
+        # Shorter values are zero padded, which reads the same as trailing zero digits
+        digit[chars[position] == 0] = 0
+        if (digit > 9).any():
+            raise ValueError(f"Expected a fraction digit at position {position}")
+        value = value * 10 + digit
+    return value * 10 ** (9 - len(digit_positions))
+
+
+# Function to apply a field parser only to the rows where the text of the field differs from the row before and
+# spread the results over the unchanged rows; dates and whole seconds repeat for hundreds of consecutive frames
+def parse_changed_rows(chars, start, length, parse):
+    changed = np.zeros(chars.shape[1], dtype=bool)
+    changed[0] = True
+    for position in range(start, min(len(chars), start + length)):
+        changed[1:] |= chars[position, 1:] != chars[position, :-1]
+    return parse(chars[:, changed])[np.cumsum(changed) - 1]
+
+
+# Function to parse 'HH:MM:SS[.ffffff]' at a fixed offset into nanoseconds since midnight
+def time_fields_ns(chars, offset):
+    check_separator(chars, offset + 2, ':')
+    check_separator(chars, offset + 5, ':')
+
+    def whole_seconds_ns(rows):
+        hours = digits_at(rows, offset, 2)
+        minutes = digits_at(rows, offset + 3, 2)
+        seconds = digits_at(rows, offset + 6, 2)
+        return ((hours * 60 + minutes) * 60 + seconds) * NS_PER_SECOND
+    return parse_changed_rows(chars, offset, 8, whole_seconds_ns) + fraction_ns(chars, offset + 8)
+
+
+# Function to convert year/month/day arrays into days since 1970-01-01 (proleptic Gregorian calendar)
+def days_from_civil(years, months, days):
+    years = years - (months <= 2)
+    eras = years // 400
+    year_of_era = years - eras * 400
+    day_of_year = (153 * (months + np.where(months > 2, -3, 9)) + 2) // 5 + days - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return eras * 146097 + day_of_era - 719468
+
+
+# Function to parse a time-of-day column ('HH:MM:SS.fff', the logger 'Time' column) into ns since midnight
+def parse_time_of_day_ns(values):
+    chars = char_columns(values)
+    if chars.shape[1] == 0:
+        return np.zeros(0, dtype=np.int64)
+    return time_fields_ns(chars, 0)
+
+
+# Function to parse a date-time column ('YYYY-MM-DD HH:MM:SS.fff' or 'DD.MM.YYYY HH:MM:SS.fff') into epoch ns
+def parse_datetime_ns(values):
+    chars = char_columns(values)
+    if chars.shape[1] == 0:
+        return np.zeros(0, dtype=np.int64)
+    iso = len(chars) > 4 and chars[4, 0] == ord('-')
+    for position in ((4, 7) if iso else (2, 5)):
+        check_separator(chars, position, '-' if iso else '.')
+    check_separator(chars, 10, ' T')
+
+    def midnight_ns(rows):
+        if iso:
+            return days_from_civil(digits_at(rows, 0, 4), digits_at(rows, 5, 2), digits_at(rows, 8, 2)) * NS_PER_DAY
+        return days_from_civil(digits_at(rows, 6, 4), digits_at(rows, 3, 2), digits_at(rows, 0, 2)) * NS_PER_DAY
+    return parse_changed_rows(chars, 0, 10, midnight_ns) + time_fields_ns(chars, 11)
+
+
+# Function to turn times of day into monotonic epoch ns, adding a day at every midnight rollover
+# base_day_ns is the midnight of the first row; previous_ns continues the day count from an earlier chunk
+def correct_day_rollover(time_of_day_ns, base_day_ns=0, previous_ns=None):
+    time_of_day_ns = np.asarray(time_of_day_ns, dtype=np.int64)
+    if len(time_of_day_ns) == 0:
+        return time_of_day_ns
+    if previous_ns is not None:
+        base_day_ns = previous_ns // NS_PER_DAY * NS_PER_DAY
+        if base_day_ns + time_of_day_ns[0] < previous_ns - ROLLOVER_THRESHOLD_NS:
+            base_day_ns += NS_PER_DAY
+    rollovers = np.zeros(len(time_of_day_ns), dtype=np.int64)
+    rollovers[1:] = np.cumsum(np.diff(time_of_day_ns) < -ROLLOVER_THRESHOLD_NS)
+    return base_day_ns + time_of_day_ns + rollovers * NS_PER_DAY
+
+
+# Function to parse any timestamp column of the logger or of a decoded output into epoch ns, picking the
+# fixed-format parser from the first value. Times of day are placed on base_date and corrected for rollovers.
+def timestamp_column_ns(column, base_date=None, previous_ns=None):
+    column = pd.Series(column)
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    if pd.api.types.is_numeric_dtype(column):
+        # Relative seconds since the start of the recording
+        return datetime_to_ns(base_date or 0) + np.round(column.to_numpy(dtype=float) * NS_PER_SECOND).astype(np.int64)
+    first = str(column.iloc[0]).strip() if len(column) else ''
+    try:
+        if ISO_DATETIME.match(first) or DOTTED_DATETIME.match(first):
+            return parse_datetime_ns(column.str.strip())
+        if TIME_OF_DAY.match(first):
+            return correct_day_rollover(parse_time_of_day_ns(column.str.strip()), datetime_to_ns(base_date or 0),
+                                        previous_ns)
+    except (ValueError, UnicodeEncodeError):
+        pass
+    # Anything else goes through the generic (slow) pandas parser
+    return pd.to_datetime(column, format='mixed').to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+# Function to get monotonic epoch ns for the frames of a logger CSV: the 'Timestamp' column when it carries a
+# date, otherwise the 'Time' column placed on base_date with midnight rollovers corrected
+def logger_timestamps_ns(df_csv, base_date=None, previous_ns=None):
+    if 'Timestamp' in df_csv.columns:
+        first = str(df_csv['Timestamp'].iloc[0]).strip() if len(df_csv) else ''
+        if ISO_DATETIME.match(first) or DOTTED_DATETIME.match(first) or 'Time' not in df_csv.columns:
+            return timestamp_column_ns(df_csv['Timestamp'], base_date, previous_ns)
+    return timestamp_column_ns(df_csv['Time'], base_date, previous_ns)
+
+
+# Function to convert a datetime, date string or epoch-ns integer into epoch ns
+def datetime_to_ns(value):
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(np.datetime64(pd.Timestamp(value).to_datetime64(), 'ns').astype(np.int64))
+
+
+# Function to format epoch ns as 'HH:MM:SS.mmm' text (the format of the 'Time' column)
+def format_time_of_day(timestamps_ns):
+    return pd.to_datetime(np.asarray(timestamps_ns, dtype=np.int64)).strftime('%H:%M:%S.%f').str[:-3]
@@ -0,0 +1,207 @@
+import argparse
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+from can_compressed import open_logger_input, uncompressed_path
+from can_decode import PAYLOAD_BYTE_COLUMNS
+from can_memory import chunk_rows
+
+try:
+    import can
+except ImportError:
+    can = None
+
+# Trace formats read through python-can, picked by file extension (a .gz/.zst/.xz extension may follow):
+# Vector BLF (binary), Vector ASC and PCAN TRC (text)
+TRACE_FORMATS = {'.blf': 'BLFReader', '.asc': 'ASCReader', '.trc': 'TRCReader'}
+TEXT_TRACE_FORMATS = ['.asc', '.trc']
+
+# Frames collected into one batch when the caller does not ask for a chunk size
+TRACE_BATCH_FRAMES = 100000
+
+# Largest payload of a frame (CAN FD)
+MAX_PAYLOAD_BYTES = 64
+
+# 'XX ' text of every byte value, used to build the logger 'Data' column for a whole batch at once
+HEX_BYTES = np.array([f"{value:02X} ".encode() for value in range(256)], dtype='S3').view(np.uint8).reshape(256, 3)
+
+
+# Function to get the trace format of a log from its extension (None for logger CSVs)
+def trace_format(file_path):
+    if not isinstance(file_path, str):
+        return None
+    extension = os.path.splitext(uncompressed_path(file_path))[1].lower()
+    return extension if extension in TRACE_FORMATS else None
+
+
+# Function to open the python-can reader of a trace; compressed traces are decompressed in the background
+def open_trace_reader(file_path):
+    if can is None:
+        raise ImportError("Reading BLF/ASC/TRC traces needs the python-can package")
+    extension = trace_format(file_path)
+    source = open_logger_input(file_path)
+    if source is not file_path and extension in TEXT_TRACE_FORMATS:
+        source = io.TextIOWrapper(source)
+    reader_class = getattr(can, TRACE_FORMATS[extension])
+    if extension == '.asc':
+        # Absolute timestamps from the 'date' line of the header
+        return reader_class(source, relative_timestamp=False)
+    return reader_class(source)
+
+
+# Frame batch of a trace as columns: epoch ns, arbitration ID, extended flag, payload length, receive flag and a
+# (frames x longest payload) byte matrix
+class FrameBatch:
+    def __init__(self, capacity):
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.frame_ids = np.zeros(capacity, dtype=np.int64)
+        self.extended = np.zeros(capacity, dtype=bool)
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.rx = np.zeros(capacity, dtype=bool)
+        self.payloads = np.zeros((capacity, MAX_PAYLOAD_BYTES), dtype=np.uint8)
+        self.count = 0
+
+    def append(self, message):
+        i = self.count
+        self.timestamps[i] = message.timestamp
+        self.frame_ids[i] = message.arbitration_id
+        self.extended[i] = message.is_extended_id
+        self.rx[i] = message.is_rx
+        length = len(message.data)
+        self.lengths[i] = length
+        self.payloads[i, :length] = np.frombuffer(message.data, dtype=np.uint8)
+        self.count += 1
+
+    # Columns of the filled part of the batch
+    def arrays(self):
+        n = self.count
+        width = int(self.lengths[:n].max()) if n else 0
+        # Float seconds since 1970 only carry microseconds exactly, finer digits are rounding noise
+        return {'timestamps_ns': np.round(self.timestamps[:n] * 1e6).astype(np.int64) * 1000,
+                'frame_ids': self.frame_ids[:n], 'extended': self.extended[:n], 'lengths': self.lengths[:n],
+                'rx': self.rx[:n], 'payloads': self.payloads[:n, :width]}
+
+
+# Function to read a trace as batches of frame arrays (see FrameBatch.arrays); error frames are skipped
+# batch_frames is a frame count or a can_memory.ChunkScheduler
+def trace_batches(file_path, batch_frames=TRACE_BATCH_FRAMES):
+    batch = FrameBatch(chunk_rows(batch_frames))
+    with open_trace_reader(file_path) as reader:
+        for message in reader:
+            if message.is_error_frame:
+                continue
+            batch.append(message)
+            if batch.count == len(batch.timestamps):
+                yield batch.arrays()
+                batch = FrameBatch(chunk_rows(batch_frames))
+    if batch.count:
+        yield batch.arrays()
+
+
+# Function to join frame batches into one, padding the payload matrices to the longest payload
+def concat_batches(batches):
+    width = max(batch['payloads'].shape[1] for batch in batches)
+    joined = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0] if key != 'payloads'}
+    joined['payloads'] = np.concatenate([np.pad(batch['payloads'], ((0, 0), (0, width - batch['payloads'].shape[1])))
+                                         for batch in batches])
+    return joined
+
+
+# Function to build the logger 'Data' text ('FE 01 5B ...') of every frame with array operations
+def payload_hex_text(payloads, lengths):
+    if payloads.shape[1] == 0:
+        return np.full(len(lengths), '', dtype=object)
+    chars = HEX_BYTES[payloads].reshape(len(payloads), -1)
+    # Blank out everything from the trailing space of the last byte on; the bytes view drops trailing zeros
+    chars[np.arange(chars.shape[1]) >= np.maximum(3 * lengths - 1, 0)[:, None]] = 0
+    return np.ascontiguousarray(chars).view(f'S{chars.shape[1]}').ravel().astype(str)
+
+
+# Function to build the logger 'Frame ID' column: 8 hex digits for extended IDs, 3 for standard ones, dictionary
+# encoded like the CSV reader does
+def frame_id_categorical(frame_ids, extended):
+    keys, codes = np.unique(frame_ids * 2 + extended, return_inverse=True)
+    categories = [f"{key >> 1:08X}" if key & 1 else f"{key >> 1:03X}" for key in keys]
+    return pd.Categorical.from_codes(codes.ravel(), categories=categories)
+
+
+# Function to turn a frame batch into the logger CSV schema (see can_ingest.LOGGER_COLUMNS), so every decoder of
+# the repo can consume it; 'Timestamp' is a datetime column, nothing is formatted and parsed back
+# With payload_arrays the frame arrays are kept as they are for the bulk decoders (see can_decode.rows_decoder):
+# 'Frame ID' holds the numeric IDs, the payload comes as the PAYLOAD_BYTE_COLUMNS of the byte matrix plus 'Length'
+# instead of the 'Data' hex text, and the 'Time' text is left out (the frame times come from 'Timestamp')
+def batch_frame(arrays, columns, start=0, payload_arrays=False):
+    n = len(arrays['timestamps_ns'])
+    with_payloads = payload_arrays and 'Data' in columns
+    if payload_arrays:
+        columns = [column for column in columns if column not in ('Time', 'Data')]
+        columns += ['Length'] if with_payloads and 'Length' not in columns else []
+    builders = {
+        'Index': lambda: np.arange(start + 1, start + n + 1),
+        'Timestamp': lambda: pd.to_datetime(arrays['timestamps_ns']),
+        'Time': lambda: pd.Series(np.datetime_as_string(arrays['timestamps_ns'].view('datetime64[ns]'), unit='ms'),
+                                  dtype='string').str.slice(11),
+        'Type': lambda: pd.Categorical(np.where(arrays['rx'], 'Rx', 'Tx')),
+        'Frame ID': lambda: frame_id_categorical(arrays['frame_ids'], arrays['extended']),
+        'Length': lambda: arrays['lengths'],
+        'Data': lambda: pd.array(payload_hex_text(arrays['payloads'], arrays['lengths']), dtype='string'),
+    }
+    if payload_arrays:
+        builders['Frame ID'] = lambda: arrays['frame_ids']
+    df = pd.DataFrame({column: builders[column]() for column in columns})
+    if with_payloads:
+        payloads = arrays['payloads']
+        df = pd.concat([df, pd.DataFrame(payloads, columns=PAYLOAD_BYTE_COLUMNS[:payloads.shape[1]])], axis=1)
+    df.index = pd.RangeIndex(start, start + n)
+    return df
+
+
+# Function to read a trace with the logger CSV schema: one DataFrame, or an iterator of chunks of chunksize frames
+# (payload_arrays: see batch_frame)
+def read_trace(file_path, chunksize, columns, payload_arrays=False):
+    if chunksize is not None:
+        return read_trace_chunks(file_path, chunksize, columns, payload_arrays)
+    batches = list(trace_batches(file_path))
+    if not batches:
+        return batch_frame(FrameBatch(0).arrays(), columns, payload_arrays=payload_arrays)
+    return batch_frame(concat_batches(batches), columns, payload_arrays=payload_arrays)
+
+
+# Function to build logger CSV metadata and header rows for a trace, for writers that copy them (trip partitions)
+def trace_header_lines(file_path):
+    return ["Trace export\n", f"Source;{os.path.basename(file_path)}\n", "Index;Timestamp;Time;Type;Id;Length;Data\n"]
+
+
+# Function to stream a trace in chunks with the logger CSV schema, numbered continuously
+def read_trace_chunks(file_path, chunksize, columns, payload_arrays=False):
+    start = 0
+    for arrays in trace_batches(file_path, chunksize):
+        yield batch_frame(arrays, columns, start, payload_arrays)
+        start += len(arrays['timestamps_ns'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read BLF/ASC/TRC traces into frame arrays and report the rate")
+    parser.add_argument('trace_files', nargs='+', help="Vector BLF/ASC or PCAN TRC traces (optionally compressed)")
+    args = parser.parse_args()
+
+    for trace_file_path in args.trace_files:
+        start = time.perf_counter()
+        frames = 0
+        frame_ids = set()
+        first_ns = last_ns = None
+        for arrays in trace_batches(trace_file_path):
+            frames += len(arrays['timestamps_ns'])
+            frame_ids.update(np.unique(arrays['frame_ids']).tolist())
+            first_ns = arrays['timestamps_ns'][0] if first_ns is None else first_ns
+            last_ns = arrays['timestamps_ns'][-1]
+        elapsed = time.perf_counter() - start
+        print(f"{trace_file_path}: {frames} frames, {len(frame_ids)} frame ID(s), "
+              f"{pd.Timestamp(first_ns) if frames else '-'} - {pd.Timestamp(last_ns) if frames else '-'}, "
+              f"{frames / max(elapsed, 1e-9):.0f} frames/s")
+
+
+if __name__ == '__main__':
+    main()
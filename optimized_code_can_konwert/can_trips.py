@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from can_decode import load_dbc_files, build_routing_table, decode_by_frame, frame_ids_from_text
+from can_compressed import logger_header_lines, uncompressed_path
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_traces import trace_format, trace_header_lines
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns
+
+# A frame gap this long is bus silence (vehicle switched off) and always ends a trip
+BUS_SILENCE_NS = 30 * NS_PER_SECOND
+
+# The motor standing still for longer than this ends a trip; the idle time in between is not written
+IDLE_SPLIT_NS = 120 * NS_PER_SECOND
+
+# Time kept before the first and after the last movement of a trip
+TRIP_PADDING_NS = 5 * NS_PER_SECOND
+
+# Trips that move for less than this are dropped
+MIN_TRIP_NS = 10 * NS_PER_SECOND
+
+# Signal that tells whether the vehicle is moving; without it every frame counts as activity
+SPEED_SIGNAL_NAME = 'MC_MOTOR_SPEED'
+
+# Metadata written next to the trip partitions of one log
+TRIP_MANIFEST_FILE_NAME = '_trips.json'
+
+
+# Function to find the message carrying the speed signal (None when no DBC defines it)
+def speed_message(routing_table, signal_name=SPEED_SIGNAL_NAME):
+    for message in routing_table.values():
+        if any(signal.name == signal_name for signal in message.signals):
+            return message
+    return None
+
+
+# Function to compress sorted activity timestamps into [start, end] intervals, split where they are further apart
+# than max_gap_ns
+def activity_intervals(active_ns, max_gap_ns):
+    if len(active_ns) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(active_ns) > max_gap_ns)
+    starts = active_ns[np.concatenate([[0], breaks + 1])]
+    ends = active_ns[np.concatenate([breaks, [len(active_ns) - 1]])]
+    return [[int(start), int(end)] for start, end in zip(starts, ends)]
+
+
+# Function to append the intervals of a new chunk, joining the first one to the last known one when they are close
+def extend_intervals(intervals, new_intervals, max_gap_ns):
+    if intervals and new_intervals and new_intervals[0][0] - intervals[-1][1] <= max_gap_ns:
+        intervals[-1][1] = new_intervals[0][1]
+        new_intervals = new_intervals[1:]
+    intervals.extend(new_intervals)
+
+
+# Function to scan a logger CSV once, decoding only the speed frames
+# Returns the activity intervals, the bus silences as (last frame, next frame) pairs, the frame count and the
+# time range of the log
+def scan_activity(csv_file_path, routing_table, chunksize=500000):
+    message = speed_message(routing_table)
+    intervals = []
+    silences = []
+    frames = 0
+    first_ns = None
+    previous_ns = None
+    for chunk in read_logger_csv(csv_file_path, chunksize=chunksize, columns=DECODE_COLUMNS,
+                                 payload_arrays=True):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        with_previous = timestamps_ns if previous_ns is None else np.concatenate([[previous_ns], timestamps_ns])
+        for gap in np.flatnonzero(np.diff(with_previous) > BUS_SILENCE_NS):
+            silences.append((int(with_previous[gap]), int(with_previous[gap + 1])))
+        first_ns = timestamps_ns[0] if first_ns is None else first_ns
+        previous_ns = timestamps_ns[-1]
+        frames += len(chunk)
+
+        if message is None:
+            active_ns = timestamps_ns
+        else:
+            speed_rows = frame_ids_from_text(chunk['Frame ID']) == message.frame_id
+            decoded = decode_by_frame(chunk[speed_rows], {message.frame_id: message})
+            speed = decoded.get(message.frame_id, pd.DataFrame(columns=[SPEED_SIGNAL_NAME]))[SPEED_SIGNAL_NAME]
+            moving = pd.to_numeric(speed, errors='coerce').fillna(0).to_numpy() != 0
+            active_ns = timestamps_ns[speed_rows][moving]
+        extend_intervals(intervals, activity_intervals(active_ns, IDLE_SPLIT_NS), IDLE_SPLIT_NS)
+    return intervals, silences, frames, (first_ns, previous_ns)
+
+
+# Function to turn activity intervals into trips: split at bus silences, drop short ones, add padding (clipped to
+# the time range of the log)
+def build_trips(intervals, silences, log_range):
+    split = []
+    for start, end in intervals:
+        for silence_start, silence_end in silences:
+            if start <= silence_start and silence_end <= end:
+                split.append((start, silence_start, 'bus_silence'))
+                start = silence_end
+        split.append((start, end, None))
+    trips = []
+    for i, (start, end, ended_by) in enumerate(split):
+        if ended_by is None:
+            next_start = split[i + 1][0] if i + 1 < len(split) else None
+            silent = next_start is not None and any(end <= s and e <= next_start for s, e in silences)
+            ended_by = 'end_of_log' if next_start is None else 'bus_silence' if silent else 'idle'
+        if end - start < MIN_TRIP_NS:
+            continue
+        trips.append({'trip': len(trips) + 1, 'start_ns': int(max(start - TRIP_PADDING_NS, log_range[0])),
+                      'end_ns': int(min(end + TRIP_PADDING_NS, log_range[1])),
+                      'moving_s': (end - start) / NS_PER_SECOND, 'ended_by': ended_by})
+    return trips
+
+
+# Function to split a logger CSV into one logger CSV per trip plus the _trips.json manifest
+# The trip files keep the logger format, so every decoder of the repo can process them independently
+def write_trip_partitions(csv_file_path, output_directory, routing_table, chunksize=500000):
+    intervals, silences, frames, log_range = scan_activity(csv_file_path, routing_table, chunksize)
+    trips = build_trips(intervals, silences, log_range)
+    log_name = os.path.splitext(os.path.basename(uncompressed_path(csv_file_path)))[0]
+    log_directory = os.path.join(output_directory, log_name)
+    os.makedirs(log_directory, exist_ok=True)
+
+    # Remove the trip files of an earlier split of the same log, their boundaries may have changed
+    if os.path.exists(os.path.join(log_directory, TRIP_MANIFEST_FILE_NAME)):
+        for old_trip_file in trip_files(log_directory):
+            if os.path.exists(old_trip_file):
+                os.remove(old_trip_file)
+
+    if trace_format(csv_file_path):
+        header_lines = trace_header_lines(csv_file_path)
+    else:
+        header_lines = logger_header_lines(csv_file_path)
+    starts = np.array([trip['start_ns'] for trip in trips], dtype=np.int64)
+    ends = np.array([trip['end_ns'] for trip in trips], dtype=np.int64)
+    for trip in trips:
+        trip['file'] = f"trip_{trip['trip']:03d}.csv"
+        trip['frames'] = 0
+    handles = {}
+    previous_ns = None
+    try:
+        for chunk in read_logger_csv(csv_file_path, chunksize=chunksize):
+            timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+            previous_ns = timestamps_ns[-1]
+            trip_index = np.searchsorted(starts, timestamps_ns, side='right') - 1
+            inside = trip_index >= 0
+            inside[inside] = timestamps_ns[inside] <= ends[trip_index[inside]]
+            for index in np.unique(trip_index[inside]):
+                rows = inside & (trip_index == index)
+                trip = trips[index]
+                if index not in handles:
+                    handles[index] = open(os.path.join(log_directory, trip['file']), 'w', newline='')
+                    handles[index].writelines(header_lines)
+                chunk[rows].to_csv(handles[index], sep=';', header=False, index=False)
+                trip['frames'] += int(rows.sum())
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    for trip in trips:
+        trip['start'] = pd.Timestamp(trip['start_ns']).isoformat()
+        trip['end'] = pd.Timestamp(trip['end_ns']).isoformat()
+        trip['duration_s'] = (trip['end_ns'] - trip['start_ns']) / NS_PER_SECOND
+    manifest = {'log': log_name, 'source': os.path.abspath(csv_file_path), 'frames': frames,
+                'frames_skipped': frames - sum(trip['frames'] for trip in trips), 'trips': trips}
+    with open(os.path.join(log_directory, TRIP_MANIFEST_FILE_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+# Function to read the trip manifest of one split log
+def read_trip_manifest(log_directory):
+    with open(os.path.join(log_directory, TRIP_MANIFEST_FILE_NAME)) as manifest_file:
+        return json.load(manifest_file)
+
+
+# Function to list the trip files of one split log, to hand them to per-trip workers
+def trip_files(log_directory):
+    return [os.path.join(log_directory, trip['file']) for trip in read_trip_manifest(log_directory)['trips']]
+
+
+# Function to split one log in a worker process
+def split_log(csv_file_path, output_directory, dbc_file_paths):
+    return write_trip_partitions(csv_file_path, output_directory, build_routing_table(load_dbc_files(dbc_file_paths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split logger CSVs into one partition per trip")
+    parser.add_argument('--dbc', action='append', default=[],
+                        help=f"DBC file defining {SPEED_SIGNAL_NAME} (repeat for several); without it trips are "
+                             f"split on bus silence only")
+    parser.add_argument('--output', default=r"E:\KONWERT\CAN\Can_trips", help="Directory for the trip partitions")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Logs split in parallel")
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    count = len(args.csv_files)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        manifests = executor.map(split_log, args.csv_files, [args.output] * count, [args.dbc] * count)
+        for manifest in manifests:
+            print(f"{manifest['log']}: {len(manifest['trips'])} trip(s), "
+                  f"{manifest['frames_skipped']} of {manifest['frames']} frames skipped as idle")
+            for trip in manifest['trips']:
+                print(f"  {trip['file']}: {trip['start']} - {trip['end']} ({trip['duration_s']:.0f} s, "
+                      f"{trip['frames']} frames, ended by {trip['ended_by']})")
+    print(f"Trip partitions saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
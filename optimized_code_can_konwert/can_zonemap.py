@@ -0,0 +1,186 @@
+import argparse
+import glob
+import json
+import operator
+import os
+import re
+import numpy as np
+import pandas as pd
+from can_decode import load_dbc_files, dbc_prefixes, build_prefixed_routing_table, decode_prefixed, frame_ids_from_text
+from can_decode import numeric_signal_values
+from can_compressed import uncompressed_path
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_timestamps import logger_timestamps_ns, datetime_to_ns
+
+# Comparisons a query condition can use, as written on the command line
+CONDITION_OPERATORS = {'>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt, '==': operator.eq}
+CONDITION_PATTERN = re.compile(r'^\s*(\w+)\s*(>=|<=|==|>|<)\s*(-?[\d.]+(?:[eE]-?\d+)?)\s*$')
+
+# Column prefix added by the N-DBC decoder (dbc1_, dbc2_, ...)
+DBC_PREFIX_PATTERN = re.compile(r'^dbc\d+_')
+
+
+# Function to build the file path of the zone-map sidecar of a decoded output or a logger CSV
+def zonemap_file_path(base_path):
+    return f"{base_path}_zonemap.json"
+
+
+# Zone-map builder fed during decoding: time range, frame ID counts and per-signal min/max/count/nulls
+# ('nulls' counts the rows of the decoded output without a value for the signal)
+class ZoneMapBuilder:
+    def __init__(self):
+        self.time_min = None
+        self.time_max = None
+        self.frames = 0
+        self.frame_counts = {}
+        self.signals = {}
+
+    def update(self, timestamps_ns, frame_ids, decoded_df):
+        if len(timestamps_ns):
+            low, high = int(np.min(timestamps_ns)), int(np.max(timestamps_ns))
+            self.time_min = low if self.time_min is None else min(self.time_min, low)
+            self.time_max = high if self.time_max is None else max(self.time_max, high)
+        frame_ids = np.asarray(frame_ids)
+        self.frames += len(frame_ids)
+        ids, counts = np.unique(frame_ids[frame_ids >= 0], return_counts=True)
+        for frame_id, count in zip(ids, counts):
+            key = f"{int(frame_id):08X}"
+            self.frame_counts[key] = self.frame_counts.get(key, 0) + int(count)
+        for signal in decoded_df.columns:
+            values = numeric_signal_values(decoded_df[signal])
+            present = int(decoded_df[signal].notna().sum())
+            stats = self.signals.setdefault(signal, {'min': None, 'max': None, 'count': 0, 'nulls': 0})
+            stats['count'] += present
+            stats['nulls'] += len(decoded_df) - present
+            if values.notna().any():
+                low, high = float(values.min()), float(values.max())
+                stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+                stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+
+    def finish(self, source=None, output=None):
+        return {'source': source, 'output': output, 'frames': self.frames,
+                'time_min': self.time_min, 'time_max': self.time_max,
+                'start': None if self.time_min is None else pd.Timestamp(self.time_min).isoformat(),
+                'end': None if self.time_max is None else pd.Timestamp(self.time_max).isoformat(),
+                'frame_ids': dict(sorted(self.frame_counts.items())), 'signals': self.signals}
+
+
+# Function to write a zone-map sidecar next to a decoded output (or a logger CSV)
+def write_zonemap(zonemap, base_path):
+    with open(zonemap_file_path(base_path), 'w') as zonemap_file:
+        json.dump(zonemap, zonemap_file, indent=1)
+
+
+# Function to summarise a single decoded table in one go (scripts that decode the whole file at once)
+def build_zonemap(timestamps_ns, frame_ids, decoded_df, source=None, output=None):
+    builder = ZoneMapBuilder()
+    builder.update(timestamps_ns, frame_ids, decoded_df)
+    return builder.finish(source, output)
+
+
+# Function to decode a logger CSV once and write its sidecar next to it, for logs decoded before sidecars existed
+def summarize_log(csv_file_path, dbc_file_paths, chunksize=200000):
+    prefixes = dbc_prefixes(len(dbc_file_paths))
+    routing_table = build_prefixed_routing_table(load_dbc_files(dbc_file_paths), prefixes)
+    builder = ZoneMapBuilder()
+    previous_ns = None
+    for chunk in read_logger_csv(csv_file_path, chunksize=chunksize, columns=DECODE_COLUMNS,
+                                 payload_arrays=True):
+        timestamps_ns = logger_timestamps_ns(chunk, previous_ns=previous_ns)
+        previous_ns = timestamps_ns[-1]
+        builder.update(timestamps_ns, frame_ids_from_text(chunk['Frame ID']),
+                       decode_prefixed(chunk, routing_table, prefixes))
+    zonemap = builder.finish(source=os.path.abspath(csv_file_path))
+    write_zonemap(zonemap, os.path.splitext(uncompressed_path(csv_file_path))[0])
+    return zonemap
+
+
+# Function to parse a condition like 'Battery_Current>100' into (signal, operator, value)
+def parse_condition(condition):
+    match = CONDITION_PATTERN.match(condition)
+    if not match:
+        raise ValueError(f"Invalid condition {condition!r}, expected <signal><op><number> with op one of "
+                         f"{list(CONDITION_OPERATORS)}")
+    return match.group(1), match.group(2), float(match.group(3))
+
+
+# Function to find the statistics of a signal in a zone map, with or without its dbc<N>_ prefix
+def matching_signal_stats(zonemap, signal):
+    return [stats for name, stats in zonemap['signals'].items()
+            if name == signal or DBC_PREFIX_PATTERN.sub('', name) == signal]
+
+
+# Function to decide from min/max alone whether any sample of a signal can satisfy a condition
+# A signal with samples but no min/max (values that are not numbers) may match; only a signal never seen cannot
+def condition_may_match(stats, op, value):
+    low, high = stats['min'], stats['max']
+    if low is None:
+        return stats.get('count', 1) > 0
+    if op in ('>', '>='):
+        return CONDITION_OPERATORS[op](high, value)
+    if op in ('<', '<='):
+        return CONDITION_OPERATORS[op](low, value)
+    return low <= value <= high
+
+
+# Function to check one zone map against the query: time overlap, frame IDs present and all signal conditions
+def zonemap_matches(zonemap, start_ns=None, end_ns=None, frame_ids=None, conditions=()):
+    if zonemap['time_min'] is None:
+        return False
+    if start_ns is not None and zonemap['time_max'] < start_ns:
+        return False
+    if end_ns is not None and zonemap['time_min'] > end_ns:
+        return False
+    if frame_ids and not all(f"{int(frame_id, 16):08X}" in zonemap['frame_ids'] for frame_id in frame_ids):
+        return False
+    for signal, op, value in conditions:
+        if not any(condition_may_match(stats, op, value) for stats in matching_signal_stats(zonemap, signal)):
+            return False
+    return True
+
+
+# Function to select the logs whose sidecars can match the query, without decoding or loading any of them
+# Returns (matching zone maps with their sidecar path, number of sidecars checked)
+def prune_logs(directory, start=None, end=None, frame_ids=None, conditions=()):
+    start_ns = None if start is None else datetime_to_ns(start)
+    end_ns = None if end is None else datetime_to_ns(end)
+    conditions = [parse_condition(condition) if isinstance(condition, str) else condition for condition in conditions]
+    sidecars = sorted(glob.glob(os.path.join(directory, '**', zonemap_file_path('*')), recursive=True))
+    matches = []
+    for sidecar in sidecars:
+        with open(sidecar) as zonemap_file:
+            zonemap = json.load(zonemap_file)
+        if zonemap_matches(zonemap, start_ns, end_ns, frame_ids, conditions):
+            matches.append({'sidecar': sidecar, **zonemap})
+    return matches, len(sidecars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-log zone-map summaries and sidecar-based log selection")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="Decode logger CSVs once and write their sidecars")
+    build_parser.add_argument('--dbc', action='append', required=True, help="DBC file (repeat for several)")
+    build_parser.add_argument('csv_files', nargs='+')
+    query_parser = subparsers.add_parser('query', help="List the logs whose sidecars can match the query")
+    query_parser.add_argument('--directory', required=True, help="Directory searched recursively for sidecars")
+    query_parser.add_argument('--start', help="Logs ending before this time are skipped")
+    query_parser.add_argument('--end', help="Logs starting after this time are skipped")
+    query_parser.add_argument('--frame-id', action='append', help="Hex frame ID the log must contain (repeatable)")
+    query_parser.add_argument('--where', action='append', default=[],
+                              help="Signal condition such as 'Battery_Current>100' (repeatable, all must hold)")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for csv_file_path in args.csv_files:
+            zonemap = summarize_log(csv_file_path, args.dbc)
+            print(f"{csv_file_path}: {zonemap['frames']} frames, {zonemap['start']} - {zonemap['end']}, "
+                  f"{len(zonemap['frame_ids'])} frame ID(s)")
+    else:
+        matches, checked = prune_logs(args.directory, args.start, args.end, args.frame_id, args.where)
+        for match in matches:
+            print(f"{match['output'] or match['source']} ({match['start']} - {match['end']})")
+        print(f"{len(matches)} of {checked} log(s) selected, {checked - len(matches)} pruned")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import pandas as pd
 import os
 from tkinter import Tk, filedialog
 import matplotlib.pyplot as plt
+from can_rollup import available_rollup_levels, choose_rollup_level, read_rollup
 
 # Hide the main Tkinter window
 root = Tk()
@@ -16,13 +17,30 @@ excel_file_paths = filedialog.askopenfilenames(title="Select Excel Files", filet
 if not excel_file_paths:
     raise FileNotFoundError("No Excel files selected")
 
+# Use the rollups written by newaltered.py when every file has them and the time span is long enough
+rollup_level = None
+rollup_levels = [available_rollup_levels(os.path.splitext(path)[0]) for path in excel_file_paths]
+if all(rollup_levels):
+    # The coarsest level is tiny, so reading it to measure the span costs almost nothing
+    coarsest_times = pd.concat([read_rollup(os.path.splitext(path)[0], levels[-1])['Time']
+                                for path, levels in zip(excel_file_paths, rollup_levels)])
+    span_ns = (coarsest_times.max() - coarsest_times.min()).value
+    rollup_level = choose_rollup_level(span_ns)
+    if rollup_level is not None and all(rollup_level in levels for levels in rollup_levels):
+        print(f"Plotting the {rollup_level} rollup level instead of the raw data")
+    else:
+        rollup_level = None
+
 # Initialize an empty list to store DataFrames from each Excel file
 dfs = []
 
-# Read each Excel file into a DataFrame and append to dfs list
+# Read each Excel file (or its rollup level) into a DataFrame and append to dfs list
 for excel_file_path in excel_file_paths:
     try:
-        df = pd.read_excel(excel_file_path)
+        if rollup_level is not None:
+            df = read_rollup(os.path.splitext(excel_file_path)[0], rollup_level)
+        else:
+            df = pd.read_excel(excel_file_path)
         # Convert all columns to numeric (if possible) to ensure numerical values
         df = df.apply(pd.to_numeric, errors='ignore')
         dfs.append(df)
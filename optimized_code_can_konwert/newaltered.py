@@ -1,7 +1,20 @@
+import numpy as np
 import pandas as pd
 import cantools
 import os
 from tkinter import Tk, filedialog
+from can_timestamps import NS_PER_SECOND, logger_timestamps_ns, format_time_of_day
+from can_rollup import RollupPyramid, write_rollups
+from can_excel import write_excel_streaming
+from can_decode import (dbc_prefixes, build_prefixed_routing_table, prefixed_signal_names, decode_prefixed,
+                        frame_ids_from_text)
+from can_ingest import DECODE_COLUMNS, read_logger_csv
+from can_zonemap import ZoneMapBuilder, write_zonemap
+from can_memory import ChunkScheduler, write_run_report
+from can_busstats import BusStatsAccumulator, dbc_frame_info, frame_lengths, write_busstats
+from can_dbc_catalog import DEFAULT_DBC_DIRECTORY, build_catalog
+from can_pipeline import (DEFAULT_DECODE_WORKERS, StagedPipeline, pipeline_chunks_in_flight,
+                          print_pipeline_report)
 
 # Define the corrected data where each list has the same length
 data = {
@@ -19,112 +32,204 @@ df_static = pd.DataFrame(data)
 # Remove empty strings from the DataFrame
 df_static = df_static.apply(lambda x: x.mask(x == '').fillna('null'))
 
+# Write the multi-resolution rollup pyramid next to each Excel output for long-range charting
+emit_rollups = True
+
+# Memory the chunks being read and decoded may use; the rows per chunk are sized to it at runtime
+memory_budget_mb = 1024
+
+# Threads decoding chunks while the next chunk is read and the previous file is written
+decode_workers = DEFAULT_DECODE_WORKERS
+
+# DBC library the two DBCs are suggested from when it is reachable (catalog cached in the directory): the first DBC
+# must define the motor signals and the second the battery signals of the output. The dialogs open on the suggested
+# file, so it is confirmed or replaced; without a suggestion they open as usual
+dbc_directory = DEFAULT_DBC_DIRECTORY
+first_dbc_signals = ['MC_MOTOR_SPEED', 'MC_PH_CURR', 'MC_STATUS_REGEN', 'MC_STATUS_REVERSE', 'MC_STATUS_FWD',
+                     'MC_STATUS_BRK', 'MC_MOTOR_TEMP', 'MC_DC_VOLT']
+second_dbc_signals = ['Battery_Voltage', 'Battery_Current', 'State_of_Charge', 'State_of_Health',
+                      'Availablecapacity', 'Fault', 'Warning']
+
 # Hide the main Tkinter window
 root = Tk()
 root.withdraw()
 
 # Show a dialog to select multiple CSV files
-csv_file_paths = filedialog.askopenfilenames(title="Select CSV Files", filetypes=[("CSV files", "*.csv")])
+csv_file_paths = filedialog.askopenfilenames(title="Select CSV Files", filetypes=[("CSV files", "*.csv *.csv.gz *.csv.zst *.csv.xz"),
+                                                                                  ("CAN traces", "*.blf *.asc *.trc")])
 if not csv_file_paths:
     raise FileNotFoundError("No CSV files selected")
 
-# Show a dialog to select the first DBC file
-dbc_file_path_1 = filedialog.askopenfilename(title="Select the First DBC File", filetypes=[("DBC files", "*.dbc")])
-if not dbc_file_path_1:
-    raise FileNotFoundError("No DBC file selected")
+# Catalog of the DBC library, built once for both picks (None when the library is not reachable)
+dbc_catalog = build_catalog(dbc_directory) if dbc_directory and os.path.isdir(dbc_directory) else None
+
+# Function to find the one DBC of the library that defines all the given signals; None when the library is not
+# reachable or no single DBC has them
+def library_dbc(signals):
+    if dbc_catalog is None:
+        return None
+    dbc_files, missing = dbc_catalog.select_for_signals(signals)
+    if missing or len(dbc_files) != 1:
+        print(f"No single DBC in {dbc_directory} defines {signals}, asking for the file")
+        return None
+    print(f"Suggesting {dbc_files[0]} from the DBC library")
+    return dbc_catalog.path(dbc_files[0])
 
-# Show a dialog to select the second DBC file
-dbc_file_path_2 = filedialog.askopenfilename(title="Select the Second DBC File", filetypes=[("DBC files", "*.dbc")])
-if not dbc_file_path_2:
-    raise FileNotFoundError("No DBC file selected")
+# Function to show a DBC file dialog, opened on the library's suggestion when there is one
+def ask_dbc_file(title, suggested_path=None):
+    if suggested_path is not None:
+        title = f"{title} (library suggests {os.path.basename(suggested_path)})"
+        options = {'initialdir': os.path.dirname(suggested_path), 'initialfile': os.path.basename(suggested_path)}
+    else:
+        options = {}
+    dbc_file_path = filedialog.askopenfilename(title=title, filetypes=[("DBC files", "*.dbc")], **options)
+    if not dbc_file_path:
+        raise FileNotFoundError("No DBC file selected")
+    return dbc_file_path
+
+# Show a dialog to select the first DBC, opened on the library's suggestion
+dbc_file_path_1 = ask_dbc_file("Select the First DBC File", library_dbc(first_dbc_signals))
+
+# Show a dialog to select the second DBC, opened on the library's suggestion
+dbc_file_path_2 = ask_dbc_file("Select the Second DBC File", library_dbc(second_dbc_signals))
 
 # Load the DBC files
 db1 = cantools.database.load_file(dbc_file_path_1)
 db2 = cantools.database.load_file(dbc_file_path_2)
 
-# Function to decode CAN message using cantools
-def decode_can_message(row, db):
-    try:
-        message_id = int(row['Frame ID'], 16)
-        if message_id in [msg.frame_id for msg in db.messages]:
-            message = db.get_message_by_frame_id(message_id)
-            data = bytes.fromhex(row['Data'].replace(' ', ''))
-            decoded = message.decode(data)
-            return decoded
-        else:
-            return {}
-    except ValueError as ve:
-        print(f"ValueError: {ve}, row: {row}")
-        return {}
-    except KeyError as ke:
-        print(f"KeyError: {ke}, row: {row}")
-        return {}
-    except Exception as e:
-        print(f"Error decoding row {row.get('Frame ID', 'Unknown')} : {e}, row: {row}")
-        return {}
-
-# Function to extract a representative time from each second with data frames
-def extract_representative_time(df):
-    df['Time'] = pd.to_datetime(df['Time'], format='%H:%M:%S.%f')
-    df['second'] = df['Time'].dt.floor('S')
-    times_per_second = df.groupby('second')['Time'].first().reset_index(drop=True)
-    times_per_second = times_per_second.dt.strftime('%H:%M:%S.%f').str[:-3]  # Format as HH:MM:SS.sss
-    return times_per_second
+# Frame IDs defined by both DBCs are decoded into the dbc1_ and the dbc2_ columns ('first', 'last' or 'error'
+# keep only one DBC's message or refuse the combination)
+dbc_conflict_rule = 'all'
+
+# Merge both DBCs into one routing table with dbc1_ / dbc2_ column prefixes
+prefixes = dbc_prefixes(2)
+routing_table = build_prefixed_routing_table([db1, db2], prefixes, dbc_conflict_rule)
 
-# Aggregate decoded data into a single dictionary for each row
-def aggregate_decoded_data(row):
-    decoded_data_1 = decode_can_message(row, db1)
-    decoded_data_2 = decode_can_message(row, db2)
-    return decoded_data_1, decoded_data_2
+# Function to extract a representative time from each second with data frames (frame times as int64 nanoseconds,
+# corrected for midnight rollovers so the seconds stay in order)
+def extract_representative_time(frame_times):
+    _, first_rows = np.unique(frame_times // NS_PER_SECOND, return_index=True)
+    times_per_second = pd.Series(format_time_of_day(frame_times[first_rows]))  # Format as HH:MM:SS.sss
+    return times_per_second
 
-# Function to calculate average values per second
-def calculate_average_values(df, column_prefix):
+# Function to calculate average values per second (columns carry their dbc1_ / dbc2_ prefix)
+def calculate_average_values(df):
     df_numeric = df.apply(pd.to_numeric, errors='coerce')
+    max_columns = [prefix + name for prefix in prefixes for name in ['Battery_Current', 'Battery_Voltage']]
     df_resampled = df_numeric.groupby(df.index // 1000).agg({
-        col: 'mean' if col not in ['Battery_Current', 'Battery_Voltage'] else 'max' for col in df_numeric.columns
+        col: 'mean' if col not in max_columns else 'max' for col in df_numeric.columns
     })  # Assuming each second has 1000 records
-    df_resampled.columns = [f"{column_prefix}_{col}" for col in df_resampled.columns]
     return df_resampled
 
-# Process each selected CSV file
-for csv_file_path in csv_file_paths:
-    # Read the CSV file and skip the first two rows which seem to contain metadata
-    df_csv = pd.read_csv(csv_file_path, delimiter=';', skiprows=2)
+# Function to calculate additional columns
+def calculate_additional_columns(df):
+    df['dbc1_MC_PH_CURR'] = pd.to_numeric(df['dbc1_MC_PH_CURR'], errors='coerce')
+    df['dbc1_MC_MOTOR_SPEED'] = pd.to_numeric(df['dbc1_MC_MOTOR_SPEED'], errors='coerce')
+    df.loc[:, 'motor_current'] = df['dbc1_MC_PH_CURR'] * 0.866  # Convert phase current to DC current
+    df.loc[:, 'vehicle_speed'] = df['dbc1_MC_MOTOR_SPEED'] * 0.012551909  # Convert motor speed to vehicle speed
+    return df
+
+# Function to read the chunks of every selected file in turn, sized to the memory budget (the reader thread of the
+# pipeline); only the timestamp, frame ID and payload columns are read, and the frame times are parsed here since
+# the midnight rollover needs the chunks in order. An item without a chunk ends every file.
+def read_logs():
+    for csv_file_path in csv_file_paths:
+        chunk_scheduler = ChunkScheduler(memory_budget_mb * 2**20,
+                                         signal_count=len(prefixed_signal_names(routing_table, prefixes)),
+                                         chunks_in_flight=pipeline_chunks_in_flight(decode_workers))
+        previous_ns = None
+        for df_csv in read_logger_csv(csv_file_path, chunksize=chunk_scheduler, columns=DECODE_COLUMNS,
+                                      payload_arrays=True):
+            # Check if necessary columns are present (traces bring their payload bytes and 'Length' instead of 'Data')
+            if 'Frame ID' not in df_csv.columns or 'Data' not in df_csv.columns and 'Length' not in df_csv.columns:
+                print("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+                print("Current columns in the CSV file:", df_csv.columns)
+                raise KeyError("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+            frame_times_ns = logger_timestamps_ns(df_csv, previous_ns=previous_ns)
+            previous_ns = frame_times_ns[-1]
+            yield csv_file_path, chunk_scheduler, df_csv, frame_times_ns
+        yield csv_file_path, chunk_scheduler, None, None
+
+# Function to decode one chunk (the decode workers of the pipeline); only the frame times, frame IDs, payload
+# lengths and decoded signals are passed on
+def decode_chunk(item):
+    csv_file_path, chunk_scheduler, df_csv, frame_times_ns = item
+    if df_csv is None:
+        return csv_file_path, chunk_scheduler, None
+    # Decode every frame once against both DBC files, it is used for the averages and the rollups
+    decoded_df = decode_prefixed(df_csv, routing_table, prefixes)
+    chunk_scheduler.observe(df_csv, decoded_df)
+    return csv_file_path, chunk_scheduler, (decoded_df, frame_times_ns, frame_ids_from_text(df_csv['Frame ID']),
+                                            frame_lengths(df_csv))
 
-    # Manually rename the columns based on their positions
-    df_csv.columns = ['Index', 'Timestamp', 'Time', 'Type', 'Frame ID', 'Length', 'Data']
+# Summaries of the file being written, updated by write_chunk
+log_parts = {}
 
-    # Check if necessary columns are present
-    if 'Frame ID' not in df_csv.columns or 'Data' not in df_csv.columns:
-        print("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
-        print("Current columns in the CSV file:", df_csv.columns)
-        raise KeyError("The required 'Frame ID' or 'Data' columns are missing in the CSV file.")
+# Function to add the rows of one decoded chunk to the per-second averages of its file: the seconds complete so far
+# (1000 rows each, see calculate_average_values) are aggregated now, the rows of the unfinished second wait for the
+# next chunk; without a chunk, what is left at the end of the file is aggregated
+def add_average_values(parts, decoded_df=None):
+    if decoded_df is None:
+        pending = parts['pending_rows']
+        complete = len(pending)
+    else:
+        pending = pd.concat([parts['pending_rows'], decoded_df.reset_index(drop=True)], ignore_index=True)
+        complete = (parts['first_row'] + len(pending)) // 1000 * 1000 - parts['first_row']
+    if complete > 0:
+        # Rows are numbered from the start of the file, so the groups are the seconds of the whole file
+        rows = pending.iloc[:complete].set_axis(pd.RangeIndex(parts['first_row'], parts['first_row'] + complete))
+        parts['averages'].append(calculate_average_values(rows))
+    parts['pending_rows'] = pending.iloc[complete:]
+    parts['first_row'] += complete
 
-    # Apply the aggregation function to each row in the CSV file
-    df_csv[['Aggregated Data_1', 'Aggregated Data_2']] = df_csv.apply(lambda x: pd.Series(aggregate_decoded_data(x)), axis=1)
+# Function to fold the decoded chunks of a file, in order, into its per-second averages, second times, zone map,
+# bus statistics and rollups, dropping each chunk afterwards, and to write its outputs after the last one (the
+# writer thread of the pipeline), while the next file is already being read and decoded
+def write_chunk(result):
+    csv_file_path, chunk_scheduler, decoded = result
+    if csv_file_path not in log_parts:
+        # Bus health (per-ID rate, period, gaps, dropped frames against the DBC cycle times, bus load) from the
+        # same chunks, and the rollup pyramid updated chunk by chunk during the decode pass
+        log_parts[csv_file_path] = {'frames': 0, 'pending_rows': None, 'first_row': 0, 'averages': [],
+                                    'second_times': [], 'zonemap': ZoneMapBuilder(),
+                                    'bus_stats': BusStatsAccumulator(dbc_frame_info([db1, db2])),
+                                    'rollups': RollupPyramid() if emit_rollups else None}
+    parts = log_parts[csv_file_path]
+    if decoded is not None:
+        decoded_df, frame_times_ns, frame_ids, lengths = decoded
+        parts['frames'] += len(decoded_df)
+        add_average_values(parts, decoded_df)
+        # Time of the first frame of every second of the chunk; the first of every second of the file among them
+        # is its representative time
+        _, first_rows = np.unique(frame_times_ns // NS_PER_SECOND, return_index=True)
+        parts['second_times'].append(frame_times_ns[first_rows])
+        parts['zonemap'].update(frame_times_ns, frame_ids, decoded_df)
+        parts['bus_stats'].update(frame_times_ns, frame_ids, lengths)
+        if parts['rollups'] is not None:
+            # Roll the raw-resolution decoded frames up into 1 s / 10 s / 1 min / 10 min levels
+            parts['rollups'].update(frame_times_ns,
+                                    calculate_additional_columns(decoded_df.apply(pd.to_numeric, errors='coerce')))
+        return
+    del log_parts[csv_file_path]
+    write_log_output(csv_file_path, parts, chunk_scheduler)
 
-    # Calculate average values per second for each DBC file's aggregated data
-    df_avg_1 = calculate_average_values(pd.json_normalize(df_csv['Aggregated Data_1']), 'dbc1')
-    df_avg_2 = calculate_average_values(pd.json_normalize(df_csv['Aggregated Data_2']), 'dbc2')
+# Function to finish the summaries of one file and write its Excel output, sidecars and rollups
+def write_log_output(csv_file_path, parts, chunk_scheduler):
+    if not parts['frames']:
+        raise ValueError(f"No frames in {csv_file_path}")
+    bus_stats = parts['bus_stats']
 
-    # Combine the average dataframes into a single row
-    df_combined_avg = pd.concat([df_avg_1, df_avg_2], axis=1).fillna('null')
+    # Average values per second over the signals of both DBC files, with the last (partial) second
+    add_average_values(parts)
+    df_combined_avg = pd.concat(parts['averages'])
 
     # Ensure the length of times_per_second matches df_combined_avg
-    times_per_second = extract_representative_time(df_csv)
+    times_per_second = extract_representative_time(np.concatenate(parts['second_times']))
     times_per_second = times_per_second[:len(df_combined_avg)]
 
     # Assign the representative time to each second's aggregated data
     df_combined_avg['Time'] = times_per_second.values
 
-    # Function to calculate additional columns
-    def calculate_additional_columns(df):
-        df['dbc1_MC_PH_CURR'] = pd.to_numeric(df['dbc1_MC_PH_CURR'], errors='coerce')
-        df['dbc1_MC_MOTOR_SPEED'] = pd.to_numeric(df['dbc1_MC_MOTOR_SPEED'], errors='coerce')
-        df.loc[:, 'motor_current'] = df['dbc1_MC_PH_CURR'] * 0.866  # Convert phase current to DC current
-        df.loc[:, 'vehicle_speed'] = df['dbc1_MC_MOTOR_SPEED'] * 0.012551909  # Convert motor speed to vehicle speed
-        return df
-
     # Apply the additional column calculations
     df_combined_avg = calculate_additional_columns(df_combined_avg)
 
@@ -141,8 +246,8 @@ for csv_file_path in csv_file_paths:
         'Time'
     ]
 
-    # Ensure all columns are aligned and reorder
-    df_combined_final = df_combined_final.reindex(columns=columns_to_keep, fill_value='null')
+    # Ensure all columns are aligned and reorder; missing values stay empty numeric cells in Excel
+    df_combined_final = df_combined_final.reindex(columns=columns_to_keep)
 
     # Extract the base name of the CSV file
     csv_base_name = os.path.basename(csv_file_path).split('.')[0]
@@ -156,8 +261,28 @@ for csv_file_path in csv_file_paths:
     # Combine the directory path and the file name
     output_excel_file_path = os.path.join(output_directory, output_file_name)
 
-    # Save the selected data to a new Excel file
-    df_combined_final.to_excel(output_excel_file_path, index=False)
+    # Stream the selected data to a new Excel file
+    write_excel_streaming(df_combined_final, output_excel_file_path)
+
+    # Write the zone-map sidecar of the raw frames so later queries can skip this log unopened
+    write_zonemap(parts['zonemap'].finish(csv_file_path, output_excel_file_path),
+                  os.path.splitext(output_excel_file_path)[0])
+
+    # Record the chosen chunk sizes, footprints and throughput of the run
+    write_run_report(chunk_scheduler.report(), os.path.splitext(output_excel_file_path)[0])
+
+    # Write the bus health report of the log
+    write_busstats(*bus_stats.finish(), os.path.splitext(output_excel_file_path)[0])
 
     # Display the combined dataframe
     print(f"Data for {csv_base_name} saved to: {output_excel_file_path}")
+
+    # Write the rollup levels built during the decode pass
+    if parts['rollups'] is not None:
+        write_rollups(parts['rollups'].finish(), os.path.splitext(output_excel_file_path)[0])
+        print(f"Rollups for {csv_base_name} saved next to: {output_excel_file_path}")
+
+# Process the selected CSV files in a pipeline: the next chunk (or file) is read while the current one decodes and
+# the previous file is written; the stage utilization shows which of them bounds the run
+pipeline_report = StagedPipeline(decode_chunk, write_chunk, decode_workers).run(read_logs())
+print_pipeline_report(pipeline_report)